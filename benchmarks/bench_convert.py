@@ -0,0 +1,62 @@
+"""长多模态历史的消息转换基准测试
+
+模拟一个每轮都带图片的会话，逐轮调用 _convert_messages，
+对比缓存转换结果（当前行为）和每轮全部重新转换（缓存之前的行为）。
+
+用法: python benchmarks/bench_convert.py [--turns 200] [--image-kb 200]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schat.core.message import Message
+from schat.models.openai import OpenAIModel
+from schat.models.anthropic import AnthropicModel
+
+
+def run(model, image_path: str, turns: int, memoized: bool) -> tuple:
+    """返回 (总耗时秒, 最后一轮耗时毫秒)"""
+    history = []
+    total = 0.0
+    last = 0.0
+    for i in range(turns):
+        history.append(Message(role="user", text=f"turn {i}: what is in this image?", files=[image_path]))
+        if not memoized:
+            for msg in history:
+                msg.invalidate()
+        start = time.perf_counter()
+        model._convert_messages(history)
+        last = time.perf_counter() - start
+        total += last
+        history.append(Message(role="assistant", text=f"answer {i}"))
+    return total, last * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--image-kb", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+        f.write(os.urandom(args.image_kb * 1024))
+        image_path = f.name
+
+    try:
+        print(f"{args.turns} turns, one {args.image_kb}KB image per turn")
+        print(f"{'model':<16} {'mode':<10} {'total s':>9} {'last turn ms':>13}")
+        for model in (OpenAIModel(), AnthropicModel()):
+            for memoized in (False, True):
+                total, last = run(model, image_path, args.turns, memoized)
+                mode = "memoized" if memoized else "full"
+                print(f"{model.__class__.__name__:<16} {mode:<10} {total:>9.3f} {last:>13.3f}")
+    finally:
+        os.unlink(image_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""import 耗时基准测试
+
+用 `python -X importtime` 分别测量:
+- lazy:  import schat（不加载任何provider SDK）
+- eager: import schat 并导入全部模型类（等价于延迟加载之前的行为）
+- one provider: import schat 后只解析一个provider
+
+用法: python benchmarks/bench_import.py [--runs 5]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CASES = {
+    "lazy": "import schat",
+    "eager": (
+        "import schat; "
+        "from schat.models import OpenAIModel, AnthropicModel, GoogleModel, OpenRouterModel"
+    ),
+    "one provider": (
+        "import schat; "
+        "schat.ModelFactory._provider_manager.get_provider_config('openai')"
+    ),
+}
+
+SDK_MODULES = ("openai", "anthropic", "google.generativeai")
+
+
+def measure(code: str) -> tuple:
+    """运行一次并返回 (总耗时us, 已加载的SDK列表)"""
+    probe = code + "; import sys; print(','.join(m for m in %r if m in sys.modules))" % (SDK_MODULES,)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", probe],
+        capture_output=True, text=True, cwd=ROOT, check=True
+    )
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        try:
+            cumulative = int(parts[1])
+        except ValueError:
+            continue
+        # 只累加顶层模块（没有缩进的）
+        if not parts[2].startswith("  "):
+            total += cumulative
+    loaded = [m for m in result.stdout.strip().split(",") if m]
+    return total, loaded
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'case':<14} {'median ms':>10} {'min ms':>10}  sdk loaded")
+    for name, code in CASES.items():
+        samples = []
+        loaded = []
+        for _ in range(args.runs):
+            total, loaded = measure(code)
+            samples.append(total / 1000)
+        print(f"{name:<14} {statistics.median(samples):>10.1f} {min(samples):>10.1f}  {', '.join(loaded) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Message 内存占用和构造速度基准测试
+
+对比使用 __slots__ 的 Message（当前实现）和原来基于 __dict__、
+每条消息都分配空 files / tool_calls 列表的实现。
+文本从一个小的字符串池中选取，结果只反映消息对象本身的开销。
+
+用法: python benchmarks/bench_message.py [--messages 1000000]
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schat.core.message import Message
+
+TEXTS = [f"message text {i}" for i in range(64)]
+ROLES = ["user", "assistant"]
+
+
+class DictMessage:
+    """原来的实现：每个实例有 __dict__，并分配空列表"""
+
+    def __init__(self, role, text=None, priority=1.0, files=None, timestamp=None,
+                 tool_calls=None, tool_call_id=None, name=None, content=None):
+        self.role = role
+        self.text = text
+        self.priority = priority
+        self.files = files or []
+        self.timestamp = timestamp if timestamp is not None else time.time()
+        self.tool_calls = tool_calls or []
+        self.tool_call_id = tool_call_id
+        self.name = name
+        self.content = content
+
+    def __setattr__(self, name, value):
+        converted = self.__dict__.get("_converted")
+        if converted:
+            converted.clear()
+        object.__setattr__(self, name, value)
+
+
+def build(cls, n: int):
+    # role 使用运行时拼接的新字符串，模拟从JSON或网络读取的情况
+    return [cls(role="".join(ROLES[i % 2]), text=TEXTS[i % 64]) for i in range(n)]
+
+
+def measure_memory(cls, n: int) -> float:
+    """返回每条消息占用的字节数"""
+    gc.collect()
+    tracemalloc.start()
+    messages = build(cls, n)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del messages
+    return current / n
+
+
+def measure_speed(cls, n: int, repeat: int = 3) -> float:
+    """返回构造一条消息的纳秒数（取多次中的最小值）"""
+    best = float("inf")
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        messages = build(cls, n)
+        best = min(best, time.perf_counter() - start)
+        del messages
+    return best / n * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    print(f"{args.messages} messages")
+    print(f"{'implementation':<16} {'bytes/msg':>10} {'ns/msg':>9}")
+    for name, cls in (("dict", DictMessage), ("slots", Message)):
+        memory = measure_memory(cls, args.messages)
+        speed = measure_speed(cls, min(args.messages, 200_000))
+        print(f"{name:<16} {memory:>10.1f} {speed:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
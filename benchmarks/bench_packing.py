@@ -0,0 +1,73 @@
+"""历史选择策略基准测试
+
+在一个长会话上对比按最近消息截断（truncate_history 的行为）和按优先级打包：
+发送的token数、保留的优先级总和，以及选择耗时。
+
+用法: python benchmarks/bench_packing.py [--messages 10000] [--budget 8000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schat.core.message import Message
+from schat.core.packing import pack_history
+from schat.core.tokenizer import HeuristicTokenizer, select_recent_within_budget
+
+
+def make_history(n: int, seed: int = 0):
+    rng = random.Random(seed)
+    messages = []
+    for i in range(n // 2):
+        # 少数轮次被标记为重要
+        priority = 5.0 if rng.random() < 0.05 else 1.0
+        messages.append(Message(role="user", text="q " * rng.randint(5, 200), priority=priority))
+        messages.append(Message(role="assistant", text="a " * rng.randint(20, 800), priority=priority))
+    messages.append(Message(role="user", text="latest question"))
+    return messages
+
+
+def truncate_recent(messages, n_rounds):
+    """ChatSession.truncate_history 的行为：只保留最近n轮"""
+    return messages[-(n_rounds * 2 + 1):]
+
+
+def report(name, selected, tokenizer, elapsed):
+    tokens = sum(tokenizer.count_message(m) for m in selected)
+    priority = sum(m.priority for m in selected)
+    print(f"{name:<22} {len(selected):>8} {tokens:>9} {priority:>10.1f} {elapsed * 1000:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--budget", type=int, default=8000)
+    args = parser.parse_args()
+
+    tokenizer = HeuristicTokenizer()
+    messages = make_history(args.messages)
+    # 预热token计数缓存，测量的是每轮的选择开销
+    for msg in messages:
+        tokenizer.count_message(msg)
+
+    print(f"{args.messages} messages, budget {args.budget} tokens")
+    print(f"{'strategy':<22} {'messages':>8} {'tokens':>9} {'priority':>10} {'time ms':>9}")
+
+    start = time.perf_counter()
+    selected = truncate_recent(messages, 20)
+    report("truncate_history(20)", selected, tokenizer, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    selected = select_recent_within_budget(messages, args.budget, tokenizer)
+    report("recent within budget", selected, tokenizer, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    selected = pack_history(messages, args.budget, tokenizer)
+    report("priority packing", selected, tokenizer, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
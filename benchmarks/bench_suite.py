@@ -0,0 +1,352 @@
+"""热点路径微基准测试套件
+
+覆盖每轮请求都会经过的代码：各provider的 _convert_messages（10/1k/10k条消息，
+纯文本和带附件，冷转换和命中转换缓存）、add_cache_to_messages、APIKeyManager.get_key
+（1个和500个密钥）、ChatSession._get_history、大会话的 save/load 以及工具定义转换。
+
+run 把每个用例的单次耗时（多次采样的中位数、最小值等）连同git提交写入JSON，
+compare 对比两个结果文件，单次耗时增加超过阈值的用例标记为回归并以非零状态退出，
+可以在CI中对比基线和当前提交。
+
+用法: python benchmarks/bench_suite.py run [-o results.json] [-k 正则] [--repeat 5] [--min-time 0.05]
+      python benchmarks/bench_suite.py compare base.json new.json [--threshold 0.1]
+      python benchmarks/bench_suite.py list [-k 正则]
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from functools import partial
+from typing import Callable, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schat import ChatSession, Message
+from schat.core.key_manager import APIKeyManager
+from schat.models.anthropic import AnthropicModel
+from schat.models.anthropic_helper import add_cache_to_messages
+from schat.models.google import GoogleModel
+from schat.models.openai import OpenAIModel
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SIZES = (10, 1000, 10000)
+MODELS = {
+    "openai": OpenAIModel,
+    "anthropic": AnthropicModel,
+    "google": GoogleModel,
+}
+
+# 用例名: setup函数，setup完成准备工作并返回被计时的无参函数
+CASES: Dict[str, Callable[[], Callable[[], object]]] = {}
+
+_image_path: Optional[str] = None
+_workdir: Optional[str] = None
+
+
+def image_path() -> str:
+    """所有用例共用的小图片附件，进程退出时删除"""
+    global _image_path
+    if _image_path is None:
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as f:
+            f.write(os.urandom(4 * 1024))
+            _image_path = f.name
+        atexit.register(os.unlink, _image_path)
+    return _image_path
+
+
+def workdir() -> str:
+    """save/load 用例的临时目录，进程退出时删除"""
+    global _workdir
+    if _workdir is None:
+        _workdir = tempfile.mkdtemp(prefix="schat-bench-")
+        atexit.register(shutil.rmtree, _workdir, True)
+    return _workdir
+
+
+def build_history(size: int, files: bool = False) -> List[Message]:
+    """size条交替的user/assistant消息，files为True时每条user消息带一张图片"""
+    history = []
+    for i in range(size // 2):
+        history.append(Message(role="user", text=f"question {i}: " + "lorem ipsum dolor sit amet " * 8,
+                               files=[image_path()] if files else None))
+        history.append(Message(role="assistant", text=f"answer {i}: " + "consectetur adipiscing elit " * 12))
+    return history
+
+
+def build_tools(count: int) -> List[Dict]:
+    """count个OpenAI格式的工具定义，每个5个参数"""
+    return [{
+        "type": "function",
+        "function": {
+            "name": f"tool_{i}",
+            "description": f"benchmark tool {i}",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "search query"},
+                    "limit": {"type": "integer", "description": "max results"},
+                    "score": {"type": "number", "description": "min score"},
+                    "exact": {"type": "boolean", "description": "exact match"},
+                    "mode": {"type": "string", "description": "mode", "enum": ["fast", "full"]},
+                },
+                "required": ["query"],
+            },
+        },
+    } for i in range(count)]
+
+
+def convert_case(provider: str, size: int, files: bool, cached: bool):
+    model = MODELS[provider]()
+    history = build_history(size, files)
+    if cached:
+        # 会话进行中的常态：历史消息都已转换过
+        model._convert_messages(history)
+        return partial(model._convert_messages, history)
+
+    def convert():
+        for msg in history:
+            msg.invalidate()
+        return model._convert_messages(history)
+    return convert
+
+
+def cache_control_case(size: int):
+    model = AnthropicModel()
+    messages = [{"role": "system", "content": [{"type": "text", "text": "You are a helpful assistant."}]}]
+    messages += model._convert_messages(build_history(size))
+    return partial(add_cache_to_messages, messages)
+
+
+def get_key_case(keys: int):
+    provider = f"bench-suite-{keys}"
+    manager = APIKeyManager()
+    if len(manager.get_keys(provider)) != keys:
+        for i in range(keys):
+            manager.add_key(provider, f"sk-bench-{keys}-{i}")
+    return partial(manager.get_key, provider)
+
+
+def history_case(size: int, strategy: Optional[str]):
+    if strategy is None:
+        session = ChatSession()
+    else:
+        # 预算大约容纳一半的历史
+        session = ChatSession(max_history_token=size * 30, history_strategy=strategy)
+    session.set_system_prompt("You are a helpful assistant.")
+    session.history = build_history(size)
+    session._get_history()
+    return session._get_history
+
+
+def save_case(size: int):
+    session = ChatSession()
+    session.history = build_history(size)
+    return partial(session.save, os.path.join(workdir(), f"save-{size}.json"))
+
+
+def load_case(size: int):
+    path = os.path.join(workdir(), f"load-{size}.json")
+    session = ChatSession()
+    session.history = build_history(size)
+    session.save(path)
+    return partial(ChatSession().load, path)
+
+
+def tools_case(provider: str, count: int):
+    tools = build_tools(count)
+    if provider == "anthropic":
+        return partial(AnthropicModel()._convert_tools, tools)
+    return partial(GoogleModel()._convert_tool_to_function_declarations, tools)
+
+
+def _register_cases():
+    for provider in MODELS:
+        for size in SIZES:
+            # Google的附件需要上传到文件API，无法离线测试
+            for files in ((False,) if provider == "google" else (False, True)):
+                for cached in (False, True):
+                    name = "convert/{}/{}/{}/{}".format(
+                        provider, size, "files" if files else "text", "cached" if cached else "cold")
+                    CASES[name] = partial(convert_case, provider, size, files, cached)
+    for size in SIZES:
+        CASES[f"cache_control/{size}"] = partial(cache_control_case, size)
+    for keys in (1, 500):
+        CASES[f"get_key/{keys}"] = partial(get_key_case, keys)
+    for size in SIZES:
+        for strategy in (None, "recent", "priority"):
+            CASES[f"get_history/{size}/{strategy or 'all'}"] = partial(history_case, size, strategy)
+    for size in (1000, 10000):
+        CASES[f"save/{size}"] = partial(save_case, size)
+        CASES[f"load/{size}"] = partial(load_case, size)
+    for provider in ("anthropic", "google"):
+        for count in (1, 50):
+            CASES[f"tools/{provider}/{count}"] = partial(tools_case, provider, count)
+
+
+_register_cases()
+
+
+def select(pattern: Optional[str]) -> List[str]:
+    if not pattern:
+        return list(CASES)
+    regex = re.compile(pattern)
+    return [name for name in CASES if regex.search(name)]
+
+
+def time_case(setup: Callable, repeat: int, min_time: float) -> Dict:
+    """计时一个用例，返回单次调用耗时（秒）的统计
+
+    先按 1, 2, 5, 10, 20... 增加每个样本的调用次数直到样本耗时不少于 min_time，
+    再采集 repeat 个样本
+    """
+    timer = timeit.Timer(setup())
+    for number in _steps():
+        if timer.timeit(number) >= min_time:
+            break
+    samples = [timer.timeit(number) / number for _ in range(repeat)]
+    return {
+        "median": statistics.median(samples),
+        "min": min(samples),
+        "max": max(samples),
+        "stdev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "number": number,
+        "repeat": repeat,
+    }
+
+
+def _steps():
+    base = 1
+    while True:
+        for multiple in (1, 2, 5):
+            yield base * multiple
+        base *= 10
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def run(names: List[str], repeat: int = 5, min_time: float = 0.05,
+        progress: Optional[Callable[[str, Dict], None]] = None) -> Dict:
+    """运行指定的用例，返回可以写入JSON的结果"""
+    results = {}
+    for name in names:
+        results[name] = time_case(CASES[name], repeat, min_time)
+        if progress is not None:
+            progress(name, results[name])
+    return {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "results": results,
+    }
+
+
+def compare(base: Dict, new: Dict, threshold: float = 0.1, stat: str = "median") -> List[Dict]:
+    """对比两次运行的结果
+
+    Returns:
+        List[Dict]: 每个用例一行，status 为 regression（耗时增加超过 threshold）、
+            improved（减少到 1/(1+threshold) 以下）、same、added 或 removed
+    """
+    rows = []
+    base_results, new_results = base["results"], new["results"]
+    for name in list(base_results) + [n for n in new_results if n not in base_results]:
+        old = base_results.get(name)
+        current = new_results.get(name)
+        if old is None or current is None:
+            rows.append({"name": name, "base": old and old[stat], "new": current and current[stat],
+                         "ratio": None, "status": "added" if old is None else "removed"})
+            continue
+        ratio = current[stat] / old[stat] if old[stat] else float("inf")
+        if ratio > 1 + threshold:
+            status = "regression"
+        elif ratio < 1 / (1 + threshold):
+            status = "improved"
+        else:
+            status = "same"
+        rows.append({"name": name, "base": old[stat], "new": current[stat], "ratio": ratio, "status": status})
+    return rows
+
+
+def fmt_time(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "-"
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.3f} {unit}"
+    return f"{seconds / 1e-9:.1f} ns"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="运行基准测试")
+    run_parser.add_argument("-o", "--output", help="把结果写入JSON文件")
+    run_parser.add_argument("-k", "--filter", help="只运行名称匹配该正则的用例")
+    run_parser.add_argument("--repeat", type=int, default=5, help="每个用例的样本数")
+    run_parser.add_argument("--min-time", type=float, default=0.05, help="每个样本的最短耗时（秒）")
+    compare_parser = commands.add_parser("compare", help="对比两个结果文件")
+    compare_parser.add_argument("base")
+    compare_parser.add_argument("new")
+    compare_parser.add_argument("--threshold", type=float, default=0.1, help="判定为回归的相对耗时增加")
+    compare_parser.add_argument("--stat", choices=("median", "min"), default="median")
+    list_parser = commands.add_parser("list", help="列出用例")
+    list_parser.add_argument("-k", "--filter")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        print("\n".join(select(args.filter)))
+        return
+
+    if args.command == "run":
+        names = select(args.filter)
+        if not names:
+            parser.error(f"no case matches {args.filter!r}")
+        print(f"{'case':<40} {'median':>12} {'min':>12} {'stdev':>12} {'loops':>7}")
+
+        def progress(name, row):
+            print(f"{name:<40} {fmt_time(row['median']):>12} {fmt_time(row['min']):>12} "
+                  f"{fmt_time(row['stdev']):>12} {row['number']:>7}", flush=True)
+
+        data = run(names, args.repeat, args.min_time, progress)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=2)
+        return
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+    rows = compare(base, new, args.threshold, args.stat)
+    print(f"base {base.get('commit')} -> new {new.get('commit')}, {args.stat}, threshold {args.threshold:.0%}")
+    print(f"{'case':<40} {'base':>12} {'new':>12} {'ratio':>7}  status")
+    for row in rows:
+        ratio = "-" if row["ratio"] is None else f"{row['ratio']:.2f}x"
+        print(f"{row['name']:<40} {fmt_time(row['base']):>12} {fmt_time(row['new']):>12} {ratio:>7}  {row['status']}")
+    regressions = [row for row in rows if row["status"] == "regression"]
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""端到端吞吐量基准测试
+
+在子进程中启动 stub_provider.py 替身服务器，通过 ModelFactory 注册的真实
+OpenAIModel / AnthropicModel（含SDK、消息转换、密钥轮换）和 ChatSession 发送请求，
+按不同并发数报告每秒请求数、延迟的 p50/p95/p99、首个token时间（TTFT）
+以及客户端每个请求消耗的CPU时间（服务器在另一个进程中，不计入）。
+
+用法: python benchmarks/bench_throughput.py [--providers openai,anthropic] [--concurrency 1,8,32]
+                                            [--requests 200] [--stream] [--mode thread|async]
+                                            [--latency 0.05] [--token-rate 500] [--history 20]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from schat import AsyncChatSession, ChatSession, Message
+from schat.core.key_manager import APIKeyManager
+from schat.models.anthropic import AnthropicModel
+from schat.models.factory import ModelFactory
+from schat.models.openai import OpenAIModel
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_provider.py")
+PROVIDERS = {
+    # 名称: (模型类, base_url后缀, 模型名)
+    "openai": (OpenAIModel, "/v1", "gpt-4o-mini"),
+    "anthropic": (AnthropicModel, "", "claude-3-5-haiku-20241022"),
+}
+
+
+def start_stub(args) -> Tuple[subprocess.Popen, str]:
+    """在子进程中启动替身服务器，返回进程和URL"""
+    command = [sys.executable, STUB, "--port", "0",
+               "--latency", str(args.latency),
+               "--output-tokens", str(args.output_tokens),
+               "--error-rate", str(args.error_rate),
+               "--rate-limit-rate", str(args.rate_limit_rate),
+               "--retry-after", "0"]
+    if args.token_rate:
+        command += ["--token-rate", str(args.token_rate)]
+    if not args.sdk_retries:
+        command.append("--no-sdk-retries")
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline().strip()
+    if not line.startswith("listening on "):
+        process.kill()
+        raise RuntimeError(f"stub server failed to start: {line!r}")
+    return process, line[len("listening on "):]
+
+
+def register(name: str, url: str, keys: int, output_tokens: int) -> str:
+    """注册指向替身服务器的provider，返回模型字符串"""
+    model_class, suffix, model_name = PROVIDERS[name]
+    provider = f"stub-{name}"
+    ModelFactory.register_provider(provider, model_class=model_class, base_url=url + suffix,
+                                   default_params={"temperature": 0.7, "max_tokens": output_tokens,
+                                                   "stream": False})
+    manager = APIKeyManager()
+    for i in range(keys):
+        manager.add_key(provider, f"sk-stub-{name}-{i}")
+    return f"{provider}:{model_name}"
+
+
+def build_history(turns: int) -> List[Message]:
+    """每个会话共用的历史记录，模拟进行中的多轮对话"""
+    history = []
+    for i in range(turns):
+        history.append(Message(role="user", text=f"question {i}: " + "lorem ipsum dolor sit amet " * 8))
+        history.append(Message(role="assistant", text=f"answer {i}: " + "consectetur adipiscing elit " * 12))
+    return history
+
+
+def new_session(cls, model, history: List[Message]):
+    session = cls(default_model=model)
+    session.set_system_prompt("You are a helpful assistant. " * 20)
+    session.history = list(history)
+    return session
+
+
+def one_request(model, history: List[Message], stream: bool) -> Tuple[float, float]:
+    """发送一个请求，返回 (总延迟, TTFT)"""
+    session = new_session(ChatSession, model, history)
+    started = time.perf_counter()
+    response = session.send("benchmark prompt", stream=stream)
+    if not stream:
+        latency = time.perf_counter() - started
+        return latency, latency
+    ttft = None
+    for _ in response:
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    latency = time.perf_counter() - started
+    return latency, ttft if ttft is not None else latency
+
+
+async def one_arequest(model, history: List[Message], stream: bool) -> Tuple[float, float]:
+    session = new_session(AsyncChatSession, model, history)
+    started = time.perf_counter()
+    response = await session.send("benchmark prompt", stream=stream)
+    if not stream:
+        latency = time.perf_counter() - started
+        return latency, latency
+    ttft = None
+    async for _ in response:
+        if ttft is None:
+            ttft = time.perf_counter() - started
+    latency = time.perf_counter() - started
+    return latency, ttft if ttft is not None else latency
+
+
+def run_threads(model, history, stream: bool, concurrency: int, requests: int):
+    def worker(_):
+        try:
+            return one_request(model, history, stream)
+        except Exception as e:
+            return e
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        return list(pool.map(worker, range(requests)))
+
+
+def run_async(model, history, stream: bool, concurrency: int, requests: int):
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def worker():
+            async with semaphore:
+                try:
+                    return await one_arequest(model, history, stream)
+                except Exception as e:
+                    return e
+
+        return await asyncio.gather(*(worker() for _ in range(requests)))
+
+    return asyncio.run(main())
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def measure(model, history, args, concurrency: int) -> Dict:
+    run = run_async if args.mode == "async" else run_threads
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    results = run(model, history, args.stream, concurrency, args.requests)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+
+    ok = [r for r in results if not isinstance(r, Exception)]
+    errors = [r for r in results if isinstance(r, Exception)]
+    latencies = [r[0] for r in ok]
+    ttfts = [r[1] for r in ok]
+    row = {
+        "concurrency": concurrency,
+        "ok": len(ok),
+        "errors": len(errors),
+        "rps": len(ok) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "ttft_p50_ms": percentile(ttfts, 0.50),
+        "ttft_p95_ms": percentile(ttfts, 0.95),
+        "cpu_ms_per_request": cpu / len(results) * 1000 if results else None,
+    }
+    for name in ("p50_ms", "p95_ms", "p99_ms", "ttft_p50_ms", "ttft_p95_ms"):
+        if row[name] is not None:
+            row[name] *= 1000
+    if errors:
+        row["first_error"] = f"{type(errors[0]).__name__}: {errors[0]}"[:200]
+    return row
+
+
+def fmt(value) -> str:
+    return "-" if value is None else f"{value:.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--providers", default="openai,anthropic")
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=200, help="每个并发数发送的请求数")
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument("--mode", choices=("thread", "async"), default="thread")
+    parser.add_argument("--history", type=int, default=20, help="每个会话已有的对话轮数")
+    parser.add_argument("--keys", type=int, default=4, help="每个provider的API密钥数")
+    parser.add_argument("--latency", type=float, default=0.05, help="服务器首字节延迟（秒）")
+    parser.add_argument("--token-rate", type=float, default=None, help="服务器每秒输出的token数")
+    parser.add_argument("--output-tokens", type=int, default=64)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--sdk-retries", action="store_true", help="允许SDK自动重试注入的错误")
+    parser.add_argument("--json", help="把结果写入JSON文件")
+    args = parser.parse_args()
+
+    levels = [int(c) for c in args.concurrency.split(",")]
+    history = build_history(args.history)
+    process, url = start_stub(args)
+    rows = []
+    try:
+        print(f"stub {url}, mode={args.mode}, stream={args.stream}, history={args.history} turns, "
+              f"{args.requests} requests per level")
+        print(f"{'provider':<10} {'conc':>5} {'ok':>6} {'err':>5} {'rps':>8} {'p50':>8} {'p95':>8} "
+              f"{'p99':>8} {'ttft50':>8} {'ttft95':>8} {'cpu/req':>8}")
+        for name in args.providers.split(","):
+            model = ModelFactory.get_model(register(name, url, args.keys, args.output_tokens))
+            # 预热：创建客户端和连接
+            measure(model, history, argparse.Namespace(**{**vars(args), "requests": 4}), 2)
+            for concurrency in levels:
+                row = dict(provider=name, **measure(model, history, args, concurrency))
+                rows.append(row)
+                print(f"{name:<10} {concurrency:>5} {row['ok']:>6} {row['errors']:>5} {row['rps']:>8.1f} "
+                      f"{fmt(row['p50_ms']):>8} {fmt(row['p95_ms']):>8} {fmt(row['p99_ms']):>8} "
+                      f"{fmt(row['ttft_p50_ms']):>8} {fmt(row['ttft_p95_ms']):>8} "
+                      f"{fmt(row['cpu_ms_per_request']):>8}")
+                if "first_error" in row:
+                    print(f"{'':<10} first error: {row['first_error']}")
+    finally:
+        process.terminate()
+        process.wait()
+    print("latencies in ms, cpu/req is client-side CPU ms per request")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
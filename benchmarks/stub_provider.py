@@ -0,0 +1,413 @@
+"""本地provider替身服务器
+
+实现 OpenAI chat completions（POST /v1/chat/completions）和
+Anthropic messages（POST /v1/messages）的线协议，支持JSON和SSE流式响应，
+可以配置首字节延迟、输出速率、错误和429注入，用于在不访问真实provider的情况下
+通过真实的SDK和 OpenAIModel / AnthropicModel 做端到端测试和压测。
+
+只依赖标准库。可以在进程内使用 StubProvider，也可以单独运行：
+
+用法: python benchmarks/stub_provider.py [--port 8000] [--latency 0.05] [--token-rate 200]
+                                         [--output-tokens 64] [--error-rate 0] [--rate-limit-rate 0]
+
+OpenAI SDK 的 base_url 使用 http://host:port/v1，Anthropic SDK 使用 http://host:port
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def estimate_tokens(value: Any) -> int:
+    """粗略估算请求内容的token数（约4个字符一个token）"""
+    if isinstance(value, str):
+        return len(value) // 4 + 1 if value else 0
+    if isinstance(value, list):
+        return sum(estimate_tokens(item) for item in value)
+    if isinstance(value, dict):
+        if value.get("type") in ("image", "image_url"):
+            return 256
+        return sum(estimate_tokens(v) for k, v in value.items() if k in ("content", "text", "system"))
+    return 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 保持连接，和真实provider一样复用连接
+    disable_nagle_algorithm = True
+    server: "_Server"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        stub = self.server.stub
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid JSON", "type": "invalid_request_error"}})
+            return
+        if self.path.rstrip("/").endswith("/chat/completions"):
+            protocol = "openai"
+        elif self.path.rstrip("/").endswith("/messages"):
+            protocol = "anthropic"
+        else:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}", "type": "not_found"}})
+            return
+
+        key = self.headers.get("x-api-key") or (self.headers.get("Authorization") or "").replace("Bearer ", "")
+        fault = stub._begin(protocol, key)
+        if stub.latency:
+            time.sleep(stub.latency)
+        if fault is not None:
+            self._send_error(protocol, fault)
+            return
+        if protocol == "openai":
+            self._openai(body)
+        else:
+            self._anthropic(body)
+
+    # ---- 响应写入 ----
+
+    def _send_json(self, status: int, payload: Dict, headers: Optional[Dict[str, str]] = None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        self.server.stub._finish(status)
+
+    def _send_error(self, protocol: str, status: int):
+        stub = self.server.stub
+        headers = {}
+        if not stub.sdk_retries:
+            headers["x-should-retry"] = "false"
+        if status == 429:
+            headers["retry-after"] = str(stub.retry_after)
+            kind, message = ("rate_limit_error", "rate limited by stub")
+        else:
+            kind, message = ("api_error", "injected server error")
+        if protocol == "openai":
+            payload = {"error": {"message": message, "type": kind, "code": kind}}
+        else:
+            payload = {"type": "error", "error": {"type": kind, "message": message}}
+        self._send_json(status, payload, headers)
+
+    def _stream(self, events: Iterator[bytes]):
+        """以chunked编码写出SSE事件，按 token_rate 控制输出速度"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for event in events:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(event), event))
+        self.wfile.write(b"0\r\n\r\n")
+        self.server.stub._finish(200)
+
+    def _pace(self, index: int, started: float):
+        rate = self.server.stub.token_rate
+        if rate:
+            delay = started + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    # ---- OpenAI ----
+
+    def _openai(self, body: Dict):
+        stub = self.server.stub
+        model = body.get("model", "stub")
+        prompt_tokens = estimate_tokens(body.get("messages", []))
+        pieces = stub.output_pieces(body.get("max_tokens"))
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(pieces),
+            "total_tokens": prompt_tokens + len(pieces),
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        completion_id = f"chatcmpl-stub-{stub.next_id()}"
+        created = int(time.time())
+        if not body.get("stream"):
+            self._pace(len(pieces), time.perf_counter())
+            self._send_json(200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(pieces)},
+                    "finish_reason": "stop",
+                }],
+                "usage": usage,
+            })
+            return
+        include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+        def chunk(delta: Dict, finish_reason: Optional[str] = None) -> bytes:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+            return b"data: " + json.dumps(payload).encode("utf-8") + b"\n\n"
+
+        def events():
+            started = time.perf_counter()
+            yield chunk({"role": "assistant", "content": ""})
+            for index, piece in enumerate(pieces):
+                self._pace(index, started)
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            if include_usage:
+                yield b"data: " + json.dumps({
+                    "id": completion_id, "object": "chat.completion.chunk", "created": created,
+                    "model": model, "choices": [], "usage": usage,
+                }).encode("utf-8") + b"\n\n"
+            yield b"data: [DONE]\n\n"
+
+        self._stream(events())
+
+    # ---- Anthropic ----
+
+    def _anthropic(self, body: Dict):
+        stub = self.server.stub
+        model = body.get("model", "stub")
+        messages = body.get("messages", [])
+        input_tokens = estimate_tokens(messages) + estimate_tokens(body.get("system"))
+        cache_read, cache_write = stub.prompt_cache(messages)
+        pieces = stub.output_pieces(body.get("max_tokens"))
+        usage = {
+            "input_tokens": max(0, input_tokens - cache_read - cache_write),
+            "output_tokens": len(pieces),
+            "cache_creation_input_tokens": cache_write,
+            "cache_read_input_tokens": cache_read,
+        }
+        message_id = f"msg_stub_{stub.next_id()}"
+        message = {
+            "id": message_id,
+            "type": "message",
+            "role": "assistant",
+            "model": model,
+            "content": [{"type": "text", "text": "".join(pieces)}],
+            "stop_reason": "end_turn",
+            "stop_sequence": None,
+            "usage": usage,
+        }
+        if not body.get("stream"):
+            self._pace(len(pieces), time.perf_counter())
+            self._send_json(200, message)
+            return
+
+        def event(name: str, payload: Dict) -> bytes:
+            return b"event: " + name.encode() + b"\ndata: " + json.dumps(payload).encode("utf-8") + b"\n\n"
+
+        def events():
+            started = time.perf_counter()
+            yield event("message_start", {"type": "message_start", "message": dict(
+                message, content=[], stop_reason=None, usage=dict(usage, output_tokens=1))})
+            yield event("content_block_start", {"type": "content_block_start", "index": 0,
+                                                "content_block": {"type": "text", "text": ""}})
+            for index, piece in enumerate(pieces):
+                self._pace(index, started)
+                yield event("content_block_delta", {"type": "content_block_delta", "index": 0,
+                                                    "delta": {"type": "text_delta", "text": piece}})
+            yield event("content_block_stop", {"type": "content_block_stop", "index": 0})
+            yield event("message_delta", {"type": "message_delta",
+                                          "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                          "usage": {"output_tokens": len(pieces)}})
+            yield event("message_stop", {"type": "message_stop"})
+
+        self._stream(events())
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # 高并发压测时默认的5会导致连接被拒绝
+    stub: "StubProvider"
+
+
+class StubProvider:
+    """provider替身服务器
+
+    属性在运行中可以直接修改，对之后的请求生效。
+    """
+
+    def __init__(self,
+                 host: str = "127.0.0.1",
+                 port: int = 0,
+                 latency: float = 0.0,
+                 token_rate: Optional[float] = None,
+                 output_tokens: int = 32,
+                 error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0,
+                 retry_after: float = 1.0,
+                 sdk_retries: bool = True,
+                 seed: Optional[int] = None):
+        """
+        Args:
+            host, port: 监听地址，port 为0时自动选择
+            latency: 返回响应头前的延迟（秒），即最快的首字节时间
+            token_rate: 每秒输出的token数，None 表示不限速
+            output_tokens: 每个回复的token数（不超过请求的 max_tokens）
+            error_rate: 返回500的概率
+            rate_limit_rate: 返回429的概率
+            retry_after: 429响应的 Retry-After（秒）
+            sdk_retries: 为False时错误响应带 x-should-retry: false，SDK不再自动重试
+            seed: 错误注入的随机种子
+        """
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.token_rate = token_rate
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.sdk_retries = sdk_retries
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._ids = 0
+        self._cached_prefixes = set()
+        self._server: Optional[_Server] = None
+        self._thread: Optional[threading.Thread] = None
+        self.reset_stats()
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.url}/v1"
+
+    @property
+    def anthropic_base_url(self) -> str:
+        return self.url
+
+    def _bind(self) -> _Server:
+        server = _Server((self.host, self.port), _Handler)
+        server.stub = self
+        self.port = server.server_address[1]
+        self._server = server
+        return server
+
+    def start(self) -> "StubProvider":
+        """在后台线程中启动服务器"""
+        server = self._bind()
+        # 缩短轮询间隔，使 stop() 能很快返回
+        self._thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "StubProvider":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    # ---- 供处理线程调用 ----
+
+    def next_id(self) -> int:
+        with self._lock:
+            self._ids += 1
+            return self._ids
+
+    def output_pieces(self, max_tokens: Optional[int]) -> List[str]:
+        count = self.output_tokens if not max_tokens else min(self.output_tokens, max_tokens)
+        return [f" tok{i}" for i in range(count)]
+
+    def prompt_cache(self, messages: List[Dict]) -> Tuple[int, int]:
+        """模拟Anthropic的提示缓存：最后一个 cache_control 之前的前缀第一次出现时写入，之后读取"""
+        last = -1
+        for index, msg in enumerate(messages):
+            content = msg.get("content")
+            if isinstance(content, list) and any(isinstance(b, dict) and "cache_control" in b for b in content):
+                last = index
+        if last < 0:
+            return 0, 0
+        prefix = messages[:last + 1]
+        tokens = estimate_tokens(prefix)
+        digest = hashlib.sha256(json.dumps(prefix, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            if digest in self._cached_prefixes:
+                return tokens, 0
+            self._cached_prefixes.add(digest)
+        return 0, tokens
+
+    def _begin(self, protocol: str, key: str) -> Optional[int]:
+        """记录请求，返回要注入的错误状态码"""
+        with self._lock:
+            self.requests[protocol] = self.requests.get(protocol, 0) + 1
+            self.requests_by_key[key] = self.requests_by_key.get(key, 0) + 1
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return None
+
+    def _finish(self, status: int):
+        with self._lock:
+            self.responses[status] = self.responses.get(status, 0) + 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.requests: Dict[str, int] = {}
+            self.requests_by_key: Dict[str, int] = {}
+            self.responses: Dict[int, int] = {}
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                "requests": dict(self.requests),
+                "requests_by_key": dict(self.requests_by_key),
+                "responses": dict(self.responses),
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=None)
+    parser.add_argument("--output-tokens", type=int, default=32)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--no-sdk-retries", action="store_true", help="错误响应带 x-should-retry: false")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    stub = StubProvider(args.host, args.port, latency=args.latency, token_rate=args.token_rate,
+                        output_tokens=args.output_tokens, error_rate=args.error_rate,
+                        rate_limit_rate=args.rate_limit_rate, retry_after=args.retry_after,
+                        sdk_retries=not args.no_sdk_retries, seed=args.seed)
+    server = stub._bind()
+    print(f"listening on {stub.url}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
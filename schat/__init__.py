@@ -1,6 +1,7 @@
 from .core.session import ChatSession
+from .core.async_session import AsyncChatSession
 from .core.message import Message
 from .models.base import Model
 from .models.factory import ModelFactory
 
-__all__ = ['ChatSession', 'Message', 'Model', 'ModelFactory']
\ No newline at end of file
+__all__ = ['ChatSession', 'AsyncChatSession', 'Message', 'Model', 'ModelFactory']
\ No newline at end of file
@@ -1,4 +1,10 @@
 """全局配置"""
+import os
+
+# 用户缓存目录（$XDG_CACHE_HOME/schat，默认 ~/.cache/schat），默认的磁盘缓存文件放在这里
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "schat"
+)
 
 # 默认的provider配置
 DEFAULT_PROVIDERS = {
@@ -25,6 +31,7 @@ DEFAULT_PROVIDERS = {
         "class": "OpenAIModel",
         "base_url": "https://dashscope-intl.aliyuncs.com/compatible-mode/v1", 
         "openai_compatible": True,
+        "stream_usage": True,  # 支持 stream_options.include_usage
         "default_params": {
             "temperature": 0.7,
             "max_tokens": 4095
@@ -46,6 +53,7 @@ DEFAULT_PROVIDERS = {
         "class": "OpenAIModel",
         "base_url": "https://api.deepseek.com/beta",
         "openai_compatible": True,
+        "stream_usage": True,
         "default_params": {
             "temperature": 0.7,
             "max_tokens": 8192,
@@ -74,4 +82,83 @@ DEFAULT_PROVIDERS = {
             "model": "gemini-1.5-pro"
         }
     },
-} 
\ No newline at end of file
+} 
+
+# 附件编码缓存配置（进程内共享）
+ATTACHMENT_CACHE = {
+    "max_bytes": 256 * 1024 * 1024,  # 内存上限，按base64编码后的字节数计算
+    "spill_dir": None,  # 淘汰的编码结果写入的磁盘目录，None表示不写入
+    "max_paths": 100_000,  # 路径到内容哈希的索引最多保留的条数
+}
+
+# 远程图片下载配置（进程内共享连接池和缓存）
+REMOTE_FETCH = {
+    "max_bytes": 64 * 1024 * 1024,  # 下载缓存的内存上限
+    "fresh_seconds": 60.0,  # 缓存在此时间内直接使用，超过后用ETag/Last-Modified重新验证
+    "timeout": 10.0,
+    "pool_maxsize": 16,  # 每个host的keep-alive连接数
+    "max_workers": 8,  # 单次请求中并发下载的线程数
+}
+
+# API密钥健康检查配置
+KEY_HEALTH = {
+    "cooldown_seconds": 30.0,  # 429且没有Retry-After时的初始冷却时间，连续失败时翻倍
+    "max_cooldown_seconds": 600.0,
+}
+
+# SDK客户端池配置，同一个host的客户端共享一个HTTP连接池
+CLIENT_POOL = {
+    "max_connections": 100,
+    "max_keepalive_connections": 20,
+    "keepalive_expiry": 30.0,
+}
+
+# 对冲请求配置
+HEDGING = {
+    "max_workers": 32,  # 同步对冲请求（不含主请求）使用的线程数
+}
+
+# 路由组配置
+ROUTING = {
+    "ewma_alpha": 0.2,  # 延迟和错误率的EWMA平滑系数
+    "error_weight": 4.0,  # 错误率对得分的放大系数
+    "cost_weight": 0.0,  # 成本换算为秒的系数，0表示不考虑成本
+    "max_attempts": 2,  # 单个请求最多尝试的成员数
+    "failure_threshold": 5,  # 连续失败多少次后熔断
+    "recovery_seconds": 30.0,  # 熔断后多久开始探测
+}
+
+# 会话日志配置
+SESSION_JOURNAL = {
+    "fsync": "interval",  # always / interval / never
+    "fsync_interval": 1.0,  # interval 策略下两次fsync的最小间隔（秒）
+    "compact_min_records": 1000,  # 无效记录数超过此值且超过消息数时压缩
+}
+
+# 模型价格（美元/百万token），按最长前缀匹配模型名，也可以使用 "provider:模型名"；
+# 缺少 cache_read / cache_write 时按 input 计价。价格会变化，请以provider的最新价格为准
+MODEL_PRICES = {
+    "gpt-4o-mini": {"input": 0.15, "output": 0.60, "cache_read": 0.075},
+    "gpt-4o": {"input": 2.50, "output": 10.00, "cache_read": 1.25},
+    "claude-3-5-haiku": {"input": 0.80, "output": 4.00, "cache_read": 0.08, "cache_write": 1.00},
+    "claude-3-5-sonnet": {"input": 3.00, "output": 15.00, "cache_read": 0.30, "cache_write": 3.75},
+    "claude-3-opus": {"input": 15.00, "output": 75.00, "cache_read": 1.50, "cache_write": 18.75},
+    "gemini-1.5-flash": {"input": 0.075, "output": 0.30, "cache_read": 0.01875},
+    "gemini-1.5-pro": {"input": 1.25, "output": 5.00, "cache_read": 0.3125},
+    "deepseek-chat": {"input": 0.27, "output": 1.10, "cache_read": 0.07},
+}
+
+# Gemini文件上传配置
+GOOGLE_FILES = {
+    "max_workers": 8,  # 单次请求中并发上传的线程数
+    "poll_interval": 0.5,  # 等待文件处理完成的首次轮询间隔（秒），之后每次翻倍
+    "max_poll_interval": 8.0,
+    "timeout": 600.0,  # 一次请求中所有附件上传和处理完成的总时限（秒）
+}
+
+# 已上传文件登记表配置，按内容哈希在过期前复用上传到Gemini的文件
+UPLOAD_REGISTRY = {
+    "path": os.path.join(CACHE_DIR, "uploads.db"),  # SQLite文件路径，None表示只在内存中记录（不跨进程复用）
+    "ttl": 47 * 3600.0,  # provider没有返回过期时间时的有效期（Gemini文件保留48小时）
+    "expiry_margin": 600.0,  # 提前多少秒视为过期
+}
@@ -1,4 +1,6 @@
 from .message import Message
 from .session import ChatSession
+from .async_session import AsyncChatSession
+from .batch import BatchExecutor, BatchResult
 
-__all__ = ['Message', 'ChatSession'] 
\ No newline at end of file
+__all__ = ['Message', 'ChatSession', 'AsyncChatSession', 'BatchExecutor', 'BatchResult'] 
\ No newline at end of file
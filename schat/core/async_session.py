@@ -0,0 +1,71 @@
+from typing import List, Dict, Optional, Union, AsyncGenerator
+import time
+from .message import Message
+from .streaming import AsyncStreamingResponse
+from .session import ChatSession
+from .batch import BatchExecutor, BatchResult, default_executor
+from ..models.base import Model
+
+class AsyncChatSession(ChatSession):
+    """异步聊天会话
+    
+    历史记录、系统提示、保存加载等与 ChatSession 相同，
+    只有 send 改为协程，并通过 Model.asend 发送请求
+    """
+    
+    async def send(self,
+                   text: str,
+                   model: Union[str, Model, None] = None,
+                   files: Optional[List[str]] = None,
+                   tools: Optional[List[Dict]] = None,
+                   priority: float = 1.0,
+                   stream: Optional[bool] = None,
+                   **kwargs) -> Union[Message, AsyncStreamingResponse]:
+        """异步发送消息并获取响应
+        
+        流式响应返回 AsyncStreamingResponse，流结束或被关闭时回复会加入历史记录
+        """
+        current_model, history, model_kwargs = self._prepare_send(
+            text, model, files, tools, priority, stream, kwargs
+        )
+        
+        started_at = time.perf_counter()
+        response = await current_model.asend(history, **model_kwargs)
+        
+        if not isinstance(response, (Message, AsyncStreamingResponse)):
+            response = AsyncStreamingResponse(response, started_at=started_at)
+        return self._finish_send(response)
+        
+    async def send_many(self,
+                        items: List[Union[str, List[Message]]],
+                        model: Union[str, Model, None] = None,
+                        executor: Optional[BatchExecutor] = None,
+                        **kwargs) -> List[BatchResult]:
+        """异步并发发送一批相互独立的请求，参数同 ChatSession.send_many"""
+        current_model = self._get_model(model)
+        executor = executor or default_executor
+        return await executor.arun(current_model, self._batch_requests(items), **kwargs)
+        
+    async def astream(self,
+                      text: str,
+                      model: Union[str, Model, None] = None,
+                      files: Optional[List[str]] = None,
+                      tools: Optional[List[Dict]] = None,
+                      priority: float = 1.0,
+                      **kwargs) -> AsyncGenerator[str, None]:
+        """以流式方式发送消息，逐块返回文本
+        
+        用法:
+            async for chunk in session.astream("你好"):
+                print(chunk, end="")
+        """
+        response = await self.send(
+            text, model=model, files=files, tools=tools,
+            priority=priority, stream=True, **kwargs
+        )
+        try:
+            async for chunk in response:
+                yield chunk
+        finally:
+            # 调用方提前退出时同样结束流，使已收到的内容加入历史
+            await response.aclose()
@@ -0,0 +1,192 @@
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple, Any
+from concurrent.futures import ThreadPoolExecutor
+from threading import BoundedSemaphore, Lock
+import asyncio
+import copy
+import weakref
+from .message import Message
+from .key_manager import APIKeyManager
+from ..models.base import Model
+
+@dataclass
+class BatchResult:
+    """批量请求中单条请求的结果"""
+    index: int
+    message: Optional[Message] = None
+    error: Optional[Exception] = None
+    
+    @property
+    def ok(self) -> bool:
+        """请求是否成功"""
+        return self.error is None
+
+
+class BatchExecutor:
+    """批量请求执行器
+    
+    按provider和API密钥限制同时在途的请求数，每个密钥使用一个独立的模型副本，
+    因此吞吐量随配置的密钥数量（PROVIDER_KEY=k1,k2,...）线性增长。
+    同步路径的限制在共享同一个执行器的所有批次间生效。
+    """
+    
+    def __init__(self, max_per_provider: int = 16, max_per_key: int = 4):
+        if max_per_provider < 1 or max_per_key < 1:
+            raise ValueError("Concurrency limits must be at least 1")
+        self.max_per_provider = max_per_provider
+        self.max_per_key = max_per_key
+        self._key_manager = APIKeyManager()
+        self._lock = Lock()
+        self._provider_slots: Dict[str, BoundedSemaphore] = {}
+        self._key_slots: Dict[Tuple[str, str], BoundedSemaphore] = {}
+        # 原模型 -> {key -> 副本}，原模型被回收后副本随之释放
+        self._key_models: "weakref.WeakKeyDictionary[Model, Dict[str, Model]]" = weakref.WeakKeyDictionary()
+        
+    def _slot(self, slots: Dict, name: Any, size: int) -> BoundedSemaphore:
+        """获取（或创建）指定名称的信号量"""
+        with self._lock:
+            if name not in slots:
+                slots[name] = BoundedSemaphore(size)
+            return slots[name]
+        
+    def _rotates_keys(self, model: Model) -> bool:
+        """模型是否参与密钥轮换，显式设置了密钥的模型不参与"""
+        return not model.api_key and bool(self._key_manager.get_keys(model.provider))
+        
+    def _acquire_key(self, model: Model, provider: str) -> Tuple[Optional[str], BoundedSemaphore]:
+        """为单条请求选择密钥并占用该密钥的一个并发槽位
+        
+        按使用次数从少到多尝试各健康key的槽位，取第一个空闲的；全部已满时等待使用次数最少的key，
+        等待期间该key进入冷却（例如收到429）则释放槽位重新选择。
+        
+        Returns:
+            Tuple: (密钥, 已占用的槽位)，不参与轮换时密钥为None
+        """
+        if not self._rotates_keys(model):
+            slot = self._slot(self._key_slots, (provider, None), self.max_per_key)
+            slot.acquire()
+            return None, slot
+        while True:
+            candidates = self._key_manager.get_available_keys(model.provider)
+            if not candidates:
+                # 全部key都在冷却，由密钥管理器选择最早恢复的key
+                key = self._key_manager.get_key(model.provider)
+                slot = self._slot(self._key_slots, (provider, key), self.max_per_key)
+                slot.acquire()
+                return key, slot
+            for key in candidates:
+                slot = self._slot(self._key_slots, (provider, key), self.max_per_key)
+                if slot.acquire(blocking=False):
+                    break
+            else:
+                key = candidates[0]
+                slot = self._slot(self._key_slots, (provider, key), self.max_per_key)
+                slot.acquire()
+                if not self._key_manager.is_key_available(model.provider, key):
+                    slot.release()
+                    continue
+            self._key_manager.record_use(model.provider, key)
+            return key, slot
+        
+    async def _aacquire_key(self, model: Model,
+                            key_slots: Dict[Optional[str], asyncio.Semaphore]) -> Tuple[Optional[str], asyncio.Semaphore]:
+        """_acquire_key 的异步版本，槽位只在本次调用内共享"""
+        def slot_for(key: Optional[str]) -> asyncio.Semaphore:
+            return key_slots.setdefault(key, asyncio.Semaphore(self.max_per_key))
+        
+        if not self._rotates_keys(model):
+            slot = slot_for(None)
+            await slot.acquire()
+            return None, slot
+        while True:
+            candidates = self._key_manager.get_available_keys(model.provider)
+            if not candidates:
+                key = self._key_manager.get_key(model.provider)
+                slot = slot_for(key)
+                await slot.acquire()
+                return key, slot
+            free = [key for key in candidates if not slot_for(key).locked()]
+            key = free[0] if free else candidates[0]
+            slot = slot_for(key)
+            # 槽位空闲时 acquire 不会让出事件循环
+            await slot.acquire()
+            if not free and not self._key_manager.is_key_available(model.provider, key):
+                slot.release()
+                continue
+            self._key_manager.record_use(model.provider, key)
+            return key, slot
+        
+    def _model_for_key(self, model: Model, key: Optional[str]) -> Model:
+        """获取绑定到指定密钥的模型副本，副本在执行器内复用"""
+        if key is None or key == model.api_key:
+            return model
+        with self._lock:
+            clones = self._key_models.setdefault(model, {})
+            clone = clones.get(key)
+            if clone is None:
+                clone = copy.copy(model)
+                # 副本与原模型共享按key缓存的客户端
+                clone.api_key = key
+                clones[key] = clone
+            return clone
+        
+    def run(self, model: Model, requests: List[List[Message]], **kwargs) -> List[BatchResult]:
+        """在线程池中并发执行批量请求
+        
+        Args:
+            model: 模型实例
+            requests: 每条请求的完整消息列表
+            **kwargs: 传给 Model.send 的参数，不支持流式
+            
+        Returns:
+            List[BatchResult]: 与输入顺序一致的结果，单条失败不影响其他请求
+        """
+        if not requests:
+            return []
+        kwargs = dict(kwargs, stream=False)
+        provider = model.provider or model.__class__.__name__
+        provider_slot = self._slot(self._provider_slots, provider, self.max_per_provider)
+        
+        def call(index: int, messages: List[Message]) -> BatchResult:
+            with provider_slot:
+                try:
+                    key, key_slot = self._acquire_key(model, provider)
+                    try:
+                        message = self._model_for_key(model, key).send(messages, **kwargs)
+                    finally:
+                        key_slot.release()
+                    return BatchResult(index=index, message=message)
+                except Exception as e:
+                    return BatchResult(index=index, error=e)
+        
+        workers = min(len(requests), self.max_per_provider)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(call, i, messages) for i, messages in enumerate(requests)]
+            return [future.result() for future in futures]
+        
+    async def arun(self, model: Model, requests: List[List[Message]], **kwargs) -> List[BatchResult]:
+        """使用 Model.asend 并发执行批量请求
+        
+        异步路径的并发限制只在本次调用内生效
+        """
+        kwargs = dict(kwargs, stream=False)
+        provider_slot = asyncio.Semaphore(self.max_per_provider)
+        key_slots: Dict[Optional[str], asyncio.Semaphore] = {}
+        
+        async def call(index: int, messages: List[Message]) -> BatchResult:
+            async with provider_slot:
+                try:
+                    key, key_slot = await self._aacquire_key(model, key_slots)
+                    try:
+                        message = await self._model_for_key(model, key).asend(messages, **kwargs)
+                    finally:
+                        key_slot.release()
+                    return BatchResult(index=index, message=message)
+                except Exception as e:
+                    return BatchResult(index=index, error=e)
+        
+        return list(await asyncio.gather(*(call(i, m) for i, m in enumerate(requests))))
+
+
+# 进程内共享的默认执行器，使并发限制在所有会话间生效
+default_executor = BatchExecutor()
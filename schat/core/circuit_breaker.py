@@ -0,0 +1,107 @@
+import time
+from threading import Lock
+from typing import Dict
+
+
+class CircuitBreaker:
+    """熔断器
+
+    - closed: 正常放行，连续失败达到 failure_threshold 次后打开
+    - open: 拒绝请求，recovery_seconds 后进入 half_open
+    - half_open: 只放行一个探测请求，成功则关闭，失败则重新打开并加倍恢复时间
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self,
+                 failure_threshold: int = 5,
+                 recovery_seconds: float = 30.0,
+                 max_recovery_seconds: float = 600.0):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.max_recovery_seconds = max_recovery_seconds
+        self._lock = Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._current_recovery = recovery_seconds
+        self._probing = False
+        self.opened = 0  # 打开的次数
+
+    @property
+    def state(self) -> str:
+        """当前状态，open 状态超过恢复时间后视为 half_open"""
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        """调用方需持有锁"""
+        if self._state == self.OPEN and time.time() >= self._open_until:
+            return self.HALF_OPEN
+        return self._state
+
+    @property
+    def open_until(self) -> float:
+        with self._lock:
+            return self._open_until
+
+    def allow(self) -> bool:
+        """是否放行本次请求，half_open 时只放行一个探测请求"""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.time() < self._open_until:
+                    return False
+                self._state = self.HALF_OPEN
+            if self._probing:
+                return False
+            self._probing = True
+            return True
+
+    def force_probe(self):
+        """没有其他可用选择时强制放行一个探测请求"""
+        with self._lock:
+            if self._state != self.CLOSED:
+                self._state = self.HALF_OPEN
+                self._probing = True
+
+    def release(self):
+        """放弃 allow() 占用的探测名额（请求最终没有发送）"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+            self._current_recovery = self.recovery_seconds
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN:
+                # 探测失败，加倍恢复时间
+                self._current_recovery = min(self._current_recovery * 2, self.max_recovery_seconds)
+                self._trip()
+            elif self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        """打开熔断器，调用方需持有锁"""
+        self._state = self.OPEN
+        self._open_until = time.time() + self._current_recovery
+        self._probing = False
+        self.opened += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self._current_state(),
+                "consecutive_failures": self._failures,
+                "open_until": self._open_until,
+                "opened": self.opened,
+            }
@@ -0,0 +1,159 @@
+import asyncio
+import importlib
+import weakref
+from threading import Lock
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from urllib.parse import urlsplit
+from ..config import CLIENT_POOL
+
+
+def _httpx_module(client_class: type):
+    """SDK的默认HTTP客户端继承自 httpx（新版本SDK为 httpx2），从继承关系中找到对应模块"""
+    for base in client_class.__mro__:
+        root = base.__module__.split(".")[0]
+        if root.startswith("httpx"):
+            return importlib.import_module(root)
+    raise ValueError(f"{client_class.__name__} is not an httpx client class")
+
+
+def _origin(base_url: Optional[str]) -> str:
+    """按 scheme://host 区分连接池，base_url 为空时使用SDK默认地址"""
+    if not base_url:
+        return "default"
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class ClientPool:
+    """SDK客户端池
+
+    - SDK客户端按 (模型类, base_url, api_key) 缓存，密钥轮换和切换模型不会重复创建客户端
+    - 同一个host的客户端共享一个keep-alive的HTTP客户端，不会重复TLS握手
+    - 异步客户端与事件循环绑定，按事件循环分别缓存，循环结束后自动释放
+    """
+
+    def __init__(self,
+                 max_connections: int = 100,
+                 max_keepalive_connections: int = 20,
+                 keepalive_expiry: float = 30.0):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._lock = Lock()
+        self._clients: Dict[Hashable, Any] = {}
+        self._http_clients: Dict[Tuple[type, str], Any] = {}
+        # 事件循环 -> {key -> 客户端}
+        self._loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[Hashable, Any]]" = \
+            weakref.WeakKeyDictionary()
+        self.created = 0
+        self.reused = 0
+
+    def _cache_for(self, is_async: bool) -> Dict[Hashable, Any]:
+        """同步客户端全局共享，异步客户端按当前事件循环区分，调用方需持有锁"""
+        if not is_async:
+            return self._clients
+        loop = _running_loop()
+        if loop is None:
+            # 不在事件循环中（例如提前创建），不缓存
+            return {}
+        return self._loop_clients.setdefault(loop, {})
+
+    def get_client(self, key: Hashable, create: Callable[[], Any], is_async: bool = False) -> Any:
+        """获取缓存的SDK客户端，不存在时调用 create 创建
+
+        Args:
+            key: 缓存key，通常为 (模型类, base_url, api_key)
+            create: 创建客户端的函数
+            is_async: 是否为异步客户端
+        """
+        with self._lock:
+            cache = self._cache_for(is_async)
+            client = cache.get(key)
+            if client is not None:
+                self.reused += 1
+                return client
+        client = create()
+        with self._lock:
+            cache = self._cache_for(is_async)
+            existing = cache.get(key)
+            if existing is not None:
+                self.reused += 1
+                return existing
+            cache[key] = client
+            self.created += 1
+            return client
+
+    def http_client(self, client_class: type, base_url: Optional[str] = None) -> Any:
+        """获取共享的HTTP客户端
+
+        Args:
+            client_class: SDK提供的HTTP客户端类，如 openai.DefaultHttpxClient、
+                anthropic.DefaultAsyncHttpxClient
+            base_url: API地址，同一个host共享一个HTTP客户端
+        """
+        is_async = "Async" in client_class.__name__
+        key = (client_class, _origin(base_url))
+        with self._lock:
+            cache = self._cache_for(is_async) if is_async else self._http_clients
+            http_client = cache.get(key)
+            if http_client is None:
+                httpx = _httpx_module(client_class)
+                http_client = cache[key] = client_class(limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ))
+            return http_client
+
+    def clear(self):
+        """清空缓存的客户端并关闭共享的同步HTTP客户端"""
+        with self._lock:
+            http_clients = list(self._http_clients.values())
+            self._clients.clear()
+            self._http_clients.clear()
+            self._loop_clients.clear()
+            self.created = self.reused = 0
+        for http_client in http_clients:
+            http_client.close()
+
+    def stats(self) -> Dict[str, int]:
+        """获取客户端池统计"""
+        with self._lock:
+            return {
+                "created": self.created,
+                "reused": self.reused,
+                "clients": len(self._clients),
+                "http_clients": len(self._http_clients),
+            }
+
+
+_client_pool: Optional[ClientPool] = None
+_client_pool_lock = Lock()
+
+
+def get_client_pool() -> ClientPool:
+    """获取进程共享的客户端池，首次调用时按 config.CLIENT_POOL 创建"""
+    global _client_pool
+    if _client_pool is None:
+        with _client_pool_lock:
+            if _client_pool is None:
+                _client_pool = ClientPool(**CLIENT_POOL)
+    return _client_pool
+
+
+def configure_client_pool(**kwargs) -> ClientPool:
+    """按指定参数重新创建进程共享的客户端池，参数同 ClientPool"""
+    global _client_pool
+    with _client_pool_lock:
+        old = _client_pool
+        _client_pool = ClientPool(**{**CLIENT_POOL, **kwargs})
+    if old is not None:
+        old.clear()
+    return _client_pool
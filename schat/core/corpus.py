@@ -0,0 +1,300 @@
+"""会话语料的列式导出和批量导入
+
+每条消息导出为一行（Arrow IPC 或 Parquet），便于用 pyarrow / pandas / DuckDB 等工具分析；
+需要安装 pyarrow。读取 ChatSession.save 保存的JSON目录时使用多进程解析，不需要 pyarrow。
+"""
+import json
+import os
+from multiprocessing import Pool
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from .message import Message
+from .session import ChatSession
+from .usage import Usage
+
+# 导出的列，同一个会话的行连续存放并按 position 排序；
+# session_state 只在会话的第一行有值，没有消息的会话导出为一行 position 为 -1 的空消息
+COLUMNS = ("session_id", "position", "role", "text", "priority", "timestamp", "files",
+           "tool_calls", "tool_call_id", "name", "content", "usage", "session_state")
+
+_READ_BATCH_ROWS = 65536
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError(
+            "pyarrow package not installed. "
+            "Please install it with: pip install pyarrow"
+        )
+    return pyarrow
+
+
+def _schema(pa):
+    return pa.schema([
+        ("session_id", pa.string()),
+        ("position", pa.int32()),
+        ("role", pa.string()),
+        ("text", pa.string()),
+        ("priority", pa.float64()),
+        ("timestamp", pa.float64()),
+        ("files", pa.list_(pa.string())),
+        ("tool_calls", pa.string()),  # JSON
+        ("tool_call_id", pa.string()),
+        ("name", pa.string()),
+        ("content", pa.string()),  # JSON
+        ("usage", pa.string()),  # JSON，模型回复的token用量
+        ("session_state", pa.string()),  # JSON，ChatSession 的设置
+    ])
+
+
+def _format(path: str, format: Optional[str]) -> str:
+    if format is None:
+        format = "parquet" if path.endswith(".parquet") else "arrow"
+    if format not in ("parquet", "arrow"):
+        raise ValueError(f"Unknown corpus format: {format}")
+    return format
+
+
+def _dumps(value: Any) -> Optional[str]:
+    return json.dumps(value, ensure_ascii=False) if value else None
+
+
+class _Columns:
+    """按列累积待写入的行"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.data: Dict[str, List[Any]] = {name: [] for name in COLUMNS}
+        self.rows = 0
+
+    def add_session(self, session_id: str, state: Dict[str, Any], messages: List[Dict[str, Any]]):
+        data = self.data
+        state_json = json.dumps(state, ensure_ascii=False)
+        if not messages:
+            messages = [None]
+        for position, msg in enumerate(messages):
+            data["session_id"].append(session_id)
+            data["session_state"].append(state_json if position == 0 else None)
+            if msg is None:
+                data["position"].append(-1)
+                for name in COLUMNS[2:-1]:
+                    data[name].append(None)
+                continue
+            data["position"].append(position)
+            data["role"].append(msg["role"])
+            data["text"].append(msg.get("text"))
+            data["priority"].append(msg.get("priority", 1.0))
+            data["timestamp"].append(msg.get("timestamp"))
+            data["files"].append(msg.get("files") or [])
+            data["tool_calls"].append(_dumps(msg.get("tool_calls")))
+            data["tool_call_id"].append(msg.get("tool_call_id"))
+            data["name"].append(msg.get("name"))
+            data["content"].append(_dumps(msg.get("content")))
+            data["usage"].append(_dumps(msg.get("usage")))
+        self.rows += len(messages)
+
+    def flush(self, pa, schema):
+        batch = pa.record_batch([self.data[name] for name in COLUMNS], schema=schema)
+        self.clear()
+        return batch
+
+
+class _Writer:
+    """Parquet / Arrow IPC 文件的按批写入"""
+
+    def __init__(self, path: str, format: Optional[str]):
+        self.pa = _require_pyarrow()
+        self.schema = _schema(self.pa)
+        if _format(path, format) == "parquet":
+            import pyarrow.parquet as pq
+            self._parquet = pq.ParquetWriter(path, self.schema)
+            self._ipc = None
+        else:
+            self._parquet = None
+            self._ipc = self.pa.ipc.new_file(path, self.schema)
+
+    def write(self, columns: _Columns):
+        batch = columns.flush(self.pa, self.schema)
+        if self._parquet is not None:
+            self._parquet.write_table(self.pa.Table.from_batches([batch]))
+        else:
+            self._ipc.write_batch(batch)
+
+    def close(self):
+        (self._parquet or self._ipc).close()
+
+
+def export_sessions(sessions: Iterable[Tuple[str, ChatSession]],
+                    path: str,
+                    format: Optional[str] = None,
+                    batch_rows: int = 65536) -> int:
+    """把多个会话导出为一个列式文件
+
+    Args:
+        sessions: (会话ID, 会话) 的可迭代对象，按需读取
+        path: 输出文件，'.parquet' 结尾时默认使用Parquet，否则使用Arrow IPC
+        format: 'parquet' 或 'arrow'，None 表示按扩展名推断
+        batch_rows: 每个写入批次的行数
+
+    Returns:
+        int: 写入的行数
+    """
+    return _export(((sid, s._state(), [m.to_dict() for m in s.history]) for sid, s in sessions),
+                   path, format, batch_rows)
+
+
+def export_json_dir(directory: str,
+                    path: str,
+                    format: Optional[str] = None,
+                    batch_rows: int = 65536,
+                    processes: Optional[int] = None) -> int:
+    """把目录中 ChatSession.save 保存的JSON会话导出为一个列式文件，使用多进程解析
+
+    会话ID为文件名（不含扩展名），参数同 export_sessions 和 iter_json_sessions
+
+    Returns:
+        int: 写入的行数
+    """
+    return _export(_parse_dir(directory, processes), path, format, batch_rows)
+
+
+def _export(sessions: Iterable[Tuple[str, Dict[str, Any], List[Dict[str, Any]]]],
+            path: str, format: Optional[str], batch_rows: int) -> int:
+    writer = _Writer(path, format)
+    columns = _Columns()
+    total = 0
+    try:
+        for session_id, state, messages in sessions:
+            columns.add_session(session_id, state, messages)
+            if columns.rows >= batch_rows:
+                total += columns.rows
+                writer.write(columns)
+        if columns.rows or total == 0:
+            total += columns.rows
+            writer.write(columns)
+    finally:
+        writer.close()
+    return total
+
+
+def _parse_session_file(path: str) -> Tuple[str, Dict[str, Any], List[Dict[str, Any]]]:
+    """在子进程中解析一个会话文件"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    messages = data.pop("history")
+    session_id = os.path.splitext(os.path.basename(path))[0]
+    return session_id, data, messages
+
+
+def _parse_dir(directory: str, processes: Optional[int]) -> Iterator[Tuple[str, Dict[str, Any], List[Dict[str, Any]]]]:
+    """按文件名顺序解析目录中的JSON会话，结果按需产出"""
+    paths = sorted(
+        os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")
+    )
+    processes = processes if processes is not None else os.cpu_count() or 1
+    if processes <= 1 or len(paths) < 2:
+        for path in paths:
+            yield _parse_session_file(path)
+        return
+    chunksize = max(1, min(256, len(paths) // (processes * 4)))
+    with Pool(processes) as pool:
+        yield from pool.imap(_parse_session_file, paths, chunksize=chunksize)
+
+
+def _build_session(state: Optional[Dict[str, Any]], messages: List[Message]) -> ChatSession:
+    session = ChatSession()
+    if state:
+        session._apply_state(state)
+    session.history = messages
+    return session
+
+
+def iter_json_sessions(directory: str,
+                       batch_size: int = 1000,
+                       processes: Optional[int] = None) -> Iterator[List[Tuple[str, ChatSession]]]:
+    """使用多进程读取目录中 ChatSession.save 保存的JSON会话，按批产出
+
+    Args:
+        directory: 会话目录，读取其中的 *.json 文件
+        batch_size: 每批的会话数
+        processes: 解析JSON的进程数，默认为CPU核数，1 表示在当前进程中解析
+
+    Yields:
+        List[Tuple[str, ChatSession]]: (会话ID, 会话) 列表，会话ID为文件名（不含扩展名）
+    """
+    batch = []
+    for session_id, state, messages in _parse_dir(directory, processes):
+        batch.append((session_id, _build_session(state, [Message.from_dict(m) for m in messages])))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _read_batches(path: str, format: Optional[str]):
+    pa = _require_pyarrow()
+    if _format(path, format) == "parquet":
+        import pyarrow.parquet as pq
+        yield from pq.ParquetFile(path).iter_batches(batch_size=_READ_BATCH_ROWS)
+    else:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield reader.get_batch(i)
+
+
+def iter_sessions(path: str,
+                  batch_size: int = 1000,
+                  format: Optional[str] = None) -> Iterator[List[Tuple[str, ChatSession]]]:
+    """从 export_sessions 导出的文件中流式重建会话，按批产出
+
+    Args:
+        path: 列式文件路径
+        batch_size: 每批的会话数
+        format: 'parquet' 或 'arrow'，None 表示按扩展名推断
+
+    Yields:
+        List[Tuple[str, ChatSession]]: (会话ID, 会话) 列表
+    """
+    batch: List[Tuple[str, ChatSession]] = []
+    current_id = None
+    state = None
+    messages: List[Message] = []
+    for record_batch in _read_batches(path, format):
+        # 较早导出的文件没有 usage 列
+        columns = {name: record_batch.column(name).to_pylist() if name in record_batch.schema.names
+                   else [None] * record_batch.num_rows for name in COLUMNS}
+        for row in zip(*(columns[name] for name in COLUMNS)):
+            (session_id, position, role, text, priority, timestamp, files,
+             tool_calls, tool_call_id, name, content, usage, session_state) = row
+            if session_id != current_id:
+                if current_id is not None:
+                    batch.append((current_id, _build_session(state, messages)))
+                    if len(batch) >= batch_size:
+                        yield batch
+                        batch = []
+                current_id = session_id
+                state = json.loads(session_state) if session_state else None
+                messages = []
+            if position < 0:
+                continue
+            messages.append(Message(
+                role=role,
+                text=text,
+                priority=priority,
+                files=files,
+                timestamp=timestamp,
+                tool_calls=json.loads(tool_calls) if tool_calls else None,
+                tool_call_id=tool_call_id,
+                name=name,
+                content=json.loads(content) if content else None,
+                usage=Usage.from_dict(json.loads(usage)) if usage else None,
+            ))
+    if current_id is not None:
+        batch.append((current_id, _build_session(state, messages)))
+    if batch:
+        yield batch
@@ -0,0 +1,219 @@
+import base64
+import hashlib
+import os
+from collections import OrderedDict
+from threading import Lock, get_ident
+from typing import Dict, List, Optional, Set, Tuple
+from ..config import ATTACHMENT_CACHE
+
+class AttachmentCache:
+    """进程内共享的附件base64编码缓存
+
+    - 文件按 (路径, 大小, 修改时间) 识别，文件变化后自动重新读取
+    - 编码结果按内容哈希存储，不同路径下的相同文件只保存一份
+    - 内存按字节数限制，超出时按LRU淘汰；设置了spill_dir时淘汰的结果写入磁盘
+    - 路径索引最多保留 max_paths 条，按LRU淘汰；磁盘读写都在锁外进行
+    """
+
+    def __init__(self, max_bytes: int = 256 * 1024 * 1024, spill_dir: Optional[str] = None,
+                 max_paths: int = 100_000):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_paths = max_paths
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()  # digest -> base64
+        # (path, size, mtime) -> digest，每个路径只保留最新的一条
+        self._paths: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+        self._path_keys: Dict[str, Tuple[str, int, int]] = {}  # path -> 当前的 (path, size, mtime)
+        self._digest_paths: Dict[str, Set[Tuple[str, int, int]]] = {}
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.spill_hits = 0
+
+    def _stat_key(self, file_path: str) -> Tuple[str, int, int]:
+        path = os.path.abspath(file_path)
+        st = os.stat(path)
+        return (path, st.st_size, st.st_mtime_ns)
+
+    def _spill_path(self, digest: str) -> str:
+        return os.path.join(self.spill_dir, f"{digest}.b64")
+
+    def get_encoded(self, file_path: str) -> str:
+        """获取文件的base64编码
+
+        Args:
+            file_path: 本地文件路径
+
+        Returns:
+            str: base64编码后的文件内容
+        """
+        key = self._stat_key(file_path)
+        with self._lock:
+            digest = self._paths.get(key)
+            if digest is not None:
+                self._paths.move_to_end(key)
+                encoded = self._entries.get(digest)
+                if encoded is not None:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return encoded
+
+        # 读取spill文件、原文件和编码都在锁外进行，避免磁盘I/O阻塞其他线程
+        if digest is not None:
+            encoded = self._read_spill(digest)
+            if encoded is not None:
+                with self._lock:
+                    self.spill_hits += 1
+                    spills = self._store(digest, key, encoded)
+                self._write_spills(spills)
+                return encoded
+
+        with self._lock:
+            self.misses += 1
+        with open(key[0], "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            encoded = self._entries.get(digest)
+        if encoded is None:
+            encoded = base64.b64encode(data).decode('utf-8')
+        with self._lock:
+            spills = self._store(digest, key, encoded)
+        self._write_spills(spills)
+        return encoded
+
+    def _read_spill(self, digest: str) -> Optional[str]:
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(digest), "r", encoding="ascii") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store(self, digest: str, key: Tuple[str, int, int], encoded: str) -> List[Tuple[str, str]]:
+        """保存编码结果并按字节预算淘汰，调用方需持有锁
+
+        Returns:
+            List[Tuple[str, str]]: 需要写入spill目录的 (digest, 编码结果)，由调用方释放锁后写入
+        """
+        self._index_path(digest, key)
+        if digest in self._entries:
+            self._entries.move_to_end(digest)
+            return []
+        evicted = []
+        size = len(encoded)
+        if size > self.max_bytes:
+            # 单个文件超出预算时不缓存在内存中
+            evicted.append((digest, encoded))
+        else:
+            self._entries[digest] = encoded
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_digest, old_encoded = self._entries.popitem(last=False)
+                self._bytes -= len(old_encoded)
+                evicted.append((old_digest, old_encoded))
+        self.evictions += len(evicted)
+        if not self.spill_dir:
+            # 没有spill目录时淘汰的内容无法再找回，同时删除路径索引
+            for old_digest, _ in evicted:
+                self._unindex_digest(old_digest)
+            return []
+        return evicted
+
+    def _index_path(self, digest: str, key: Tuple[str, int, int]):
+        """记录路径对应的内容哈希，替换同一路径的旧记录，超过 max_paths 时按LRU淘汰"""
+        old_key = self._path_keys.get(key[0])
+        if old_key is not None and old_key != key:
+            self._unindex_path(old_key)
+        self._path_keys[key[0]] = key
+        self._paths[key] = digest
+        self._paths.move_to_end(key)
+        self._digest_paths.setdefault(digest, set()).add(key)
+        while len(self._paths) > self.max_paths:
+            self._unindex_path(next(iter(self._paths)))
+
+    def _unindex_path(self, key: Tuple[str, int, int]):
+        digest = self._paths.pop(key, None)
+        if self._path_keys.get(key[0]) == key:
+            del self._path_keys[key[0]]
+        keys = self._digest_paths.get(digest)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._digest_paths[digest]
+
+    def _unindex_digest(self, digest: str):
+        for key in list(self._digest_paths.get(digest, ())):
+            self._unindex_path(key)
+
+    def _write_spills(self, spills: List[Tuple[str, str]]):
+        """把淘汰的编码结果写入spill目录，不持有锁"""
+        for digest, encoded in spills:
+            path = self._spill_path(digest)
+            if os.path.exists(path):
+                continue
+            tmp_path = f"{path}.{os.getpid()}.{get_ident()}.tmp"
+            with open(tmp_path, "w", encoding="ascii") as f:
+                f.write(encoded)
+            os.replace(tmp_path, path)
+
+    def clear(self):
+        """清空内存中的缓存和统计（不删除spill文件）"""
+        with self._lock:
+            self._entries.clear()
+            self._paths.clear()
+            self._path_keys.clear()
+            self._digest_paths.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.evictions = self.spill_hits = 0
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存统计"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "spill_hits": self.spill_hits,
+                "entries": len(self._entries),
+                "paths": len(self._paths),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+_attachment_cache: Optional[AttachmentCache] = None
+_attachment_cache_lock = Lock()
+
+
+def get_attachment_cache() -> AttachmentCache:
+    """获取进程共享的附件缓存，首次调用时按 config.ATTACHMENT_CACHE 创建"""
+    global _attachment_cache
+    if _attachment_cache is None:
+        with _attachment_cache_lock:
+            if _attachment_cache is None:
+                _attachment_cache = AttachmentCache(**ATTACHMENT_CACHE)
+    return _attachment_cache
+
+
+def configure_attachment_cache(max_bytes: Optional[int] = None, spill_dir: Optional[str] = None) -> AttachmentCache:
+    """重新配置进程共享的附件缓存
+
+    Args:
+        max_bytes: 内存上限（字节），None表示使用配置默认值
+        spill_dir: 淘汰结果的磁盘目录，None表示不写入磁盘
+    """
+    global _attachment_cache
+    config = dict(ATTACHMENT_CACHE)
+    if max_bytes is not None:
+        config["max_bytes"] = max_bytes
+    config["spill_dir"] = spill_dir
+    with _attachment_cache_lock:
+        _attachment_cache = AttachmentCache(**config)
+    return _attachment_cache
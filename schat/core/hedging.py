@@ -0,0 +1,346 @@
+import asyncio
+import copy
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from threading import Lock, Thread
+from typing import Any, Dict, List, Optional, Tuple
+from ..config import HEDGING
+from .message import Message
+from .streaming import StreamingResponse, AsyncStreamingResponse
+
+# 流在第一个chunk之前就结束时的标记
+_END = object()
+
+
+class HedgePolicy:
+    """对冲请求策略
+
+    请求在 delay 秒内没有返回（流式请求为没有收到第一个chunk）时，
+    使用另一个key（或备用模型）发送一个重复请求，取先成功的结果。
+
+    - delay 取最近成功请求延迟的分位数（默认p95），样本不足时使用 initial_delay
+    - 额外请求数不超过 budget * 总请求数 + burst
+    - stats() 返回对冲的触发和胜出次数
+    """
+
+    def __init__(self,
+                 percentile: float = 0.95,
+                 initial_delay: float = 1.0,
+                 min_delay: float = 0.05,
+                 max_delay: float = 10.0,
+                 budget: float = 0.1,
+                 burst: int = 2,
+                 window: int = 256,
+                 min_samples: int = 16,
+                 fallback: Any = None):
+        """
+        Args:
+            percentile: 计算延迟使用的分位数
+            initial_delay: 样本不足时的延迟（秒）
+            min_delay: 延迟下限（秒）
+            max_delay: 延迟上限（秒）
+            budget: 额外请求占总请求数的比例上限
+            burst: 允许超出比例的额外请求数
+            window: 保留的延迟样本数
+            min_samples: 使用分位数前需要的最少样本数
+            fallback: 备用模型，没有其他可用key时向它发送对冲请求
+        """
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.budget = budget
+        self.burst = burst
+        self.min_samples = min_samples
+        self.fallback = fallback
+        self._lock = Lock()
+        # 普通请求和流式请求（首个chunk）的延迟分开统计
+        self._latencies = {False: deque(maxlen=window), True: deque(maxlen=window)}
+        self._delays: Dict[bool, Optional[float]] = {False: None, True: None}
+        self.requests = 0
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.budget_denied = 0
+
+    def delay(self, stream: bool = False) -> float:
+        """发送对冲请求前等待的秒数"""
+        with self._lock:
+            cached = self._delays[stream]
+            if cached is not None:
+                return cached
+            samples = self._latencies[stream]
+            if len(samples) < self.min_samples:
+                value = self.initial_delay
+            else:
+                ordered = sorted(samples)
+                value = ordered[min(int(len(ordered) * self.percentile), len(ordered) - 1)]
+            value = min(max(value, self.min_delay), self.max_delay)
+            self._delays[stream] = value
+            return value
+
+    def record_latency(self, seconds: float, stream: bool = False):
+        """记录一次成功请求的延迟"""
+        with self._lock:
+            self._latencies[stream].append(seconds)
+            self._delays[stream] = None
+
+    def _begin(self):
+        with self._lock:
+            self.requests += 1
+
+    def _try_hedge(self) -> bool:
+        """在预算内时占用一次对冲额度"""
+        with self._lock:
+            if self.hedges_fired >= self.budget * self.requests + self.burst:
+                self.budget_denied += 1
+                return False
+            self.hedges_fired += 1
+            return True
+
+    def _refund(self):
+        with self._lock:
+            self.hedges_fired -= 1
+
+    def _record_win(self):
+        with self._lock:
+            self.hedges_won += 1
+
+    def stats(self) -> Dict[str, float]:
+        """获取对冲统计"""
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "hedges_fired": self.hedges_fired,
+                "hedges_won": self.hedges_won,
+                "budget_denied": self.budget_denied,
+                "hedge_rate": self.hedges_fired / self.requests if self.requests else 0.0,
+            }
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    """同步对冲请求使用的共享线程池，只执行对冲请求，数量受 budget 限制"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=HEDGING["max_workers"], thread_name_prefix="schat-hedge"
+                )
+    return _executor
+
+
+def _pin(model, key: Optional[str]):
+    """获取绑定到指定key的模型副本"""
+    if key is None or key == model.api_key:
+        return model
+    clone = copy.copy(model)
+    clone.api_key = key
+    return clone
+
+
+def _hedge_target(model, primary_key: Optional[str], policy: HedgePolicy):
+    """选择对冲请求的目标：同provider的其他健康key，没有时使用备用模型
+
+    都没有时退还已占用的对冲额度并返回None
+    """
+    key = model._key_manager.get_other_key(model.provider, primary_key)
+    if key is not None:
+        return _pin(model, key)
+    if policy.fallback is None:
+        policy._refund()
+    return policy.fallback
+
+
+def _primary(model):
+    """主请求预先选好key，保证对冲请求使用不同的key"""
+    key = model.api_key or model._key_manager.get_key(model.provider)
+    return _pin(model, key)
+
+
+def _is_stream(model, kwargs: Dict) -> bool:
+    return bool(kwargs.get("stream", model.default_kwargs.get("stream", False)))
+
+
+def _attempt(target, messages: List[Message], kwargs: Dict, stream: bool,
+             policy: HedgePolicy) -> Tuple[Any, Any, Any]:
+    """执行一次请求，流式请求等到第一个chunk再返回"""
+    started = time.perf_counter()
+    response = target._send(messages, **kwargs)
+    first = next(response, _END) if stream else None
+    policy.record_latency(time.perf_counter() - started, stream)
+    return target, response, first
+
+
+def _start_primary(*args) -> Future:
+    """在单独的线程中执行主请求
+
+    主请求不排队等待线程池，并发的对冲请求数不受线程池大小限制，对冲延迟也不包含排队时间；
+    主请求不能在调用方线程中执行，因为阻塞的SDK调用无法在对冲请求胜出时放弃
+    """
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    def run():
+        try:
+            future.set_result(_attempt(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    Thread(target=run, name="schat-hedge-primary", daemon=True).start()
+    return future
+
+
+def _adopt_stream(wrapper, response):
+    """包装后的流式响应与胜出的响应共用用量和计时，它们都在读取过程中原地更新"""
+    wrapper.usage = getattr(response, "usage", None)
+    wrapper.timings = getattr(response, "timings", None)
+    return wrapper
+
+
+def _resume(first, response):
+    """先返回已经读到的第一个chunk，再继续读取剩余内容"""
+    try:
+        if first is not _END:
+            yield first
+            yield from response
+    finally:
+        response.close()
+
+
+def _discard(future: Future):
+    """丢弃落败请求的结果，流式响应立即关闭以释放连接"""
+    if not future.cancelled() and future.exception() is None:
+        _, response, _ = future.result()
+        if hasattr(response, "close"):
+            response.close()
+
+
+def hedged_send(model, messages: List[Message], kwargs: Dict, policy: HedgePolicy):
+    """同步发送对冲请求，返回先成功的结果
+
+    同步请求无法中途取消，落败的普通请求会在后台完成后被丢弃，
+    落败的流式请求在收到第一个chunk后关闭。
+    """
+    started_at = time.perf_counter()
+    stream = _is_stream(model, kwargs)
+    policy._begin()
+    primary = _primary(model)
+    futures = {_start_primary(primary, messages, kwargs, stream, policy): primary}
+
+    done, _ = wait(futures, timeout=policy.delay(stream))
+    if not done:
+        target = policy._try_hedge() and _hedge_target(model, primary.api_key, policy)
+        if target:
+            futures[_get_executor().submit(_attempt, target, messages, kwargs, stream, policy)] = target
+
+    winner = None
+    error = None
+    pending = set(futures)
+    while pending and winner is None:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                winner = winner or future
+            elif futures[future] is primary or error is None:
+                # 都失败时抛出主请求的错误
+                error = future.exception()
+    for future in pending:
+        future.add_done_callback(_discard)
+    if winner is None:
+        raise error
+
+    target, response, first = winner.result()
+    if target is not primary:
+        policy._record_win()
+    if target.provider == model.provider and target.api_key:
+        # 调用方的 current_key 反映实际使用的key
+        model._request_state.set((target.api_key, None, None))
+    if stream:
+        return _adopt_stream(StreamingResponse(_resume(first, response), started_at=started_at), response)
+    return response
+
+
+async def _aattempt(target, messages: List[Message], kwargs: Dict, stream: bool,
+                    policy: HedgePolicy) -> Tuple[Any, Any, Any]:
+    """执行一次异步请求，流式请求等到第一个chunk再返回"""
+    started = time.perf_counter()
+    response = await target._asend(messages, **kwargs)
+    if stream:
+        try:
+            first = await response.__anext__()
+        except StopAsyncIteration:
+            first = _END
+        except asyncio.CancelledError:
+            await response.aclose()
+            raise
+    else:
+        first = None
+    policy.record_latency(time.perf_counter() - started, stream)
+    return target, response, first
+
+
+async def _aresume(first, response):
+    """先返回已经读到的第一个chunk，再继续读取剩余内容"""
+    try:
+        if first is not _END:
+            yield first
+            async for chunk in response:
+                yield chunk
+    finally:
+        await response.aclose()
+
+
+def _adiscard(task: asyncio.Task):
+    """落败的异步流式响应在任务恰好已完成时关闭"""
+    if not task.cancelled() and task.exception() is None:
+        _, response, _ = task.result()
+        if hasattr(response, "aclose"):
+            asyncio.ensure_future(response.aclose())
+
+
+async def ahedged_send(model, messages: List[Message], kwargs: Dict, policy: HedgePolicy):
+    """异步发送对冲请求，返回先成功的结果，落败的请求会被取消"""
+    started_at = time.perf_counter()
+    stream = _is_stream(model, kwargs)
+    policy._begin()
+    primary = _primary(model)
+    tasks = {asyncio.ensure_future(_aattempt(primary, messages, kwargs, stream, policy)): primary}
+    winner = None
+    error = None
+    pending = set(tasks)
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=policy.delay(stream))
+        if not done:
+            target = policy._try_hedge() and _hedge_target(model, primary.api_key, policy)
+            if target:
+                task = asyncio.ensure_future(_aattempt(target, messages, kwargs, stream, policy))
+                tasks[task] = target
+                pending.add(task)
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    winner = winner or task
+                elif tasks[task] is primary or error is None:
+                    error = task.exception()
+    finally:
+        for task in pending:
+            task.cancel()
+            task.add_done_callback(_adiscard)
+    if winner is None:
+        raise error
+
+    target, response, first = winner.result()
+    if target is not primary:
+        policy._record_win()
+    if target.provider == model.provider and target.api_key:
+        # 调用方的 current_key 反映实际使用的key
+        model._request_state.set((target.api_key, None, None))
+    if stream:
+        return _adopt_stream(AsyncStreamingResponse(_aresume(first, response), started_at=started_at), response)
+    return response
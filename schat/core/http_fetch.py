@@ -0,0 +1,154 @@
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, Iterable, Optional
+import requests
+from requests.adapters import HTTPAdapter
+from ..config import REMOTE_FETCH
+
+@dataclass
+class _CachedResponse:
+    data: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    checked_at: float
+
+
+class RemoteFileFetcher:
+    """远程文件下载器
+
+    - 所有模型实例共享一个keep-alive的连接池
+    - 下载结果按URL缓存，按字节数限制并LRU淘汰
+    - 缓存超过 fresh_seconds 后使用 ETag/Last-Modified 重新验证
+    - fetch_many 并发下载多个URL
+    """
+
+    def __init__(self,
+                 max_bytes: int = 64 * 1024 * 1024,
+                 fresh_seconds: float = 60.0,
+                 timeout: float = 10.0,
+                 pool_maxsize: int = 16,
+                 max_workers: int = 8):
+        self.max_bytes = max_bytes
+        self.fresh_seconds = fresh_seconds
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_maxsize, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._lock = Lock()
+        self._entries: "OrderedDict[str, _CachedResponse]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self.evictions = 0
+
+    def fetch(self, url: str) -> bytes:
+        """下载URL内容，优先使用缓存
+
+        Raises:
+            ValueError: 下载失败
+        """
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry is not None:
+                self._entries.move_to_end(url)
+                if time.time() - entry.checked_at < self.fresh_seconds:
+                    self.hits += 1
+                    return entry.data
+
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers["If-None-Match"] = entry.etag
+            if entry.last_modified:
+                headers["If-Modified-Since"] = entry.last_modified
+
+        try:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            if response.status_code == 304 and entry is not None:
+                with self._lock:
+                    entry.checked_at = time.time()
+                    self.revalidated += 1
+                return entry.data
+            response.raise_for_status()
+        except Exception as e:
+            raise ValueError(f"Failed to download image from {url}: {e}")
+
+        data = response.content
+        with self._lock:
+            self.misses += 1
+            self._store(url, _CachedResponse(
+                data=data,
+                etag=response.headers.get("ETag"),
+                last_modified=response.headers.get("Last-Modified"),
+                checked_at=time.time()
+            ))
+        return data
+
+    def fetch_many(self, urls: Iterable[str]) -> Dict[str, bytes]:
+        """并发下载多个URL
+
+        Returns:
+            Dict[str, bytes]: URL到内容的映射
+
+        Raises:
+            ValueError: 任意一个URL下载失败
+        """
+        unique = list(dict.fromkeys(urls))
+        if len(unique) <= 1:
+            return {url: self.fetch(url) for url in unique}
+        workers = min(len(unique), self.max_workers)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return dict(zip(unique, pool.map(self.fetch, unique)))
+
+    def _store(self, url: str, entry: _CachedResponse):
+        """保存下载结果并按字节预算淘汰，调用方需持有锁"""
+        old = self._entries.pop(url, None)
+        if old is not None:
+            self._bytes -= len(old.data)
+        if len(entry.data) > self.max_bytes:
+            return
+        self._entries[url] = entry
+        self._bytes += len(entry.data)
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.data)
+            self.evictions += 1
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.revalidated = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存统计"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidated": self.revalidated,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+            }
+
+
+_remote_fetcher: Optional[RemoteFileFetcher] = None
+_remote_fetcher_lock = Lock()
+
+
+def get_remote_fetcher() -> RemoteFileFetcher:
+    """获取进程共享的远程文件下载器，首次调用时按 config.REMOTE_FETCH 创建"""
+    global _remote_fetcher
+    if _remote_fetcher is None:
+        with _remote_fetcher_lock:
+            if _remote_fetcher is None:
+                _remote_fetcher = RemoteFileFetcher(**REMOTE_FETCH)
+    return _remote_fetcher
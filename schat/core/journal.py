@@ -0,0 +1,266 @@
+import itertools
+import json
+import os
+import time
+from threading import Lock
+from typing import Any, Dict, IO, List, Optional, Tuple
+from ..config import SESSION_JOURNAL
+from .message import Message
+
+# 日志格式版本，写在 meta 记录中
+JOURNAL_VERSION = 1
+
+FSYNC_POLICIES = ("always", "interval", "never")
+
+
+def is_journal(path: str) -> bool:
+    """文件是否是会话日志（首行为 meta 记录）"""
+    with open(path, "rb") as f:
+        first = f.readline()
+    try:
+        record = json.loads(first)
+    except ValueError:
+        return False
+    return isinstance(record, dict) and record.get("type") == "meta"
+
+
+def read_journal(path: str) -> Tuple[Optional[Dict[str, Any]], List[Message], int, bool]:
+    """读取会话日志
+
+    写入中断导致的不完整末尾会被忽略；没有完成的流式回复按已收到的内容恢复为助手消息。
+
+    Returns:
+        Tuple: (会话设置, 历史消息, 有效内容的字节数, 是否恢复了未完成的流式回复)
+    """
+    meta = None
+    history: List[Message] = []
+    streams: Dict[int, List[str]] = {}  # 未完成的流式回复，按开始顺序
+    valid_bytes = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            kind = record.pop("type")
+            if kind == "message":
+                history.append(Message.from_dict(record["message"]))
+                streams.pop(record.get("stream"), None)
+            elif kind == "chunk":
+                streams.setdefault(record["stream"], []).append(record["text"])
+            elif kind == "discard":
+                streams.pop(record["stream"], None)
+            elif kind == "update":
+                history[record["index"]] = Message.from_dict(record["message"])
+            elif kind == "meta":
+                record.pop("version", None)
+                meta = record
+    for chunks in streams.values():
+        history.append(Message(role="assistant", text="".join(chunks)))
+    return meta, history, valid_bytes, bool(streams)
+
+
+class SessionJournal:
+    """追加写入的会话日志（JSONL）
+
+    每条新消息写为一行记录，不再每次重写整个会话；流式回复的chunk在收到时即写入，
+    进程崩溃后重新打开可以恢复已收到的部分。历史记录被整体替换（如 truncate_history）
+    或无效记录过多时，把当前状态写入临时文件后原子替换原文件（压缩）。
+
+    记录类型：
+    - meta: 会话设置（系统提示、默认模型等），变化时追加
+    - message: 一条消息；带 stream 字段时表示该流式回复已完成
+    - chunk / discard: 流式回复的一个chunk / 出错放弃的流式回复
+    - update: 替换指定位置的消息（如修改优先级）
+    """
+
+    atomic_turns = False  # 用户消息需要在流式回复的chunk之前写入
+
+    def __init__(self,
+                 path: str,
+                 fsync: Optional[str] = None,
+                 fsync_interval: Optional[float] = None,
+                 compact_min_records: Optional[int] = None):
+        """
+        Args:
+            path: 日志文件路径
+            fsync: 'always' 每次写入后fsync，'interval' 距上次fsync超过 fsync_interval 秒时fsync，
+                'never' 只写入操作系统缓冲区
+            fsync_interval: 'interval' 策略的间隔（秒）
+            compact_min_records: 无效记录数超过此值且超过有效消息数时压缩
+        """
+        fsync = fsync or SESSION_JOURNAL["fsync"]
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync}")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = SESSION_JOURNAL["fsync_interval"] if fsync_interval is None else fsync_interval
+        self.compact_min_records = compact_min_records or SESSION_JOURNAL["compact_min_records"]
+        self._lock = Lock()
+        self._file: Optional[IO[bytes]] = None
+        self._meta: Optional[Dict[str, Any]] = None
+        self._written = 0  # 已写入的历史消息数
+        self._last: Optional[Message] = None  # 最后写入的历史消息，用于发现历史被替换
+        self._garbage = 0  # 压缩时可以丢弃的记录数
+        self._stream_ids = itertools.count()
+        self._streams: Dict[int, Any] = {}  # 进行中的流式回复
+        self._finished: Optional[Tuple[Message, int]] = None  # 刚完成的流式回复及其编号
+        self._last_fsync = time.monotonic()
+        self.compactions = 0
+
+    def open(self, session) -> bool:
+        """打开日志文件，已有内容时加载到会话中
+
+        Returns:
+            bool: 是否加载了已有内容
+        """
+        loaded = False
+        with self._lock:
+            if os.path.exists(self.path) and os.path.getsize(self.path) > 0:
+                meta, history, valid_bytes, recovered = read_journal(self.path)
+                if meta is not None:
+                    session._apply_state(meta)
+                session.history = history
+                session.history_offset = 0
+                self._meta = meta
+                self._remember(history)
+                loaded = True
+                if recovered or valid_bytes < os.path.getsize(self.path):
+                    # 恢复的流式回复和不完整的末尾不能继续追加，重写一次
+                    self._compact(session)
+                    return loaded
+            self._file = open(self.path, "ab")
+            self._write_state(session)
+        return loaded
+
+    def _remember(self, history: List[Message]):
+        self._written = len(history)
+        self._last = history[-1] if history else None
+
+    def sync(self, session):
+        """把会话设置的变化和新增的消息追加到日志，日志关闭后不再写入"""
+        with self._lock:
+            if self._file is not None and not self._file.closed:
+                self._write_state(session)
+
+    def _write_state(self, session):
+        """调用方需持有锁"""
+        records = []
+        meta = session._state()
+        if meta != self._meta:
+            if self._meta is not None:
+                self._garbage += 1
+            self._meta = meta
+            records.append({"type": "meta", "version": JOURNAL_VERSION, **meta})
+        for sid, response in list(self._streams.items()):
+            if response.done and response.message is None:
+                # 出错的流式回复没有加入历史，丢弃已写入的chunk
+                del self._streams[sid]
+                records.append({"type": "discard", "stream": sid})
+                self._garbage += 1
+
+        history = session.history
+        n = self._written
+        if len(history) < n or (n and history[n - 1] is not self._last):
+            # 历史记录被替换，直接压缩
+            self._compact(session)
+            return
+        for message in history[n:]:
+            record = {"type": "message", "message": message.to_dict()}
+            if self._finished is not None and self._finished[0] is message:
+                record["stream"] = self._finished[1]
+                self._finished = None
+            records.append(record)
+        self._remember(history)
+        self._append(records)
+        if self._garbage >= self.compact_min_records and self._garbage > self._written:
+            self._compact(session)
+
+    def track_stream(self, response):
+        """流式回复的chunk在收到时写入日志，需要在会话的完成回调之前调用"""
+        sid = next(self._stream_ids)
+        self._streams[sid] = response
+
+        def on_chunk(chunk: str):
+            with self._lock:
+                self._garbage += 1
+                self._append([{"type": "chunk", "stream": sid, "text": chunk}])
+
+        def on_done(message: Message):
+            with self._lock:
+                self._streams.pop(sid, None)
+                self._finished = (message, sid)
+
+        response.add_chunk_callback(on_chunk)
+        response.add_done_callback(on_done)
+
+    def record_update(self, index: int, message: Message):
+        """记录被原地修改的消息"""
+        with self._lock:
+            self._garbage += 1
+            self._append([{"type": "update", "index": index, "message": message.to_dict()}])
+
+    def load_older(self, session, count: int) -> int:
+        """日志打开时已加载全部历史，没有更早的消息"""
+        return 0
+
+    def _append(self, records: List[Dict[str, Any]]):
+        """写入记录并按策略fsync，调用方需持有锁"""
+        if not records or self._file is None or self._file.closed:
+            return
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records)
+        self._file.write(data.encode("utf-8"))
+        self._file.flush()
+        if self.fsync == "always" or (
+            self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval
+        ):
+            os.fsync(self._file.fileno())
+            self._last_fsync = time.monotonic()
+
+    def compact(self, session):
+        """把会话的当前状态重写为新的日志文件"""
+        with self._lock:
+            self._compact(session)
+
+    def _compact(self, session):
+        """写入临时文件后原子替换，调用方需持有锁"""
+        if self._file is not None:
+            self._file.close()
+        meta = session._state()
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            lines = [json.dumps({"type": "meta", "version": JOURNAL_VERSION, **meta}, ensure_ascii=False)]
+            lines.extend(json.dumps({"type": "message", "message": m.to_dict()}, ensure_ascii=False)
+                         for m in session.history)
+            for sid, response in list(self._streams.items()):
+                if response.done and response.message is None:
+                    del self._streams[sid]
+                elif response.text:
+                    # 进行中的流式回复把已收到的内容合并为一个chunk
+                    lines.append(json.dumps({"type": "chunk", "stream": sid, "text": response.text},
+                                            ensure_ascii=False))
+            f.write(("\n".join(lines) + "\n").encode("utf-8"))
+            f.flush()
+            if self.fsync != "never":
+                os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._meta = meta
+        self._remember(session.history)
+        self._garbage = 0
+        self._finished = None
+        self.compactions += 1
+        self._file = open(self.path, "ab")
+
+    def close(self):
+        """刷新并关闭日志文件"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.flush()
+            if self.fsync != "never":
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
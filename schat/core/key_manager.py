@@ -1,11 +1,61 @@
 import os
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple, Union
 import random
 import hashlib
-from threading import Lock
+import heapq
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, asdict
+from email.utils import parsedate_to_datetime
+from threading import Lock, RLock
+from ..config import KEY_HEALTH
+
+# 一次性seed按线程/协程上下文保存，互不影响
+_seed_var: ContextVar[Optional[str]] = ContextVar("schat_key_seed", default=None)
+
+@dataclass
+class KeyHealth:
+    """单个密钥的健康状态"""
+    cooldown_until: float = 0.0  # 在此时间（time.time()）之前不使用该key
+    quarantined: bool = False  # 认证失败的key被隔离，直到 restore_key
+    consecutive_failures: int = 0
+    total_failures: int = 0
+    total_successes: int = 0
+    last_status: Optional[int] = None
+
+    def available(self, now: float) -> bool:
+        return not self.quarantined and self.cooldown_until <= now
+
+
+def parse_retry_after(value: Union[str, float, int, None]) -> Optional[float]:
+    """解析 Retry-After 头，支持秒数和HTTP日期两种格式
+
+    Returns:
+        Optional[float]: 需要等待的秒数，无法解析时返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return max(float(value), 0.0)
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
 
 class APIKeyManager:
-    """API密钥管理器"""
+    """API密钥管理器
+
+    所有状态的读写都在锁内进行，可以在多线程中共享。
+    每个provider维护一个按使用次数排序的最小堆，选择使用次数最少的key为 O(log n)。
+    
+    密钥健康状态：429 会让key进入冷却（遵循 Retry-After），401/403 会隔离key，
+    get_key 只返回健康的key。
+    """
     
     _instance = None
     _lock = Lock()
@@ -18,10 +68,21 @@ class APIKeyManager:
     
     def __init__(self):
         if not hasattr(self, '_initialized'):
+            self._state_lock = RLock()
             self._provider_keys: Dict[str, List[str]] = {}  # provider -> [keys]
             self._key_counts: Dict[str, Dict[str, int]] = {}  # provider -> {key -> count}
-            self._current_seed: Optional[str] = None
+            # provider -> [(count, 随机tie-break, key)]，计数变化后旧条目惰性删除
+            self._key_heaps: Dict[str, List[Tuple[int, float, str]]] = {}
+            self._key_health: Dict[str, Dict[str, KeyHealth]] = {}  # provider -> {key -> health}
             self._initialized = True
+
+    @property
+    def _current_seed(self) -> Optional[str]:
+        return _seed_var.get()
+
+    @_current_seed.setter
+    def _current_seed(self, seed: Optional[str]):
+        _seed_var.set(seed)
     
     def load_keys_from_env(self, provider_name: str) -> bool:
         """从环境变量加载API密钥
@@ -47,69 +108,257 @@ class APIKeyManager:
         if not keys:
             return False
             
-        self._provider_keys[provider_name] = keys
-        self._key_counts[provider_name] = {k: 0 for k in keys}
+        with self._state_lock:
+            self._provider_keys[provider_name] = keys
+            self._key_counts[provider_name] = {k: 0 for k in keys}
+            self._rebuild_heap(provider_name)
         return True
     
     def add_key(self, provider_name: str, key: str):
         """添加单个API密钥"""
-        if provider_name not in self._provider_keys:
-            self._provider_keys[provider_name] = []
-            self._key_counts[provider_name] = {}
+        with self._state_lock:
+            if provider_name not in self._provider_keys:
+                self._provider_keys[provider_name] = []
+                self._key_counts[provider_name] = {}
             
-        if key not in self._provider_keys[provider_name]:
-            self._provider_keys[provider_name].append(key)
-            self._key_counts[provider_name][key] = 0
+            if key not in self._provider_keys[provider_name]:
+                self._provider_keys[provider_name].append(key)
+                self._key_counts[provider_name][key] = 0
+                heapq.heappush(self._key_heaps.setdefault(provider_name, []), (0, random.random(), key))
+
+    def remove_keys(self, provider_name: Optional[str] = None):
+        """删除密钥及其使用计数和健康状态
+
+        Args:
+            provider_name: 指定提供者名称，如果为None则删除所有提供者
+        """
+        with self._state_lock:
+            providers = [provider_name] if provider_name else list(self._provider_keys)
+            for provider in providers:
+                self._provider_keys.pop(provider, None)
+                self._key_counts.pop(provider, None)
+                self._key_heaps.pop(provider, None)
+                self._key_health.pop(provider, None)
+
+    def get_keys(self, provider_name: str) -> List[str]:
+        """获取指定提供者的全部密钥，未加载时尝试从环境变量加载"""
+        with self._state_lock:
+            if provider_name not in self._provider_keys:
+                self.load_keys_from_env(provider_name)
+            return list(self._provider_keys.get(provider_name, []))
     
     def set_current_seed_once(self, seed: str):
-        """设置一次性seed，用于下次获取key
+        """设置一次性seed，用于当前线程/协程下次获取key
         
         下次获取key后seed会被清除
         """
-        self._current_seed = seed
+        _seed_var.set(seed)
     
-    def get_key(self, provider_name: str) -> Optional[str]:
+    def get_key(self, provider_name: str, seed: Optional[str] = None) -> Optional[str]:
         """获取API密钥
         
         如果设置了seed，则使用seed确定key；
-        否则使用负载均衡策略选择使用次数最少的key
+        否则使用负载均衡策略选择使用次数最少的key（次数相同时随机选择）
         
         Args:
             provider_name: 提供者名称
+            seed: 本次调用使用的seed，优先于 set_current_seed_once 设置的seed
             
         Returns:
             str: API密钥，如果没有可用的密钥则返回None
         """
-        if provider_name not in self._provider_keys:
-            self.load_keys_from_env(provider_name)
+        if seed is None:
+            seed = _seed_var.get()
+            if seed is not None:
+                _seed_var.set(None)  # 清除seed
             
-        keys = self._provider_keys.get(provider_name, [])
-        if not keys:
-            return None
+        with self._state_lock:
+            if provider_name not in self._provider_keys:
+                self.load_keys_from_env(provider_name)
             
-        selected_key = None
+            keys = self._provider_keys.get(provider_name, [])
+            if not keys:
+                return None
         
-        # 如果设置了seed，使用seed选择key
-        if self._current_seed is not None:
-            # 使用seed和provider_name生成hash
-            hash_input = f"{self._current_seed}:{provider_name}"
-            hash_value = int(hashlib.md5(hash_input.encode()).hexdigest(), 16)
-            selected_key = keys[hash_value % len(keys)]
-            self._current_seed = None  # 清除seed
-        else:
-            # 使用负载均衡策略
-            counts = self._key_counts[provider_name]
-            min_count = min(counts.values())
-            min_keys = [k for k, c in counts.items() if c == min_count]
-            selected_key = random.choice(min_keys)
+            selected_key = None
+            if seed is not None:
+                # 使用seed和provider_name生成hash
+                hash_input = f"{seed}:{provider_name}"
+                hash_value = int(hashlib.md5(hash_input.encode()).hexdigest(), 16)
+                selected_key = keys[hash_value % len(keys)]
+                if not self._is_available(provider_name, selected_key, time.time()):
+                    # seed对应的key不健康时退回负载均衡
+                    selected_key = None
+            if selected_key is None:
+                selected_key = self._pop_least_used(provider_name)
+            if selected_key is None:
+                return None
             
-        # 增加使用计数
-        self._key_counts[provider_name][selected_key] += 1
-        return selected_key
+            # 增加使用计数
+            self._increment(provider_name, selected_key)
+            return selected_key
+
+    def get_other_key(self, provider_name: str, exclude: Optional[str]) -> Optional[str]:
+        """选择 exclude 以外使用次数最少的健康key（用于对冲请求），只增加选中key的计数
+
+        Returns:
+            str: API密钥，没有其他健康的key时返回None
+        """
+        with self._state_lock:
+            if not self._provider_keys.get(provider_name):
+                return None
+            selected_key = self._pop_least_used(provider_name, exclude)
+            if selected_key is not None:
+                self._increment(provider_name, selected_key)
+            return selected_key
+
+    def get_available_keys(self, provider_name: str) -> List[str]:
+        """获取当前健康的key，按使用次数从少到多排列（次数相同时随机），不增加计数"""
+        with self._state_lock:
+            if provider_name not in self._provider_keys:
+                self.load_keys_from_env(provider_name)
+            counts = self._key_counts.get(provider_name, {})
+            now = time.time()
+            keys = [key for key in self._provider_keys.get(provider_name, [])
+                    if self._is_available(provider_name, key, now)]
+            random.shuffle(keys)
+            return sorted(keys, key=lambda key: counts.get(key, 0))
+
+    def record_use(self, provider_name: str, key: str):
+        """为调用方自行选定的key增加使用计数"""
+        with self._state_lock:
+            if key in self._key_counts.get(provider_name, {}):
+                self._increment(provider_name, key)
+
+    def _rebuild_heap(self, provider_name: str):
+        """按当前计数重建堆，调用方需持有锁"""
+        counts = self._key_counts.get(provider_name, {})
+        heap = [(count, random.random(), key) for key, count in counts.items()]
+        heapq.heapify(heap)
+        self._key_heaps[provider_name] = heap
+
+    def _is_available(self, provider_name: str, key: str, now: float) -> bool:
+        health = self._key_health.get(provider_name, {}).get(key)
+        return health is None or health.available(now)
+
+    def _pop_least_used(self, provider_name: str, exclude: Optional[str] = None) -> Optional[str]:
+        """弹出使用次数最少的健康key，调用方需持有锁
+
+        不健康的key和 exclude 暂时取出，选择完成后放回；全部key都在冷却时返回最早恢复的key，
+        全部被隔离或设置了 exclude 时返回None
+        """
+        counts = self._key_counts[provider_name]
+        heap = self._key_heaps.get(provider_name)
+        if not heap:
+            # 堆为空（例如计数被外部替换），按当前计数重建
+            self._rebuild_heap(provider_name)
+            heap = self._key_heaps[provider_name]
+        now = time.time()
+        skipped = []
+        selected = None
+        while heap:
+            entry = heapq.heappop(heap)
+            count, _, key = entry
+            if counts.get(key) != count:
+                continue  # 过期条目
+            if key != exclude and self._is_available(provider_name, key, now):
+                selected = key
+                break
+            skipped.append(entry)
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        if selected is None and exclude is None:
+            selected = self._soonest_cooled_key(provider_name)
+            if selected is not None:
+                # 从堆中移除该key的当前条目，计数增加后会重新放入
+                heap[:] = [e for e in heap if e[2] != selected]
+                heapq.heapify(heap)
+        return selected
+
+    def _soonest_cooled_key(self, provider_name: str) -> Optional[str]:
+        """在没有健康key时选择最早结束冷却的key，调用方需持有锁"""
+        health = self._key_health.get(provider_name, {})
+        candidates = [
+            (health[key].cooldown_until if key in health else 0.0, key)
+            for key in self._key_counts[provider_name]
+            if key not in health or not health[key].quarantined
+        ]
+        return min(candidates)[1] if candidates else None
+
+    def _health(self, provider_name: str, key: str) -> KeyHealth:
+        return self._key_health.setdefault(provider_name, {}).setdefault(key, KeyHealth())
+
+    def report_success(self, provider_name: str, key: str):
+        """记录一次成功的请求"""
+        with self._state_lock:
+            health = self._health(provider_name, key)
+            health.consecutive_failures = 0
+            health.total_successes += 1
+
+    def report_error(self,
+                     provider_name: str,
+                     key: str,
+                     status_code: Optional[int] = None,
+                     retry_after: Union[str, float, None] = None):
+        """记录一次失败的请求并更新key的健康状态
+
+        Args:
+            provider_name: 提供者名称
+            key: 请求使用的key
+            status_code: HTTP状态码，429进入冷却，401/403隔离，其他只计数
+            retry_after: Retry-After 头的值（秒数或HTTP日期）
+        """
+        with self._state_lock:
+            health = self._health(provider_name, key)
+            health.consecutive_failures += 1
+            health.total_failures += 1
+            health.last_status = status_code
+            if status_code in (401, 403):
+                health.quarantined = True
+            elif status_code == 429:
+                wait = parse_retry_after(retry_after)
+                if wait is None:
+                    # 没有 Retry-After 时按连续失败次数指数退避
+                    wait = min(
+                        KEY_HEALTH["cooldown_seconds"] * 2 ** (health.consecutive_failures - 1),
+                        KEY_HEALTH["max_cooldown_seconds"]
+                    )
+                health.cooldown_until = max(health.cooldown_until, time.time() + wait)
+
+    def restore_key(self, provider_name: str, key: str):
+        """解除key的隔离和冷却"""
+        with self._state_lock:
+            health = self._health(provider_name, key)
+            health.quarantined = False
+            health.cooldown_until = 0.0
+            health.consecutive_failures = 0
+
+    def is_key_available(self, provider_name: str, key: str) -> bool:
+        """key当前是否可用（未冷却、未隔离）"""
+        with self._state_lock:
+            return self._is_available(provider_name, key, time.time())
+
+    def get_key_health(self, provider_name: str) -> Dict[str, Dict]:
+        """获取指定提供者各key的健康状态"""
+        with self._state_lock:
+            keys = self._provider_keys.get(provider_name, [])
+            health = self._key_health.get(provider_name, {})
+            return {key: asdict(health.get(key, KeyHealth())) for key in keys}
+
+    def _increment(self, provider_name: str, key: str):
+        """增加key的使用计数并更新堆，调用方需持有锁"""
+        counts = self._key_counts[provider_name]
+        counts[key] += 1
+        heap = self._key_heaps.setdefault(provider_name, [])
+        heapq.heappush(heap, (counts[key], random.random(), key))
+        # seed选择会留下过期条目，过多时重建
+        if len(heap) > 2 * len(counts) + 16:
+            self._rebuild_heap(provider_name)
     
     def get_key_counts(self, provider_name: str) -> Dict[str, int]:
         """获取指定提供者的key使用计数"""
-        return self._key_counts.get(provider_name, {}).copy()
+        with self._state_lock:
+            return self._key_counts.get(provider_name, {}).copy()
     
     def clear_counts(self, provider_name: Optional[str] = None):
         """清除使用计数
@@ -117,9 +366,9 @@ class APIKeyManager:
         Args:
             provider_name: 指定提供者名称，如果为None则清除所有计数
         """
-        if provider_name:
-            if provider_name in self._key_counts:
-                self._key_counts[provider_name] = {k: 0 for k in self._key_counts[provider_name]}
-        else:
-            for provider in self._key_counts:
-                self._key_counts[provider] = {k: 0 for k in self._key_counts[provider]} 
\ No newline at end of file
+        with self._state_lock:
+            providers = [provider_name] if provider_name else list(self._key_counts)
+            for provider in providers:
+                if provider in self._key_counts:
+                    self._key_counts[provider] = {k: 0 for k in self._key_counts[provider]}
+                    self._rebuild_heap(provider)
@@ -1,12 +1,81 @@
-from dataclasses import dataclass, field
-from typing import List, Dict, Optional
-from datetime import datetime
+import os
+import sys
 import time
+from typing import List, Dict, Optional, Any, Callable, Tuple
+from .usage import Usage
+
+# 构造消息时直接写入slot，跳过 Message.__setattr__ 的缓存失效逻辑
+_set = object.__setattr__
+
+
+def _files_stamp(files: Optional[List[str]]) -> Optional[Tuple]:
+    """附件的路径、大小和修改时间，用于判断转换结果是否过期；无法stat的附件（如URL）只记录路径"""
+    if not files:
+        return None
+    stamp = []
+    for path in files:
+        try:
+            st = os.stat(path)
+            stamp.append((path, st.st_size, st.st_mtime_ns))
+        except (OSError, TypeError, ValueError):
+            stamp.append((path,))
+    return tuple(stamp)
+
+
+class _EmptyList(list):
+    """未设置的 files / tool_calls 读取时得到的空列表
+
+    消息本身只保存 None，不为每条消息分配空列表；
+    只有原地添加元素时才把这个列表存回消息，保持原来的可变列表用法。
+    """
+
+    __slots__ = ("_owner", "_slot")
+
+    def __init__(self, owner: "Message", slot: str):
+        super().__init__()
+        self._owner = owner
+        self._slot = slot
+
+    def _adopt(self):
+        owner = self._owner
+        if owner is not None:
+            self._owner = None
+            _set(owner, self._slot, self)
+
+    def append(self, item):
+        super().append(item)
+        self._adopt()
+
+    def extend(self, items):
+        super().extend(items)
+        self._adopt()
+
+    def insert(self, index, item):
+        super().insert(index, item)
+        self._adopt()
+
+    def __setitem__(self, index, value):
+        super().__setitem__(index, value)
+        self._adopt()
+
+    def __iadd__(self, items):
+        super().__iadd__(items)
+        self._adopt()
+        return self
+
 
-@dataclass
 class Message:
-    """聊天消息类"""
-    
+    """聊天消息类
+
+    消息转换为各provider格式后的结果会缓存在消息上，
+    任何属性被重新赋值时缓存自动失效；原地修改 files 等列表后需要调用 invalidate()
+
+    使用 __slots__ 存储：没有附件和工具调用的消息不分配列表，role 字符串会被intern
+    """
+
+    __slots__ = ("role", "text", "priority", "_files", "timestamp", "_tool_calls",
+                 "tool_call_id", "name", "content", "usage", "timings", "_converted")
+
     def __init__(
         self,
         role: str,
@@ -17,14 +86,125 @@ class Message:
         tool_calls: List[Dict] = None,
         tool_call_id: str = None,
         name: str = None,
-        content: List[Dict] = None
+        content: List[Dict] = None,
+        usage: Optional[Usage] = None
     ):
-        self.role = role
-        self.text = text
-        self.priority = priority
-        self.files = files or []
-        self.timestamp = timestamp if timestamp is not None else time.time()
-        self.tool_calls = tool_calls or []
-        self.tool_call_id = tool_call_id
-        self.name = name
-        self.content = content
\ No newline at end of file
+        _set(self, "role", sys.intern(role) if type(role) is str else role)
+        _set(self, "text", text)
+        _set(self, "priority", priority)
+        _set(self, "_files", files or None)
+        _set(self, "timestamp", timestamp if timestamp is not None else time.time())
+        _set(self, "_tool_calls", tool_calls or None)
+        _set(self, "tool_call_id", tool_call_id)
+        _set(self, "name", name)
+        _set(self, "content", content)
+        _set(self, "usage", usage)  # 模型回复的token用量，provider没有返回时为None
+        _set(self, "timings", None)  # 请求各阶段的耗时（秒），注册了请求钩子时由模型设置
+        _set(self, "_converted", None)
+
+    def __setattr__(self, name: str, value: Any):
+        # 修改任何属性都会使已缓存的转换结果失效
+        converted = self._converted
+        if converted:
+            converted.clear()
+        if name == "role" and type(value) is str:
+            value = sys.intern(value)
+        _set(self, name, value)
+
+    @property
+    def files(self) -> List[str]:
+        files = self._files
+        return files if files is not None else _EmptyList(self, "_files")
+
+    @files.setter
+    def files(self, value: List[str]):
+        _set(self, "_files", value or None)
+
+    @property
+    def tool_calls(self) -> List[Dict]:
+        tool_calls = self._tool_calls
+        return tool_calls if tool_calls is not None else _EmptyList(self, "_tool_calls")
+
+    @tool_calls.setter
+    def tool_calls(self, value: List[Dict]):
+        _set(self, "_tool_calls", value or None)
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __getstate__(self):
+        # 复制和pickle时不包含转换缓存
+        return tuple(getattr(self, slot) for slot in self.__slots__[:-1])
+
+    def __setstate__(self, state):
+        for slot, value in zip(self.__slots__, state):
+            _set(self, slot, value)
+        _set(self, "_converted", None)
+
+    def __repr__(self) -> str:
+        return (f"Message(role={self.role!r}, text={self.text!r}, files={self.files!r}, "
+                f"tool_calls={self.tool_calls!r}, tool_call_id={self.tool_call_id!r})")
+
+    def get_converted(self, key: str, convert: Callable[["Message"], Any]) -> Any:
+        """获取转换为指定格式的结果，首次调用时转换并缓存
+
+        带附件的消息在附件列表或磁盘上的文件（大小、修改时间）变化后重新转换。
+
+        Args:
+            key: 格式标识，不同的转换方式需要使用不同的key
+            convert: 转换函数，接收消息返回转换结果
+
+        Returns:
+            Any: 转换结果，调用方不应修改
+        """
+        converted = self._converted
+        if converted is None:
+            converted = {}
+            _set(self, "_converted", converted)
+        stamp = _files_stamp(self._files)
+        entry = converted.get(key)
+        if entry is None or entry[0] != stamp:
+            entry = converted[key] = (stamp, convert(self))
+        return entry[1]
+
+    def has_converted(self, key: str) -> bool:
+        """是否已缓存指定格式的转换结果，附件变化后的旧结果不算"""
+        converted = self._converted
+        if not converted or key not in converted:
+            return False
+        return converted[key][0] == _files_stamp(self._files)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可以JSON序列化的字典"""
+        data = {
+            "role": self.role,
+            "text": self.text,
+            "priority": self.priority,
+            "files": list(self._files) if self._files else [],
+            "timestamp": self.timestamp,
+            "tool_calls": self._tool_calls or [],
+            "tool_call_id": self.tool_call_id,
+            "name": self.name,
+            "content": self.content,
+        }
+        if self.usage is not None:
+            data["usage"] = self.usage.to_dict()
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        """从 to_dict 的结果创建消息"""
+        usage = data.get("usage")
+        if usage is not None:
+            data = dict(data, usage=Usage.from_dict(usage))
+        return cls(**data)
+
+    def invalidate(self):
+        """清除已缓存的转换结果"""
+        converted = self._converted
+        if converted:
+            converted.clear()
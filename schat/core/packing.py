@@ -0,0 +1,71 @@
+from typing import List, Tuple
+from .message import Message
+from .tokenizer import Tokenizer
+
+
+def group_turns(messages: List[Message]) -> List[Tuple[int, int]]:
+    """把消息按轮次分组
+
+    每个 user 消息开始新的一轮，随后的 assistant、tool 消息归入同一轮，
+    因此 user/assistant 和 tool_call/tool_result 总是在同一组中。
+
+    Returns:
+        List[Tuple[int, int]]: 每轮的 [start, end) 下标
+    """
+    turns = []
+    start = 0
+    for i, msg in enumerate(messages):
+        if msg.role == "user" and i > start:
+            turns.append((start, i))
+            start = i
+    if start < len(messages):
+        turns.append((start, len(messages)))
+    return turns
+
+
+def pack_history(messages: List[Message], budget: int, tokenizer: Tokenizer) -> List[Message]:
+    """在token预算内选择总优先级最高的轮次
+
+    以轮次为单位，按 优先级之和/token数 从高到低贪心选择（密度相同时优先较新的轮次），
+    最新的一轮总是保留。复杂度 O(n log n)，n 为消息数。
+
+    Args:
+        messages: 历史消息（不含系统提示）
+        budget: token预算
+        tokenizer: token计数器
+
+    Returns:
+        List[Message]: 按原顺序排列的选中消息
+    """
+    turns = group_turns(messages)
+    if not turns:
+        return []
+
+    costs = []
+    values = []
+    for start, end in turns:
+        costs.append(sum(tokenizer.count_message(messages[i]) for i in range(start, end)))
+        values.append(sum(messages[i].priority for i in range(start, end)))
+
+    latest = len(turns) - 1
+    keep = [False] * len(turns)
+    keep[latest] = True
+    remaining = budget - costs[latest]
+
+    order = sorted(
+        range(latest),
+        key=lambda t: (values[t] / max(costs[t], 1), t),
+        reverse=True
+    )
+    for t in order:
+        if remaining <= 0:
+            break
+        if costs[t] <= remaining and values[t] > 0:
+            keep[t] = True
+            remaining -= costs[t]
+
+    selected = []
+    for t, (start, end) in enumerate(turns):
+        if keep[t]:
+            selected.extend(messages[start:end])
+    return selected
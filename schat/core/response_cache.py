@@ -0,0 +1,170 @@
+import hashlib
+import json
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Optional, Tuple
+from .message import Message
+
+
+def _json_default(obj: Any) -> Any:
+    """序列化请求中的SDK对象，无法转换时使用repr（默认repr含对象地址，只会降低命中率，不会误命中）"""
+    for attr in ("model_dump", "to_dict"):
+        method = getattr(obj, attr, None)
+        if callable(method):
+            try:
+                return method()
+            except TypeError:
+                pass
+    if isinstance(obj, (set, frozenset)):
+        return sorted(obj, key=repr)
+    if isinstance(obj, bytes):
+        return hashlib.sha256(obj).hexdigest()
+    return repr(obj)
+
+
+def request_key(payload: Any) -> str:
+    """请求的稳定哈希，字典按key排序"""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=_json_default)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """响应缓存
+
+    以转换后的完整请求（模型、消息、工具、采样参数）的哈希为key，
+    内存中按条目数LRU淘汰，可选使用SQLite文件持久化；两者都按 ttl 过期。
+
+    默认只缓存 temperature 为0的请求：采样请求每次的回复本应不同，缓存后
+    会一直返回同一个回复。确实需要缓存采样请求时传入 deterministic_only=False。
+    """
+
+    def __init__(self,
+                 max_entries: int = 1024,
+                 ttl: Optional[float] = None,
+                 path: Optional[str] = None,
+                 deterministic_only: bool = True):
+        """
+        Args:
+            max_entries: 内存中保留的最大条目数
+            ttl: 过期时间（秒），None 表示不过期
+            path: SQLite文件路径，None 表示只使用内存
+            deterministic_only: 为True时只缓存 temperature 为0的请求（未设置 temperature 的请求不缓存），
+                为False时缓存所有请求
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.deterministic_only = deterministic_only
+        self._lock = Lock()
+        # key -> (过期时间, 序列化的消息)
+        self._entries: "OrderedDict[str, Tuple[Optional[float], str]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, expires_at REAL)"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+
+    def cacheable(self, request_kwargs: Dict) -> bool:
+        """请求是否可以缓存"""
+        if not self.deterministic_only:
+            return True
+        return request_kwargs.get("temperature") == 0
+
+    def get(self, key: str) -> Optional[Message]:
+        """获取缓存的响应，每次返回新的 Message"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] is not None and entry[0] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT expires_at, value FROM responses WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (key, now)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1])
+                    self._remember(key, entry)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.bytes_saved += len(entry[1].encode("utf-8"))
+        data = json.loads(entry[1])
+        data.pop("timestamp", None)  # 命中时作为新的回复
+        data.pop("usage", None)  # 命中时没有发送请求，不产生用量
+        return Message.from_dict(data)
+
+    def put(self, key: str, message: Message):
+        """保存响应"""
+        value = json.dumps(message.to_dict(), ensure_ascii=False, default=_json_default)
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._remember(key, (expires_at, value))
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, created_at, expires_at) VALUES (?, ?, ?, ?)",
+                    (key, value, now, expires_at)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, entry: Tuple[Optional[float], str]):
+        """写入内存LRU，调用方需持有锁"""
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def purge_expired(self) -> int:
+        """删除已过期的条目，返回SQLite中删除的条数"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, (expires_at, _) in self._entries.items()
+                        if expires_at is not None and expires_at <= now]:
+                del self._entries[key]
+            if self._db is None:
+                return 0
+            cursor = self._db.execute(
+                "DELETE FROM responses WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+            )
+            self._db.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        """清空缓存和统计"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM responses")
+                self._db.commit()
+            self.hits = self.misses = self.bytes_saved = 0
+
+    def close(self):
+        """关闭SQLite连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, float]:
+        """获取命中率等统计"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / total if total else 0.0,
+                "bytes_saved": self.bytes_saved,
+                "entries": len(self._entries),
+            }
@@ -1,7 +1,14 @@
-from typing import List, Dict, Optional, Union, Generator, Any
+from typing import List, Dict, Optional, Union, Any, Tuple
 from dataclasses import asdict
 import json
 from .message import Message
+from .batch import BatchExecutor, BatchResult, default_executor
+from .tokenizer import Tokenizer, get_tokenizer, select_recent_within_budget
+from .packing import pack_history
+from .streaming import StreamingResponse
+from .journal import SessionJournal, is_journal, read_journal
+from .usage import PriceTable, UsageTracker, get_usage_tracker
+import time
 from ..models.factory import ModelFactory
 from ..models.base import Model
 
@@ -11,16 +18,35 @@ class ChatSession:
     def __init__(self, 
                  default_model: Union[str, Model, None] = None,
                  stream: bool = False,
-                 max_history_token: int = 0):
+                 max_history_token: int = 0,
+                 tokenizer: Union[str, Tokenizer, None] = None,
+                 history_strategy: str = "recent"):
+        """
+        Args:
+            default_model: 默认模型，可以是模型实例或 'provider:model' 字符串
+            stream: 是否默认使用流式响应
+            max_history_token: 每次发送的历史消息（含系统提示）的token上限，0表示不限制
+            tokenizer: token计数器或其名称，默认使用本地估算
+            history_strategy: 超出预算时的选择策略，'recent' 保留最近的消息，
+                'priority' 按消息优先级选择轮次
+        """
         self.history: List[Message] = []
         self.default_model = default_model
         self.system_prompt: Optional[str] = None
+        self._system_message: Optional[Message] = None
         self.max_history_token = max_history_token
         self.stream = stream
+        self.tokenizer = tokenizer if isinstance(tokenizer, Tokenizer) else get_tokenizer(tokenizer)
+        if history_strategy not in ("recent", "priority"):
+            raise ValueError(f"Unknown history strategy: {history_strategy}")
+        self.history_strategy = history_strategy
+        self.journal: Optional[SessionJournal] = None
+        self.history_offset = 0  # history[0] 在完整历史中的位置，只加载了最近的窗口时大于0
         
     def set_system_prompt(self, text: str):
         """设置系统提示"""
         self.system_prompt = text
+        self._sync_journal()
         
     def add_user_message(self, 
                         text: str,
@@ -55,6 +81,42 @@ class ChatSession:
     def add_message(self, message: Message):
         """添加消息到历史记录"""
         self.history.append(message)
+        self._sync_journal()
+        
+    def open_journal(self, path: str, **options) -> SessionJournal:
+        """使用追加写入的会话日志持久化会话
+        
+        文件已存在时先从中加载会话，之后每条新消息追加写入，流式回复的chunk收到即写入
+        
+        Args:
+            path: 日志文件路径
+            **options: SessionJournal 的参数（fsync、fsync_interval、compact_min_records）
+        """
+        self.close_journal()
+        journal = SessionJournal(path, **options)
+        journal.open(self)
+        self.journal = journal
+        return journal
+        
+    def close_journal(self):
+        """关闭会话日志"""
+        if self.journal is not None:
+            self.journal.close()
+            self.journal = None
+        
+    def load_older(self, count: int) -> int:
+        """从会话存储中把更早的 count 条消息加载到历史记录开头
+        
+        Returns:
+            int: 实际加载的条数，没有更早的消息时为0
+        """
+        if self.journal is None or self.history_offset == 0:
+            return 0
+        return self.journal.load_older(self, count)
+        
+    def _sync_journal(self):
+        if self.journal is not None:
+            self.journal.sync(self)
         
     def send(self,
              text: str,
@@ -63,8 +125,73 @@ class ChatSession:
              tools: Optional[List[Dict]] = None,
              priority: float = 1.0,
              stream: Optional[bool] = None,
-             **kwargs) -> Union[Message, Generator[str, None, None]]:
-        """发送消息并获取响应"""
+             **kwargs) -> Union[Message, StreamingResponse]:
+        """发送消息并获取响应
+        
+        流式响应返回 StreamingResponse，流结束或被关闭时回复会加入历史记录；
+        传入 hedge=True 或 HedgePolicy 时使用对冲请求，cache= 使用响应缓存，coalesce= 合并进行中的相同请求
+        """
+        current_model, history, model_kwargs = self._prepare_send(
+            text, model, files, tools, priority, stream, kwargs
+        )
+        
+        # 发送给模型
+        started_at = time.perf_counter()
+        response = current_model.send(history, **model_kwargs)
+        
+        if not isinstance(response, (Message, StreamingResponse)):
+            response = StreamingResponse(response, started_at=started_at)
+        return self._finish_send(response)
+        
+    def send_many(self,
+                  items: List[Union[str, List[Message]]],
+                  model: Union[str, Model, None] = None,
+                  executor: Optional[BatchExecutor] = None,
+                  **kwargs) -> List[BatchResult]:
+        """并发发送一批相互独立的请求
+        
+        每条请求都基于当前的系统提示和历史记录，但结果不会写入历史。
+        
+        Args:
+            items: 字符串（作为新的用户消息）或完整的消息列表
+            model: 使用的模型，默认使用会话的默认模型
+            executor: 批量执行器，默认使用进程共享的执行器
+            **kwargs: 传给模型的其他参数
+            
+        Returns:
+            List[BatchResult]: 与输入顺序一致的结果
+        """
+        current_model = self._get_model(model)
+        executor = executor or default_executor
+        return executor.run(current_model, self._batch_requests(items), **kwargs)
+        
+    def _batch_requests(self, items: List[Union[str, List[Message]]]) -> List[List[Message]]:
+        """把批量输入转换为每条请求的消息列表"""
+        history = self._get_history()
+        requests = []
+        for item in items:
+            if isinstance(item, str):
+                requests.append(history + [Message(role="user", text=item)])
+            else:
+                messages = list(item)
+                if self.system_prompt and not (messages and messages[0].role == "system"):
+                    messages.insert(0, self._get_system_message())
+                requests.append(messages)
+        return requests
+        
+    def _prepare_send(self,
+                      text: str,
+                      model: Union[str, Model, None],
+                      files: Optional[List[str]],
+                      tools: Optional[List[Dict]],
+                      priority: float,
+                      stream: Optional[bool],
+                      kwargs: Dict) -> Tuple[Model, List[Message], Dict]:
+        """记录用户消息并准备发送参数，同步和异步会话共用
+        
+        Returns:
+            Tuple[Model, List[Message], Dict]: 模型实例、历史消息、模型参数
+        """
         # 获取当前模型
         current_model = self._get_model(model)
         
@@ -76,7 +203,11 @@ class ChatSession:
             tool_calls=tools,
             priority=priority
         )
-        self.add_message(user_message)
+        if self.journal is not None and self.journal.atomic_turns:
+            # 用户消息与回复在同一次同步中保存
+            self.history.append(user_message)
+        else:
+            self.add_message(user_message)
         
         # 准备发送给模型的参数
         model_kwargs = kwargs.copy()
@@ -90,48 +221,49 @@ class ChatSession:
             model_kwargs["stream"] = True
         
         # 获取历史消息
-        history = self._get_history()
+        return current_model, self._get_history(), model_kwargs
         
-        # 发送给模型
-        response = current_model.send(history, **model_kwargs)
-        
-        # 处理响应
-        if isinstance(response, Generator):
-            return response
-        else:
+    def _finish_send(self, response: Any) -> Any:
+        """处理模型响应，普通响应直接添加到历史记录，流式响应在结束时添加"""
+        if isinstance(response, Message):
             self.add_message(response)
-            return response
+        else:
+            if self.journal is not None:
+                self.journal.track_stream(response)
+            response.add_done_callback(self.add_message)
+        return response
         
     def _prepare_messages(self) -> List[Message]:
         """准备发送给模型的消息列表"""
         messages = []
         if self.system_prompt:
-            messages.append(Message(role="system", text=self.system_prompt))
+            messages.append(self._get_system_message())
         messages.extend(self.history)
         return messages
         
     def save(self, path: str):
-        """保存会话到文件"""
-        data = {
+        """保存会话到文件（完整重写，频繁保存时使用 open_journal）"""
+        data = self._state()
+        data["history"] = [msg.to_dict() for msg in self.history]
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+            
+    def _state(self) -> Dict[str, Any]:
+        """历史记录以外的会话设置"""
+        return {
             "system_prompt": self.system_prompt,
-            "history": [
-                {
-                    "role": msg.role,
-                    "text": msg.text,
-                    "priority": msg.priority,
-                    "files": msg.files,
-                    "timestamp": msg.timestamp,
-                    "tool_calls": msg.tool_calls,
-                    "tool_call_id": msg.tool_call_id,
-                    "name": msg.name
-                } for msg in self.history
-            ],
             "max_history_token": self.max_history_token,
+            "history_strategy": self.history_strategy,
             "stream": self.stream,
             "default_model": self._serialize_model(self.default_model)
         }
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        
+    def _apply_state(self, data: Dict[str, Any]):
+        self.system_prompt = data["system_prompt"]
+        self.max_history_token = data["max_history_token"]
+        self.history_strategy = data.get("history_strategy", "recent")
+        self.stream = data.get("stream", False)
+        self.default_model = self._deserialize_model(data["default_model"])
             
     def _serialize_model(self, model: Union[str, Model, None]) -> Optional[str]:
         """序列化模型对象"""
@@ -163,14 +295,19 @@ class ChatSession:
         return None
         
     def load(self, path: str):
-        """从文件加载会话"""
-        with open(path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-        self.system_prompt = data["system_prompt"]
-        self.max_history_token = data["max_history_token"]
-        self.stream = data.get("stream", False)
-        self.default_model = self._deserialize_model(data["default_model"])
-        self.history = [Message(**msg) for msg in data["history"]]
+        """从文件加载会话，支持 save 保存的文件和会话日志"""
+        if is_journal(path):
+            meta, history, _, _ = read_journal(path)
+            if meta is not None:
+                self._apply_state(meta)
+            self.history = history
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self._apply_state(data)
+            self.history = [Message.from_dict(msg) for msg in data["history"]]
+        self.history_offset = 0
+        self._sync_journal()
         
     def get_current_round(self) -> int:
         """获取当前轮次"""
@@ -180,13 +317,17 @@ class ChatSession:
         """保留最近n轮对话"""
         if n * 2 < len(self.history):
             self.history = self.history[-n*2:]
+            self._sync_journal()
             
     def set_priority(self, round_num: int, priority: float):
         """设置某轮对话的优先级"""
         if 0 <= round_num < self.get_current_round():
             idx = round_num * 2
             self.history[idx].priority = priority
-            self.history[idx + 1].priority = priority 
+            self.history[idx + 1].priority = priority
+            if self.journal is not None:
+                self.journal.record_update(idx, self.history[idx])
+                self.journal.record_update(idx + 1, self.history[idx + 1])
         
     def add_tool_message(self, tool_result: Any, tool_call_id: str):
         """添加工具调用结果消息
@@ -239,10 +380,49 @@ class ChatSession:
     def _get_history(self) -> List[Message]:
         """获取历史消息列表
         
+        设置了 max_history_token 时只选择预算内的消息（按 history_strategy），
+        系统提示和最新的消息总是保留
+        
         Returns:
             List[Message]: 历史消息列表，如果有系统提示会添加到开头
         """
-        history = self.history.copy()
+        if self.max_history_token > 0:
+            budget = self.max_history_token
+            if self.system_prompt:
+                budget -= self.tokenizer.count_message(self._get_system_message())
+            if self.history_strategy == "priority":
+                history = pack_history(self.history, budget, self.tokenizer)
+            else:
+                history = select_recent_within_budget(self.history, budget, self.tokenizer)
+        else:
+            history = self.history.copy()
         if self.system_prompt:
-            history.insert(0, Message(role="system", text=self.system_prompt))
-        return history
\ No newline at end of file
+            history.insert(0, self._get_system_message())
+        return history
+        
+    def count_tokens(self) -> int:
+        """估算完整历史（含系统提示）的token数"""
+        messages = self._prepare_messages()
+        return sum(self.tokenizer.count_message(msg) for msg in messages)
+        
+    def get_usage(self, prices: Optional[PriceTable] = None) -> UsageTracker:
+        """汇总历史中所有回复的token用量和费用，使用日志或数据库时只统计已加载的历史
+        
+        Args:
+            prices: 价格表，默认使用进程共享用量统计的价格表
+            
+        Returns:
+            UsageTracker: total() 为合计，by_model() 按模型汇总
+        """
+        tracker = UsageTracker(prices if prices is not None else get_usage_tracker().prices)
+        for msg in self.history:
+            usage = msg.usage
+            if usage is not None:
+                tracker.record(usage, usage.provider, usage.model)
+        return tracker
+        
+    def _get_system_message(self) -> Message:
+        """获取系统提示消息，复用同一个实例以便其转换结果可以被缓存"""
+        if self._system_message is None or self._system_message.text != self.system_prompt:
+            self._system_message = Message(role="system", text=self.system_prompt)
+        return self._system_message
\ No newline at end of file
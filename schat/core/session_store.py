@@ -0,0 +1,262 @@
+import json
+import sqlite3
+import time
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+from .message import Message
+from .session import ChatSession
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sessions ("
+    "session_id TEXT PRIMARY KEY, state TEXT NOT NULL, message_count INTEGER NOT NULL, "
+    "created_at REAL NOT NULL, updated_at REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions (updated_at)",
+    "CREATE TABLE IF NOT EXISTS messages ("
+    "session_id TEXT NOT NULL, position INTEGER NOT NULL, role TEXT NOT NULL, "
+    "timestamp REAL NOT NULL, tokens INTEGER NOT NULL, data TEXT NOT NULL, "
+    "PRIMARY KEY (session_id, position))",
+    "CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages (timestamp)",
+)
+
+
+class SessionStore:
+    """使用SQLite保存大量会话
+
+    消息按 (session_id, position) 存储，打开会话时可以只加载最近的窗口，
+    更早的消息通过 ChatSession.load_older 按需加载。
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: SQLite文件路径，':memory:' 表示只使用内存
+        """
+        self.path = path
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            self._db.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._db.execute(statement)
+        self._db.commit()
+
+    def open(self,
+             session_id: str,
+             session: Optional[ChatSession] = None,
+             tail: Optional[int] = None,
+             max_tokens: Optional[int] = None) -> ChatSession:
+        """打开会话，之后新增的消息自动保存
+
+        Args:
+            session_id: 会话ID，不存在时创建
+            session: 要绑定的会话对象，默认创建新的 ChatSession；会话已存在时其设置和历史会被覆盖
+            tail: 只加载最近的 tail 条消息
+            max_tokens: 只加载最近的、token数（按保存时的tokenizer计算）不超过预算的消息，
+                最新的一条总是加载，窗口从用户消息开始
+
+        Returns:
+            ChatSession: 绑定到该会话的 ChatSession
+        """
+        session = session or ChatSession()
+        session.close_journal()
+        with self._lock:
+            row = self._db.execute(
+                "SELECT state, message_count FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                journal = StoreJournal(self, session_id, 0, exists=False)
+            else:
+                session._apply_state(json.loads(row[0]))
+                start = self._window_start(session_id, row[1], tail, max_tokens)
+                session.history = self._read(session_id, start, row[1])
+                session.history_offset = start
+                journal = StoreJournal(self, session_id, row[1], exists=True)
+                journal._state = json.loads(row[0])
+                journal._last = session.history[-1] if session.history else None
+                journal._offset = start
+        session.journal = journal
+        # 新建会话时保存已有的设置和历史
+        journal.sync(session)
+        return session
+
+    def _window_start(self, session_id: str, count: int,
+                      tail: Optional[int], max_tokens: Optional[int]) -> int:
+        """计算加载窗口的起始位置，调用方需持有锁"""
+        start = 0
+        if tail is not None:
+            start = max(count - tail, 0)
+        if max_tokens is not None:
+            # 从最新的消息向前扫描，只读取窗口附近的行
+            cursor = self._db.execute(
+                "SELECT position, role, tokens FROM messages WHERE session_id = ? AND position >= ? "
+                "ORDER BY position DESC", (session_id, start)
+            )
+            used = 0
+            rows: List[Tuple[int, str]] = []
+            for position, role, tokens in cursor:
+                if rows and used + tokens > max_tokens:
+                    break
+                used += tokens
+                rows.append((position, role))
+            cursor.close()
+            rows.reverse()
+            while len(rows) > 1 and rows[0][1] != "user":
+                rows.pop(0)
+            start = rows[0][0] if rows else count
+        return start
+
+    def _read(self, session_id: str, start: int, end: int) -> List[Message]:
+        """读取 [start, end) 位置的消息，调用方需持有锁"""
+        rows = self._db.execute(
+            "SELECT data FROM messages WHERE session_id = ? AND position >= ? AND position < ? "
+            "ORDER BY position", (session_id, start, end)
+        ).fetchall()
+        return [Message.from_dict(json.loads(row[0])) for row in rows]
+
+    def read_messages(self, session_id: str, start: int = 0, end: Optional[int] = None) -> List[Message]:
+        """读取会话中 [start, end) 位置的消息"""
+        with self._lock:
+            if end is None:
+                end = self._message_count(session_id)
+            return self._read(session_id, start, end)
+
+    def _message_count(self, session_id: str) -> int:
+        row = self._db.execute(
+            "SELECT message_count FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def list_sessions(self,
+                      limit: int = 100,
+                      offset: int = 0,
+                      updated_before: Optional[float] = None) -> List[Dict[str, Any]]:
+        """按最近更新时间倒序列出会话
+
+        Returns:
+            List[Dict]: 每个会话的 session_id、message_count、created_at、updated_at
+        """
+        query = "SELECT session_id, message_count, created_at, updated_at FROM sessions"
+        params: List[Any] = []
+        if updated_before is not None:
+            query += " WHERE updated_at < ?"
+            params.append(updated_before)
+        query += " ORDER BY updated_at DESC LIMIT ? OFFSET ?"
+        params.extend([limit, offset])
+        with self._lock:
+            rows = self._db.execute(query, params).fetchall()
+        return [
+            {"session_id": r[0], "message_count": r[1], "created_at": r[2], "updated_at": r[3]}
+            for r in rows
+        ]
+
+    def delete(self, *session_ids: str) -> int:
+        """删除会话及其消息，返回删除的会话数"""
+        if not session_ids:
+            return 0
+        with self._lock, self._db:
+            params = [(sid,) for sid in session_ids]
+            self._db.executemany("DELETE FROM messages WHERE session_id = ?", params)
+            before = self._db.total_changes
+            self._db.executemany("DELETE FROM sessions WHERE session_id = ?", params)
+            return self._db.total_changes - before
+
+    def delete_inactive(self, updated_before: float) -> int:
+        """删除最后更新时间早于 updated_before 的会话，返回删除的会话数"""
+        with self._lock, self._db:
+            self._db.execute(
+                "DELETE FROM messages WHERE session_id IN "
+                "(SELECT session_id FROM sessions WHERE updated_at < ?)", (updated_before,)
+            )
+            return self._db.execute(
+                "DELETE FROM sessions WHERE updated_at < ?", (updated_before,)
+            ).rowcount
+
+    def close(self):
+        """关闭SQLite连接"""
+        with self._lock:
+            self._db.close()
+
+
+class StoreJournal:
+    """SessionStore 中一个会话的日志，由 SessionStore.open 绑定到 ChatSession，接口与 SessionJournal 相同
+
+    每次同步在一个事务中写入新增的消息和会话设置；用户消息和模型回复一起保存。
+    """
+
+    atomic_turns = True
+
+    def __init__(self, store: SessionStore, session_id: str, count: int, exists: bool):
+        self.store = store
+        self.session_id = session_id
+        self._count = count  # 已保存的消息数，即下一条消息的 position
+        self._offset = 0  # 内存中第一条消息的 position
+        self._exists = exists
+        self._state: Optional[Dict[str, Any]] = None
+        self._last: Optional[Message] = None  # 最后保存的消息，用于发现历史被替换
+
+    def sync(self, session: ChatSession):
+        """在一个事务中保存会话设置的变化和新增的消息"""
+        store = self.store
+        state = session._state()
+        history = session.history
+        offset = session.history_offset
+        saved = self._count - offset  # 内存中已保存的消息数
+        now = time.time()
+        replaced = saved < 0 or saved > len(history) or (saved and history[saved - 1] is not self._last)
+        with store._lock, store._db:
+            db = store._db
+            if replaced:
+                # 历史记录被替换，重新保存
+                db.execute("DELETE FROM messages WHERE session_id = ?", (self.session_id,))
+                self._count = offset = session.history_offset = 0
+                saved = 0
+            new = history[saved:]
+            if new:
+                db.executemany(
+                    "INSERT INTO messages (session_id, position, role, timestamp, tokens, data) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(self.session_id, self._count + i, m.role, m.timestamp,
+                      session.tokenizer.count_message(m), json.dumps(m.to_dict(), ensure_ascii=False))
+                     for i, m in enumerate(new)]
+                )
+            if not self._exists:
+                db.execute(
+                    "INSERT INTO sessions (session_id, state, message_count, created_at, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (self.session_id, json.dumps(state, ensure_ascii=False), len(history), now, now)
+                )
+            elif new or replaced or state != self._state:
+                db.execute(
+                    "UPDATE sessions SET state = ?, message_count = ?, updated_at = ? WHERE session_id = ?",
+                    (json.dumps(state, ensure_ascii=False), offset + len(history), now, self.session_id)
+                )
+        self._exists = True
+        self._state = state
+        self._offset = offset
+        self._count = offset + len(history)
+        self._last = history[-1] if history else None
+
+    def track_stream(self, response):
+        """流式回复在结束时与用户消息一起保存，不逐chunk写入"""
+
+    def record_update(self, index: int, message: Message):
+        """更新被原地修改的消息，index 为内存中历史记录的下标"""
+        if self._offset + index >= self._count:
+            return  # 还没有保存，下次同步时写入
+        with self.store._lock, self.store._db:
+            self.store._db.execute(
+                "UPDATE messages SET data = ? WHERE session_id = ? AND position = ?",
+                (json.dumps(message.to_dict(), ensure_ascii=False), self.session_id, self._offset + index)
+            )
+
+    def load_older(self, session: ChatSession, count: int) -> int:
+        """把更早的 count 条消息加载到历史记录开头，返回实际加载的条数"""
+        start = max(session.history_offset - count, 0)
+        with self.store._lock:
+            older = self.store._read(self.session_id, start, session.history_offset)
+        session.history[:0] = older
+        session.history_offset = self._offset = start
+        return len(older)
+
+    def close(self):
+        """数据已在每次同步时提交，无需处理"""
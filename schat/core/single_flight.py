@@ -0,0 +1,297 @@
+import asyncio
+import weakref
+from threading import Event, Lock
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from .message import Message
+from .usage import Usage
+
+
+def _copy_message(message: Message) -> Message:
+    """跟随者得到独立的消息副本，避免多个会话共享同一个对象
+
+    只有领导者发送了请求，副本不带用量，避免重复计费
+    """
+    copy = Message.from_dict(message.to_dict())
+    copy.usage = None
+    return copy
+
+
+def _share_usage(usage: Optional[Usage], shared: Optional[Usage]):
+    """流结束时把领导者的用量复制到跟随者的用量上，跟随者的用量不计入用量统计"""
+    if usage is None or shared is None or usage is shared:
+        return
+    usage.merge(shared)
+    usage.provider = shared.provider
+    usage.model = shared.model
+
+
+class _Tee:
+    """线程安全的流复制：任意一个消费者按需从上游读取，读到的chunk对所有消费者可见
+
+    所有消费者都提前结束时关闭上游；上游结束后调用 on_done。
+    usage 是领导者的流式用量，上游结束时复制给每个消费者的用量。
+    """
+
+    def __init__(self, upstream: Iterator[str], on_done: Callable[[], None], usage: Optional[Usage] = None):
+        self._upstream = upstream
+        self._on_done = on_done
+        self.usage = usage
+        self._buffer: List[str] = []
+        self._lock = Lock()
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._consumers = 0
+
+    def consumer(self, usage: Optional[Usage] = None) -> Iterator[str]:
+        with self._lock:
+            self._consumers += 1
+        return self._iterate(usage)
+
+    def _pull(self, index: int) -> bool:
+        """确保 index 处有chunk，流已结束时返回False，调用方需持有锁"""
+        if index < len(self._buffer):
+            return True
+        if self._error is not None:
+            raise self._error
+        if self._done:
+            return False
+        try:
+            self._buffer.append(next(self._upstream))
+            return True
+        except StopIteration:
+            self._done = True
+            return False
+        except BaseException as e:
+            self._error = e
+            self._done = True
+            raise
+
+    def _iterate(self, usage: Optional[Usage]) -> Iterator[str]:
+        index = 0
+        finished = False
+        try:
+            while True:
+                if index >= len(self._buffer):
+                    try:
+                        with self._lock:
+                            available = self._pull(index)
+                    finally:
+                        if self._done and not finished:
+                            finished = True
+                            self._on_done()
+                    if not available:
+                        _share_usage(usage, self.usage)
+                        return
+                yield self._buffer[index]
+                index += 1
+        finally:
+            with self._lock:
+                self._consumers -= 1
+                abandoned = self._consumers == 0 and not self._done
+                if abandoned:
+                    self._done = True
+            if abandoned:
+                # 所有消费者都提前结束，关闭上游
+                close = getattr(self._upstream, "close", None)
+                if close is not None:
+                    close()
+                self._on_done()
+
+
+class _AsyncTee:
+    """_Tee 的异步版本"""
+
+    def __init__(self, upstream: AsyncIterator[str], on_done: Callable[[], None], usage: Optional[Usage] = None):
+        self._upstream = upstream
+        self._on_done = on_done
+        self.usage = usage
+        self._buffer: List[str] = []
+        self._lock = asyncio.Lock()
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._consumers = 0
+
+    def consumer(self, usage: Optional[Usage] = None) -> AsyncIterator[str]:
+        self._consumers += 1
+        return self._iterate(usage)
+
+    async def _pull(self, index: int) -> bool:
+        """确保 index 处有chunk，流已结束时返回False，调用方需持有锁"""
+        if index < len(self._buffer):
+            return True
+        if self._error is not None:
+            raise self._error
+        if self._done:
+            return False
+        try:
+            self._buffer.append(await self._upstream.__anext__())
+            return True
+        except StopAsyncIteration:
+            self._done = True
+            return False
+        except BaseException as e:
+            self._error = e
+            self._done = True
+            raise
+
+    async def _iterate(self, usage: Optional[Usage]) -> AsyncIterator[str]:
+        index = 0
+        finished = False
+        try:
+            while True:
+                if index >= len(self._buffer):
+                    try:
+                        async with self._lock:
+                            available = await self._pull(index)
+                    finally:
+                        if self._done and not finished:
+                            finished = True
+                            self._on_done()
+                    if not available:
+                        _share_usage(usage, self.usage)
+                        return
+                yield self._buffer[index]
+                index += 1
+        finally:
+            self._consumers -= 1
+            if self._consumers == 0 and not self._done:
+                self._done = True
+                aclose = getattr(self._upstream, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                self._on_done()
+
+
+class _Call:
+    """一次进行中的请求"""
+
+    def __init__(self):
+        self.event = Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.tee: Optional[_Tee] = None
+
+
+class SingleFlight:
+    """合并进行中的相同请求
+
+    同一个key的请求进行中时，后来的请求（跟随者）不再发送，而是等待第一个请求（领导者）的结果；
+    流式请求的跟随者得到领导者chunk的副本（包括加入前已经收到的部分）。
+    同步和异步请求分别合并；领导者的流没有读取就被回收时，之后的请求不再合并到它。
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._calls: Dict[str, _Call] = {}
+        # 事件循环 -> {key -> Future}，事件循环被回收后随之释放
+        self._async_calls: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Future]]" = \
+            weakref.WeakKeyDictionary()
+        self.leaders = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any], usage: Optional[Usage] = None) -> Any:
+        """执行 fn 或等待进行中的相同请求
+
+        Args:
+            key: 请求的哈希
+            fn: 发送请求的函数，返回 Message 或文本chunk的迭代器
+            usage: 调用方的流式用量，领导者的 fn 向其中记录用量，跟随者在流结束时得到相同的用量
+
+        Returns:
+            Message 或文本chunk的迭代器，跟随者得到副本
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            if call.tee is not None:
+                return call.tee.consumer(usage)
+            return _copy_message(call.result)
+
+        try:
+            result = fn()
+        except BaseException as e:
+            call.error = e
+            self._forget(key, call)
+            call.event.set()
+            raise
+        if isinstance(result, Message):
+            call.result = result
+            self._forget(key, call)
+            call.event.set()
+            return result
+        # 流式请求在流结束前都可以被合并
+        call.tee = _Tee(iter(result), lambda: self._forget(key, call), usage)
+        consumer = call.tee.consumer()
+        # 没有读取的生成器被回收时不会执行 finally，由回收回调结束合并
+        weakref.finalize(consumer, self._forget, key, call)
+        call.event.set()
+        return consumer
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]], usage: Optional[Usage] = None) -> Any:
+        """do 的异步版本，fn 返回 Message 或文本chunk的异步迭代器"""
+        # Future与事件循环绑定，不同事件循环的请求分别合并
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            calls = self._async_calls.setdefault(loop, {})
+            future = calls.get(key)
+            if future is None:
+                future = calls[key] = loop.create_future()
+                self.leaders += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            kind, value = await asyncio.shield(future)
+            if kind == "stream":
+                return value.consumer(usage)
+            return _copy_message(value)
+
+        def forget():
+            with self._lock:
+                if calls.get(key) is future:
+                    del calls[key]
+
+        try:
+            result = await fn()
+        except BaseException as e:
+            forget()
+            future.set_exception(e)
+            # 没有跟随者时避免 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        if isinstance(result, Message):
+            forget()
+            future.set_result(("message", result))
+            return result
+        tee = _AsyncTee(result, forget, usage)
+        consumer = tee.consumer()
+        weakref.finalize(consumer, forget)
+        future.set_result(("stream", tee))
+        return consumer
+
+    def _forget(self, key: str, call: _Call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        """领导者请求数和被合并的请求数"""
+        with self._lock:
+            return {
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "in_flight": len(self._calls) + sum(len(calls) for calls in self._async_calls.values()),
+            }
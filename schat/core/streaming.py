@@ -0,0 +1,189 @@
+import time
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Optional
+from .message import Message
+from .usage import Usage
+
+
+class _StreamRecorder:
+    """流式响应的公共部分：累积文本、记录时间、完成时生成消息"""
+
+    def __init__(self, started_at: Optional[float] = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.gaps: List[float] = []
+        self.message: Optional[Message] = None
+        self.error: Optional[BaseException] = None
+        self._chunks: List[str] = []
+        self._started = False
+        self._last_at: Optional[float] = None
+        self._done_callbacks: List[Callable[[Message], None]] = []
+        self._chunk_callbacks: List[Callable[[str], None]] = []
+        self.timings: Optional[Dict[str, float]] = None  # 注册了请求钩子时由模型设置
+        self.usage: Optional[Usage] = None  # provider返回用量时由模型设置，流结束前随chunk更新
+
+    def _record(self, chunk: str):
+        now = time.perf_counter()
+        if self.first_token_at is None:
+            self.first_token_at = now
+        else:
+            self.gaps.append(now - self._last_at)
+        self._last_at = now
+        self._chunks.append(chunk)
+        for callback in self._chunk_callbacks:
+            callback(chunk)
+
+    def _finish(self, error: Optional[BaseException] = None):
+        if self.finished_at is not None:
+            return
+        self.finished_at = time.perf_counter()
+        if error is not None:
+            # 出错时不生成消息，已收到的内容仍可以通过 text 获取
+            self.error = error
+            return
+        self.message = Message(role="assistant", text=self.text)
+        self.message.timings = self.timings
+        self.message.usage = self.usage or None
+        for callback in self._done_callbacks:
+            callback(self.message)
+
+    def _close_unstarted(self):
+        """关闭还没有开始读取的流：标记为结束，但不生成消息，也不通知完成回调"""
+        if not self._started and self.finished_at is None:
+            self.finished_at = time.perf_counter()
+
+    def add_done_callback(self, callback: Callable[[Message], None]):
+        """注册完成回调，流结束或读取中被关闭时以最终消息调用"""
+        if self.message is not None:
+            callback(self.message)
+        else:
+            self._done_callbacks.append(callback)
+
+    def add_chunk_callback(self, callback: Callable[[str], None]):
+        """注册chunk回调，之后收到的每个chunk都会调用"""
+        self._chunk_callbacks.append(callback)
+
+    @property
+    def text(self) -> str:
+        """目前为止收到的全部文本"""
+        if len(self._chunks) > 1:
+            self._chunks[:] = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+    @property
+    def done(self) -> bool:
+        """流是否已结束（完成、关闭或出错）"""
+        return self.finished_at is not None
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        """从发送请求到收到第一个chunk的秒数"""
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started_at
+
+    @property
+    def duration(self) -> Optional[float]:
+        """从发送请求到流结束的秒数"""
+        if self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def metrics(self) -> Dict[str, Optional[float]]:
+        """获取延迟统计"""
+        return {
+            "time_to_first_token": self.time_to_first_token,
+            "duration": self.duration,
+            "chunks": len(self.gaps) + (1 if self.first_token_at is not None else 0),
+            "mean_gap": sum(self.gaps) / len(self.gaps) if self.gaps else None,
+            "max_gap": max(self.gaps) if self.gaps else None,
+        }
+
+
+class StreamingResponse(_StreamRecorder):
+    """同步流式响应
+
+    可以像生成器一样迭代得到文本chunk；流结束或调用 close() 时
+    生成最终的 Message，并通知完成回调（ChatSession 借此把回复加入历史）。
+    没有开始读取就被关闭的流不生成消息
+    """
+
+    def __init__(self, chunks: Iterator[str], started_at: Optional[float] = None):
+        super().__init__(started_at)
+        self._gen = self._run(chunks)
+
+    def _run(self, chunks: Iterator[str]):
+        self._started = True
+        try:
+            for chunk in chunks:
+                self._record(chunk)
+                yield chunk
+        except GeneratorExit:
+            self._finish()
+            raise
+        except BaseException as e:
+            self._finish(e)
+            raise
+        self._finish()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        return next(self._gen)
+
+    def send(self, value):
+        return self._gen.send(value)
+
+    def throw(self, *args):
+        return self._gen.throw(*args)
+
+    def close(self):
+        """提前结束流，已收到的内容会作为最终消息；还没有开始读取的流不生成消息"""
+        self._gen.close()
+        self._close_unstarted()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AsyncStreamingResponse(_StreamRecorder):
+    """异步流式响应，用法同 StreamingResponse，使用 async for 迭代"""
+
+    def __init__(self, chunks: AsyncIterator[str], started_at: Optional[float] = None):
+        super().__init__(started_at)
+        self._gen = self._run(chunks)
+
+    async def _run(self, chunks: AsyncIterator[str]):
+        self._started = True
+        try:
+            async for chunk in chunks:
+                self._record(chunk)
+                yield chunk
+        except GeneratorExit:
+            self._finish()
+            raise
+        except BaseException as e:
+            self._finish(e)
+            raise
+        self._finish()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> str:
+        return await self._gen.__anext__()
+
+    async def aclose(self):
+        """提前结束流，已收到的内容会作为最终消息；还没有开始读取的流不生成消息"""
+        await self._gen.aclose()
+        self._close_unstarted()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.aclose()
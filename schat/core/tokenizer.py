@@ -0,0 +1,126 @@
+import json
+import math
+import mimetypes
+import os
+from typing import Callable, List, Optional
+from .message import Message
+
+# 每条消息的格式开销（role、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+# 图片按固定token数估算
+IMAGE_TOKENS = 765
+
+
+class Tokenizer:
+    """token计数器基类
+
+    子类实现 count_text；name 用于区分缓存，不同的计数方式必须使用不同的name
+    """
+
+    name = "base"
+
+    def count_text(self, text: str) -> int:
+        """统计文本的token数"""
+        raise NotImplementedError
+
+    def count_file(self, file_path: str) -> int:
+        """估算附件的token数"""
+        mime_type = mimetypes.guess_type(file_path)[0] or ""
+        if mime_type.startswith("image/") or file_path.startswith(('http://', 'https://')):
+            return IMAGE_TOKENS
+        try:
+            return math.ceil(os.path.getsize(file_path) / 4)
+        except OSError:
+            return IMAGE_TOKENS
+
+    def count_message(self, msg: Message) -> int:
+        """统计单条消息的token数，结果缓存在消息上"""
+        return msg.get_converted(f"tokens:{self.name}", self._count_message)
+
+    def _count_message(self, msg: Message) -> int:
+        tokens = MESSAGE_OVERHEAD_TOKENS
+        if msg.text:
+            tokens += self.count_text(msg.text)
+        for file_path in msg.files:
+            tokens += self.count_file(file_path)
+        if msg.tool_calls:
+            tokens += self.count_text(json.dumps(msg.tool_calls, ensure_ascii=False))
+        return tokens
+
+
+class HeuristicTokenizer(Tokenizer):
+    """快速的本地估算：ASCII字符约4个一个token，其他字符（如中文）每个约一个token"""
+
+    name = "heuristic"
+
+    def count_text(self, text: str) -> int:
+        ascii_chars = len(text.encode("ascii", "ignore"))
+        return math.ceil(ascii_chars / 4) + (len(text) - ascii_chars)
+
+
+class TiktokenTokenizer(Tokenizer):
+    """使用 tiktoken 精确计数，需要安装 tiktoken"""
+
+    def __init__(self, encoding: str = "cl100k_base"):
+        try:
+            import tiktoken
+        except ImportError:
+            raise ImportError(
+                "tiktoken package not installed. "
+                "Please install it with: pip install tiktoken"
+            )
+        self._encoding = tiktoken.get_encoding(encoding)
+        self.name = f"tiktoken:{encoding}"
+
+    def count_text(self, text: str) -> int:
+        return len(self._encoding.encode(text, disallowed_special=()))
+
+
+class CallableTokenizer(Tokenizer):
+    """包装任意计数函数，例如provider提供的token计数接口"""
+
+    def __init__(self, count: Callable[[str], int], name: str):
+        self._count = count
+        self.name = name
+
+    def count_text(self, text: str) -> int:
+        return self._count(text)
+
+
+def get_tokenizer(name: Optional[str] = None) -> Tokenizer:
+    """按名称获取token计数器
+
+    Args:
+        name: 'heuristic'（默认）、'tiktoken' 或 'tiktoken:<encoding>'
+    """
+    if not name or name == "heuristic":
+        return HeuristicTokenizer()
+    if name == "tiktoken":
+        return TiktokenTokenizer()
+    if name.startswith("tiktoken:"):
+        return TiktokenTokenizer(name.split(":", 1)[1])
+    raise ValueError(f"Unknown tokenizer: {name}")
+
+
+def select_recent_within_budget(messages: List[Message],
+                                budget: int,
+                                tokenizer: Tokenizer) -> List[Message]:
+    """从最新的消息开始向前选择，直到超出token预算
+
+    最新的一条消息总是保留；选中的窗口不会以 assistant 或 tool 消息开头，
+    避免把工具结果或回复与对应的请求拆开。只遍历最终窗口附近的消息。
+    """
+    if not messages:
+        return []
+    selected = 0
+    used = 0
+    for msg in reversed(messages):
+        tokens = tokenizer.count_message(msg)
+        if selected and used + tokens > budget:
+            break
+        used += tokens
+        selected += 1
+    start = len(messages) - selected
+    while start < len(messages) - 1 and messages[start].role != "user":
+        start += 1
+    return messages[start:]
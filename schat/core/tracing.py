@@ -0,0 +1,235 @@
+import os
+import time
+from threading import Lock
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+
+class RequestHook:
+    """请求生命周期钩子，子类按需重写
+
+    阶段（phase）：
+    - convert: 转换消息、准备请求参数（含 before_send），同时查找响应缓存
+    - client_init: 选择密钥并获取SDK客户端，命中缓存时没有此阶段
+    - upstream: 等待provider返回（流式请求为返回响应头）
+    - parse: 解析普通响应
+    - stream: 读取流式响应，期间在 timings['ttft'] 记录首个chunk的时间
+    """
+
+    def on_request_start(self, trace: "RequestTrace"):
+        pass
+
+    def on_phase_start(self, trace: "RequestTrace", phase: str):
+        pass
+
+    def on_phase_end(self, trace: "RequestTrace", phase: str, seconds: float):
+        pass
+
+    def on_request_end(self, trace: "RequestTrace"):
+        """请求结束（流式请求为流结束），失败时 trace.error 不为None"""
+
+
+_hooks: List[RequestHook] = []
+_hooks_lock = Lock()
+
+
+def add_hook(hook: RequestHook):
+    """注册对所有模型生效的钩子"""
+    with _hooks_lock:
+        _hooks.append(hook)
+
+
+def remove_hook(hook: RequestHook):
+    """移除全局钩子"""
+    with _hooks_lock:
+        if hook in _hooks:
+            _hooks.remove(hook)
+
+
+def get_hooks() -> List[RequestHook]:
+    """当前的全局钩子"""
+    return _hooks
+
+
+class RequestTrace:
+    """一次请求的阶段计时
+
+    timings 中各阶段的耗时（秒）会附加到返回的 Message / StreamingResponse 的 timings 属性
+    """
+
+    def __init__(self, hooks: List[RequestHook], provider: Optional[str], model: Optional[str]):
+        self.hooks = hooks
+        self.provider = provider
+        self.model = model
+        self.stream = False
+        self.timings: Dict[str, float] = {}
+        self.attributes: Dict[str, Any] = {}
+        self.error: Optional[BaseException] = None
+        self.phases: List[Tuple[str, int, int]] = []  # (阶段, 开始, 结束)，unix纳秒
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._perf_base = time.perf_counter_ns()
+        self._open: Dict[str, int] = {}
+        for hook in hooks:
+            hook.on_request_start(self)
+
+    def _now_ns(self) -> int:
+        # 使用单调时钟计时，换算为unix时间便于导出
+        return self.start_ns + time.perf_counter_ns() - self._perf_base
+
+    def begin(self, phase: str):
+        self._open[phase] = self._now_ns()
+        for hook in self.hooks:
+            hook.on_phase_start(self, phase)
+
+    def end(self, phase: str):
+        start = self._open.pop(phase)
+        end = self._now_ns()
+        seconds = (end - start) / 1e9
+        self.timings[phase] = self.timings.get(phase, 0.0) + seconds
+        self.phases.append((phase, start, end))
+        for hook in self.hooks:
+            hook.on_phase_end(self, phase, seconds)
+
+    def mark(self, name: str):
+        """记录从请求开始到现在的秒数，如 ttft"""
+        self.timings[name] = (self._now_ns() - self.start_ns) / 1e9
+
+    def finish(self, error: Optional[BaseException] = None):
+        """结束请求，未结束的阶段一并结束，重复调用无效"""
+        if self.end_ns is not None:
+            return
+        for phase in list(self._open):
+            self.end(phase)
+        self.error = error
+        self.end_ns = self._now_ns()
+        self.timings["total"] = (self.end_ns - self.start_ns) / 1e9
+        for hook in self.hooks:
+            hook.on_request_end(self)
+
+    def to_spans(self) -> List[Dict[str, Any]]:
+        """转换为OpenTelemetry格式的span：根span schat.request，每个阶段一个子span"""
+        trace_id = os.urandom(16).hex()
+        root_id = os.urandom(8).hex()
+        attributes = {"schat.provider": self.provider, "schat.model": self.model, "schat.stream": self.stream}
+        attributes.update(self.attributes)
+        if "ttft" in self.timings:
+            attributes["schat.ttft"] = self.timings["ttft"]
+        status = {"code": "OK"}
+        if self.error is not None:
+            status = {"code": "ERROR", "message": f"{type(self.error).__name__}: {self.error}"}
+        spans = [{
+            "name": "schat.request",
+            "trace_id": trace_id,
+            "span_id": root_id,
+            "parent_span_id": None,
+            "start_time_unix_nano": self.start_ns,
+            "end_time_unix_nano": self.end_ns,
+            "attributes": attributes,
+            "status": status,
+        }]
+        for phase, start, end in self.phases:
+            spans.append({
+                "name": f"schat.{phase}",
+                "trace_id": trace_id,
+                "span_id": os.urandom(8).hex(),
+                "parent_span_id": root_id,
+                "start_time_unix_nano": start,
+                "end_time_unix_nano": end,
+                "attributes": {},
+                "status": {"code": "OK"},
+            })
+        return spans
+
+
+def traced_stream(chunks: Iterator[str], trace: RequestTrace) -> Iterator[str]:
+    """读取流时记录 stream 阶段和首个chunk的时间，流结束时结束请求"""
+    error = None
+    trace.begin("stream")
+    try:
+        first = True
+        for chunk in chunks:
+            if first:
+                trace.mark("ttft")
+                first = False
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        trace.finish(error)
+
+
+async def atraced_stream(chunks: AsyncIterator[str], trace: RequestTrace) -> AsyncIterator[str]:
+    """traced_stream 的异步版本"""
+    error = None
+    trace.begin("stream")
+    try:
+        first = True
+        async for chunk in chunks:
+            if first:
+                trace.mark("ttft")
+                first = False
+            yield chunk
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        trace.finish(error)
+
+
+class SpanHook(RequestHook):
+    """请求结束时把span交给导出器，导出器只需实现 export(spans)"""
+
+    def __init__(self, exporter):
+        self.exporter = exporter
+
+    def on_request_end(self, trace: RequestTrace):
+        self.exporter.export(trace.to_spans())
+
+
+class InMemorySpanExporter:
+    """把span保存在内存中，用于测试和调试"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.spans: List[Dict[str, Any]] = []
+
+    def export(self, spans: List[Dict[str, Any]]):
+        with self._lock:
+            self.spans.extend(spans)
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+
+class OpenTelemetryExporter:
+    """通过 opentelemetry-api 的 tracer 重建span，需要安装 opentelemetry-api（通常还有SDK）"""
+
+    def __init__(self, tracer=None):
+        try:
+            from opentelemetry import trace
+            from opentelemetry.trace import Status, StatusCode
+        except ImportError:
+            raise ImportError(
+                "opentelemetry package not installed. "
+                "Please install it with: pip install opentelemetry-api opentelemetry-sdk"
+            )
+        self._trace = trace
+        self._status = (Status, StatusCode)
+        self.tracer = tracer or trace.get_tracer("schat")
+
+    def export(self, spans: List[Dict[str, Any]]):
+        root, children = spans[0], spans[1:]
+        attributes = {k: v for k, v in root["attributes"].items() if v is not None}
+        span = self.tracer.start_span(root["name"], start_time=root["start_time_unix_nano"],
+                                      attributes=attributes)
+        context = self._trace.set_span_in_context(span)
+        for child in children:
+            self.tracer.start_span(
+                child["name"], context=context, start_time=child["start_time_unix_nano"]
+            ).end(end_time=child["end_time_unix_nano"])
+        if root["status"]["code"] == "ERROR":
+            Status, StatusCode = self._status
+            span.set_status(Status(StatusCode.ERROR, root["status"].get("message")))
+        span.end(end_time=root["end_time_unix_nano"])
@@ -0,0 +1,201 @@
+import hashlib
+import os
+import sqlite3
+import time
+import warnings
+from threading import Lock
+from typing import Dict, Optional, Tuple
+from ..config import UPLOAD_REGISTRY
+
+# (作用域, 内容哈希, MIME类型)
+_Key = Tuple[str, str, str]
+
+
+def file_digest(file_path: str) -> str:
+    """分块计算文件内容的sha256，适用于较大的视频和PDF"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def upload_scope(provider: str, api_key: Optional[str]) -> str:
+    """上传文件的可见范围：provider和API密钥，密钥只保存哈希"""
+    key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:16]
+    return f"{provider}:{key_hash}"
+
+
+class UploadRegistry:
+    """已上传到provider文件API的文件登记表
+
+    按 (作用域, 内容哈希, MIME类型) 记录上传后的文件名和过期时间，相同内容的文件在
+    过期前直接复用，不再重新上传。内存中总是保留一份，可选使用SQLite文件持久化，
+    多个进程共用同一个文件时可以复用彼此上传的文件。
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 47 * 3600.0, expiry_margin: float = 600.0):
+        """
+        Args:
+            path: SQLite文件路径，所在目录不存在时自动创建，None 表示只使用内存
+            ttl: provider没有返回过期时间时使用的有效期（秒）
+            expiry_margin: 提前多少秒视为过期，避免请求过程中文件被删除
+        """
+        self.path = path
+        self.ttl = ttl
+        self.expiry_margin = expiry_margin
+        self._lock = Lock()
+        # key -> (文件名, URI, 过期时间)
+        self._entries: Dict[_Key, Tuple[str, Optional[str], float]] = {}
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS uploads ("
+                "scope TEXT NOT NULL, digest TEXT NOT NULL, mime_type TEXT NOT NULL, "
+                "name TEXT NOT NULL, uri TEXT, expires_at REAL NOT NULL, "
+                "PRIMARY KEY (scope, digest, mime_type))"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, scope: str, digest: str, mime_type: str) -> Optional[Dict]:
+        """获取未过期的上传记录
+
+        Returns:
+            Optional[Dict]: 包含 name、uri、expires_at，没有记录或已过期时返回None
+        """
+        key = (scope, digest, mime_type)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None and self._db is not None:
+                row = self._db.execute(
+                    "SELECT name, uri, expires_at FROM uploads "
+                    "WHERE scope = ? AND digest = ? AND mime_type = ? AND expires_at > ?",
+                    (scope, digest, mime_type, now)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], row[1], row[2])
+                    self._entries[key] = entry
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {"name": entry[0], "uri": entry[1], "expires_at": entry[2]}
+
+    def put(self, scope: str, digest: str, mime_type: str, name: str,
+            uri: Optional[str] = None, expires_at: Optional[float] = None):
+        """记录上传的文件
+
+        Args:
+            expires_at: provider返回的过期时间（Unix时间戳），None 表示按 ttl 计算
+        """
+        if expires_at is None:
+            expires_at = time.time() + self.ttl
+        entry = (name, uri, expires_at - self.expiry_margin)
+        with self._lock:
+            self._entries[(scope, digest, mime_type)] = entry
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO uploads (scope, digest, mime_type, name, uri, expires_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (scope, digest, mime_type) + entry
+                )
+                self._db.commit()
+
+    def remove(self, scope: str, digest: str, mime_type: str):
+        """删除记录，文件在provider端已不可用时调用"""
+        with self._lock:
+            self._entries.pop((scope, digest, mime_type), None)
+            if self._db is not None:
+                self._db.execute(
+                    "DELETE FROM uploads WHERE scope = ? AND digest = ? AND mime_type = ?",
+                    (scope, digest, mime_type)
+                )
+                self._db.commit()
+
+    def purge_expired(self) -> int:
+        """删除已过期的记录，返回SQLite中删除的条数"""
+        now = time.time()
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if entry[2] <= now]:
+                del self._entries[key]
+            if self._db is None:
+                return 0
+            cursor = self._db.execute("DELETE FROM uploads WHERE expires_at <= ?", (now,))
+            self._db.commit()
+            return cursor.rowcount
+
+    def clear(self):
+        """清空记录和统计"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM uploads")
+                self._db.commit()
+            self.hits = self.misses = 0
+
+    def close(self):
+        """关闭SQLite连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> Dict[str, int]:
+        """获取复用统计"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self._entries),
+            }
+
+
+_upload_registry: Optional[UploadRegistry] = None
+_upload_registry_lock = Lock()
+
+
+def get_upload_registry() -> UploadRegistry:
+    """获取进程共享的上传登记表，首次调用时按 config.UPLOAD_REGISTRY 创建
+
+    默认保存在用户缓存目录中的SQLite文件里，无法创建时退回只使用内存
+    """
+    global _upload_registry
+    if _upload_registry is None:
+        with _upload_registry_lock:
+            if _upload_registry is None:
+                try:
+                    _upload_registry = UploadRegistry(**UPLOAD_REGISTRY)
+                except (OSError, sqlite3.Error) as e:
+                    warnings.warn(f"Upload registry {UPLOAD_REGISTRY['path']} unavailable, using memory only: {e}")
+                    _upload_registry = UploadRegistry(**dict(UPLOAD_REGISTRY, path=None))
+    return _upload_registry
+
+
+def configure_upload_registry(path: Optional[str] = None, ttl: Optional[float] = None) -> UploadRegistry:
+    """重新配置进程共享的上传登记表
+
+    Args:
+        path: SQLite文件路径，None表示只使用内存（不跨进程复用）
+        ttl: provider没有返回过期时间时使用的有效期（秒），None表示使用配置默认值
+    """
+    global _upload_registry
+    config = dict(UPLOAD_REGISTRY)
+    config["path"] = path
+    if ttl is not None:
+        config["ttl"] = ttl
+    with _upload_registry_lock:
+        old = _upload_registry
+        _upload_registry = UploadRegistry(**config)
+    if old is not None:
+        old.close()
+    return _upload_registry
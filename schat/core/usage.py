@@ -0,0 +1,328 @@
+"""token用量和费用统计
+
+各provider返回的用量统一为 Usage：input_tokens 包含缓存读取和写入的token
+（与OpenAI、Google的口径一致，Anthropic的用量会换算为此口径），
+cache_read_tokens / cache_write_tokens 是其中命中缓存和写入缓存的部分。
+"""
+from threading import Lock
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Tuple, Union
+from ..config import MODEL_PRICES
+
+
+def tokens(value: Any) -> int:
+    """SDK中的token数，缺失或不是整数时为0"""
+    return value if isinstance(value, int) and not isinstance(value, bool) else 0
+
+
+class Usage:
+    """一次请求（或多次请求合计）的token用量
+
+    provider / model 在模型记录用量时设置，用于在会话中按模型计价
+    """
+
+    __slots__ = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens", "provider", "model")
+
+    def __init__(self,
+                 input_tokens: int = 0,
+                 output_tokens: int = 0,
+                 cache_read_tokens: int = 0,
+                 cache_write_tokens: int = 0,
+                 provider: Optional[str] = None,
+                 model: Optional[str] = None):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cache_read_tokens = cache_read_tokens
+        self.cache_write_tokens = cache_write_tokens
+        self.provider = provider
+        self.model = model
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    @property
+    def uncached_input_tokens(self) -> int:
+        """没有命中缓存、也没有写入缓存的输入token"""
+        return max(0, self.input_tokens - self.cache_read_tokens - self.cache_write_tokens)
+
+    @property
+    def cache_hit_ratio(self) -> float:
+        """输入token中命中缓存的比例"""
+        return self.cache_read_tokens / self.input_tokens if self.input_tokens else 0.0
+
+    def add(self, other: "Usage"):
+        """原地累加另一份用量的token数"""
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cache_read_tokens += other.cache_read_tokens
+        self.cache_write_tokens += other.cache_write_tokens
+
+    def merge(self, other: "Usage"):
+        """合并流式响应中的用量，各字段取较大值
+
+        流式响应的用量是累计值，可能分散在多个chunk中（如Anthropic的输入和输出分别上报）
+        """
+        self.input_tokens = max(self.input_tokens, other.input_tokens)
+        self.output_tokens = max(self.output_tokens, other.output_tokens)
+        self.cache_read_tokens = max(self.cache_read_tokens, other.cache_read_tokens)
+        self.cache_write_tokens = max(self.cache_write_tokens, other.cache_write_tokens)
+
+    def __add__(self, other: "Usage") -> "Usage":
+        if not isinstance(other, Usage):
+            return NotImplemented
+        result = self.copy()
+        result.add(other)
+        return result
+
+    def __eq__(self, other: Any) -> bool:
+        if not isinstance(other, Usage):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    __hash__ = None
+
+    def __bool__(self) -> bool:
+        return bool(self.input_tokens or self.output_tokens)
+
+    def __repr__(self) -> str:
+        return (f"Usage(input_tokens={self.input_tokens}, output_tokens={self.output_tokens}, "
+                f"cache_read_tokens={self.cache_read_tokens}, cache_write_tokens={self.cache_write_tokens}, "
+                f"model={self.model!r})")
+
+    def copy(self) -> "Usage":
+        return Usage(self.input_tokens, self.output_tokens, self.cache_read_tokens, self.cache_write_tokens,
+                     self.provider, self.model)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cache_read_tokens": self.cache_read_tokens,
+            "cache_write_tokens": self.cache_write_tokens,
+        }
+        if self.provider is not None:
+            data["provider"] = self.provider
+        if self.model is not None:
+            data["model"] = self.model
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, int]) -> "Usage":
+        return cls(**data)
+
+
+def meter_stream(response: Any, usage: Usage, extract: Callable[[Any], Optional[Usage]],
+                 on_done: Callable[[Usage], None]) -> Union[Iterator, AsyncIterator]:
+    """包装provider的原始流式响应，从每个chunk中提取用量合并到 usage，流结束或关闭时调用 on_done
+
+    原始响应支持异步迭代时返回异步生成器，否则返回生成器
+    """
+    if hasattr(response, "__aiter__"):
+        return _ameter(response, usage, extract, on_done)
+    return _meter(response, usage, extract, on_done)
+
+
+def _meter(response: Iterable, usage: Usage, extract, on_done) -> Iterator:
+    try:
+        for chunk in response:
+            chunk_usage = extract(chunk)
+            if chunk_usage is not None:
+                usage.merge(chunk_usage)
+            yield chunk
+    finally:
+        on_done(usage)
+
+
+async def _ameter(response: AsyncIterator, usage: Usage, extract, on_done) -> AsyncIterator:
+    try:
+        async for chunk in response:
+            chunk_usage = extract(chunk)
+            if chunk_usage is not None:
+                usage.merge(chunk_usage)
+            yield chunk
+    finally:
+        on_done(usage)
+
+
+class PriceTable:
+    """模型价格表，价格为每百万token的美元数
+
+    prices 的key为模型名或 "provider:模型名"，按最长前缀匹配（可以匹配带日期后缀的模型名）；
+    值为 {"input": ..., "output": ..., "cache_read": ..., "cache_write": ...}，
+    缺少 cache_read / cache_write 时按 input 的价格计算。
+    可以继承并重写 cost 实现其他计价方式。
+    """
+
+    def __init__(self, prices: Optional[Dict[str, Dict[str, float]]] = None):
+        self.prices: Dict[str, Dict[str, float]] = dict(prices if prices is not None else MODEL_PRICES)
+
+    def set_price(self, model: str, input: float, output: float,
+                  cache_read: Optional[float] = None, cache_write: Optional[float] = None):
+        """设置或覆盖一个模型的价格"""
+        price = {"input": input, "output": output}
+        if cache_read is not None:
+            price["cache_read"] = cache_read
+        if cache_write is not None:
+            price["cache_write"] = cache_write
+        self.prices[model] = price
+
+    def lookup(self, provider: Optional[str], model: Optional[str]) -> Optional[Dict[str, float]]:
+        """查找模型的价格，没有匹配时返回None"""
+        if not model:
+            return None
+        candidates = [f"{provider}:{model}", model] if provider else [model]
+        for name in candidates:
+            if name in self.prices:
+                return self.prices[name]
+        best = None
+        for name in candidates:
+            for prefix, price in self.prices.items():
+                if name.startswith(prefix) and (best is None or len(prefix) > len(best[0])):
+                    best = (prefix, price)
+        return best[1] if best else None
+
+    def cost(self, provider: Optional[str], model: Optional[str], usage: Usage) -> Optional[float]:
+        """计算用量的费用（美元），没有价格时返回None"""
+        price = self.lookup(provider, model)
+        if price is None:
+            return None
+        input_price = price.get("input", 0.0)
+        total = (usage.uncached_input_tokens * input_price
+                 + usage.cache_read_tokens * price.get("cache_read", input_price)
+                 + usage.cache_write_tokens * price.get("cache_write", input_price)
+                 + usage.output_tokens * price.get("output", 0.0))
+        return total / 1_000_000
+
+
+class UsageTotals:
+    """一组请求的用量合计"""
+
+    __slots__ = ("requests", "usage", "cost", "unpriced")
+
+    def __init__(self):
+        self.requests = 0
+        self.usage = Usage()
+        self.cost = 0.0  # 有价格的请求的费用合计
+        self.unpriced = 0  # 没有找到价格的请求数
+
+    def add(self, usage: Usage, cost: Optional[float]):
+        self.requests += 1
+        self.usage.add(usage)
+        if cost is None:
+            self.unpriced += 1
+        else:
+            self.cost += cost
+
+    def to_dict(self) -> Dict[str, Any]:
+        usage = self.usage
+        return {
+            "requests": self.requests,
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_read_tokens": usage.cache_read_tokens,
+            "cache_write_tokens": usage.cache_write_tokens,
+            "cost": self.cost,
+            "unpriced": self.unpriced,
+        }
+
+    def __repr__(self) -> str:
+        return f"UsageTotals(requests={self.requests}, usage={self.usage!r}, cost={self.cost:.6f})"
+
+
+def key_label(api_key: Optional[str]) -> Optional[str]:
+    """统计中使用的密钥标识，不保存完整密钥"""
+    if not api_key:
+        return None
+    return f"...{api_key[-4:]}" if len(api_key) > 8 else "..."
+
+
+class UsageTracker:
+    """按provider、模型和API密钥汇总token用量和费用，线程安全
+
+    所有模型的请求都会记录到进程共享的tracker（见 get_usage_tracker）；
+    会话的用量由历史消息上的 usage 计算，见 ChatSession.get_usage。
+    """
+
+    def __init__(self, prices: Optional[PriceTable] = None):
+        self.prices = prices if prices is not None else PriceTable()
+        self._lock = Lock()
+        self._total = UsageTotals()
+        self._by_provider: Dict[Optional[str], UsageTotals] = {}
+        self._by_model: Dict[Tuple[Optional[str], Optional[str]], UsageTotals] = {}
+        self._by_key: Dict[Tuple[Optional[str], Optional[str]], UsageTotals] = {}
+
+    def record(self, usage: Usage, provider: Optional[str] = None, model: Optional[str] = None,
+               api_key: Optional[str] = None) -> Optional[float]:
+        """记录一次请求的用量
+
+        Returns:
+            Optional[float]: 本次请求的费用，没有价格时为None
+        """
+        cost = self.prices.cost(provider, model, usage)
+        label = key_label(api_key)
+        with self._lock:
+            self._total.add(usage, cost)
+            for table, key in ((self._by_provider, provider),
+                               (self._by_model, (provider, model)),
+                               (self._by_key, (provider, label))):
+                totals = table.get(key)
+                if totals is None:
+                    totals = table[key] = UsageTotals()
+                totals.add(usage, cost)
+        return cost
+
+    def total(self) -> Dict[str, Any]:
+        """所有请求的合计"""
+        with self._lock:
+            return self._total.to_dict()
+
+    def by_provider(self) -> Dict[Optional[str], Dict[str, Any]]:
+        """按provider汇总"""
+        with self._lock:
+            return {k: v.to_dict() for k, v in self._by_provider.items()}
+
+    def by_model(self) -> Dict[Tuple[Optional[str], Optional[str]], Dict[str, Any]]:
+        """按 (provider, 模型) 汇总"""
+        with self._lock:
+            return {k: v.to_dict() for k, v in self._by_model.items()}
+
+    def by_key(self) -> Dict[Tuple[Optional[str], Optional[str]], Dict[str, Any]]:
+        """按 (provider, 密钥标识) 汇总，密钥标识为密钥的后4位"""
+        with self._lock:
+            return {k: v.to_dict() for k, v in self._by_key.items()}
+
+    def reset(self):
+        """清空统计"""
+        with self._lock:
+            self._total = UsageTotals()
+            self._by_provider.clear()
+            self._by_model.clear()
+            self._by_key.clear()
+
+
+_tracker: Optional[UsageTracker] = None
+_tracker_lock = Lock()
+
+
+def get_usage_tracker() -> UsageTracker:
+    """获取进程共享的用量统计"""
+    global _tracker
+    if _tracker is None:
+        with _tracker_lock:
+            if _tracker is None:
+                _tracker = UsageTracker()
+    return _tracker
+
+
+def configure_usage_tracker(prices: Union[PriceTable, Dict[str, Dict[str, float]], None] = None) -> UsageTracker:
+    """替换进程共享的用量统计（已有的统计会被丢弃）
+
+    Args:
+        prices: 价格表，可以是 PriceTable（或实现了 cost 的对象）或价格字典，None 使用 config.MODEL_PRICES
+    """
+    global _tracker
+    if isinstance(prices, dict):
+        prices = PriceTable(prices)
+    with _tracker_lock:
+        _tracker = UsageTracker(prices)
+    return _tracker
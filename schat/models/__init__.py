@@ -1,11 +1,23 @@
-from .openai import OpenAIModel
-from .anthropic import AnthropicModel
-from .google import GoogleModel
-from .openrouter import OpenRouterModel
+import importlib
+from .provider import MODEL_MODULES
 
 __all__ = [
     'OpenAIModel',
     'AnthropicModel',
     'GoogleModel',
     'OpenRouterModel'
-] 
\ No newline at end of file
+]
+
+
+def __getattr__(name: str):
+    """按需导入模型类，访问时才加载对应的SDK"""
+    if name in MODEL_MODULES:
+        module = importlib.import_module(MODEL_MODULES[name])
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
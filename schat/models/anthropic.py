@@ -1,32 +1,55 @@
-from typing import List, Dict, Generator, Union, Any
+from typing import List, Dict, Generator, Any, Optional
 import anthropic
 from .base import Model
 from ..core.message import Message
+from ..core.file_cache import get_attachment_cache
+from ..core.http_fetch import get_remote_fetcher
+from ..core.client_pool import get_client_pool
+from ..core.usage import Usage, tokens
 import base64
 import json
-import requests
+from functools import partial
 from .anthropic_helper import add_cache_to_messages
 
 class AnthropicModel(Model):
     """Anthropic模型实现"""
     
-    def __init__(self, provider: str = "anthropic", **kwargs):
+    reports_usage = True
+    
+    def __init__(self, provider: str = "anthropic", pass_image_urls: bool = False, **kwargs):
         super().__init__(provider, **kwargs)
+        # 为True时URL图片以url source直接传给API，不在本地下载
+        self.pass_image_urls = pass_image_urls
         
+    def _conversion_key(self) -> str:
+        """URL图片的处理方式不同，转换结果需要分开缓存"""
+        if self.pass_image_urls:
+            return "AnthropicModel:url"
+        return "AnthropicModel"
         
-    def _ensure_client(self):
-        """确保Anthropic API客户端已初始化"""
-        if not self.client:
-            if not self.api_key:
-                self.api_key = self._key_manager.get_key(self.provider)
-            if not self.api_key:
-                raise ValueError(f"API key not set and no key available from manager for provider {self.provider}")
+    def _client_kwargs(self, api_key: str, http_client: Any) -> Dict:
+        """构造客户端初始化参数，同步和异步客户端共用"""
+        client_kwargs = {
+            "api_key": api_key,
+            "http_client": http_client,
+        }
+        if self.base_url:
+            client_kwargs["base_url"] = self.base_url
+        return client_kwargs
                 
-            # 只使用 api_key 初始化客户端
-            self.client = anthropic.Anthropic(api_key=self.api_key)
+    def _create_client(self, api_key: str) -> anthropic.Anthropic:
+        """创建使用指定密钥的Anthropic客户端"""
+        # 同一个host的客户端共享连接池
+        http_client = get_client_pool().http_client(anthropic.DefaultHttpxClient, self.base_url)
+        return anthropic.Anthropic(**self._client_kwargs(api_key, http_client))
+            
+    def _create_async_client(self, api_key: str) -> anthropic.AsyncAnthropic:
+        """创建使用指定密钥的Anthropic异步客户端"""
+        http_client = get_client_pool().http_client(anthropic.DefaultAsyncHttpxClient, self.base_url)
+        return anthropic.AsyncAnthropic(**self._client_kwargs(api_key, http_client))
 
     def _download_image(self, url: str) -> bytes:
-        """从URL下载图片
+        """从URL下载图片，使用进程共享的连接池和下载缓存
         
         Args:
             url: 图片URL
@@ -37,65 +60,38 @@ class AnthropicModel(Model):
         Raises:
             ValueError: 下载失败
         """
-        try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            return response.content
-        except Exception as e:
-            raise ValueError(f"Failed to download image from {url}: {e}")
+        return get_remote_fetcher().fetch(url)
+        
+    def _prefetch_images(self, messages: List[Message], key: str) -> Dict[str, bytes]:
+        """并发下载尚未转换的消息中的所有URL图片
+        
+        Returns:
+            Dict[str, bytes]: URL到图片内容的映射，转换时直接使用，不再从下载缓存中查找
+        """
+        if self.pass_image_urls:
+            return {}
+        urls = [
+            file_path
+            for msg in messages if msg.files and not msg.has_converted(key)
+            for file_path in msg.files
+            if self.is_url(file_path) and self.get_file_type(file_path).startswith('image/')
+        ]
+        if len(urls) > 1:
+            return get_remote_fetcher().fetch_many(urls)
+        return {}
 
     def _convert_messages(self, messages: List[Message]) -> List[Dict]:
-        """转换消息格式为Anthropic API格式"""
+        """转换消息格式为Anthropic API格式
+        
+        每条消息文本和附件的转换结果会被缓存，工具调用相关的上下文处理每次重新计算
+        """
         converted = []
         last_was_tool_use = False
+        key = self._conversion_key()
+        images = self._prefetch_images(messages, key)
+        convert = partial(self._convert_content, images=images) if images else self._convert_content
         
         for msg in messages:
-            content = []
-            
-            # 添加文本内容
-            if msg.text:
-                content.append({"type": "text", "text": msg.text})
-                
-            # 添加文件内容
-            if msg.files:
-                for file_path in msg.files:
-                    file_type = self.get_file_type(file_path)
-                    if not self.supports_file_type(file_type):
-                        raise ValueError(f"Unsupported file type: {file_type}")
-                    
-                    # 处理图片
-                    if file_type.startswith('image/'):
-                        if self.is_url(file_path):
-                            # 下载URL图片并转换为base64
-                            image_data = self._download_image(file_path)
-                            base64_data = base64.b64encode(image_data).decode('utf-8')
-                            content.append({
-                                "type": "image",
-                                "source": {
-                                    "type": "base64",
-                                    "media_type": file_type,
-                                    "data": base64_data
-                                }
-                            })
-                        else:
-                            with open(file_path, 'rb') as f:
-                                base64_data = base64.b64encode(f.read()).decode('utf-8')
-                                content.append({
-                                    "type": "image",
-                                    "source": {
-                                        "type": "base64",
-                                        "media_type": file_type,
-                                        "data": base64_data
-                                    }
-                                })
-                    # 处理文档
-                    else:
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content.append({
-                                "type": "text",
-                                "text": f.read()
-                            })
-            
             # 处理工具调用
             if msg.role == "assistant" and hasattr(msg, 'content') and msg.content:
                 # 如果消息中有 content 字段（包含 tool_use block），直接使用
@@ -115,6 +111,8 @@ class AnthropicModel(Model):
                 }
                 converted.append(message)
                 continue
+            else:
+                content = msg.get_converted(key, convert)
             
             message = {"role": msg.role, "content": content}
             converted.append(message)
@@ -127,6 +125,69 @@ class AnthropicModel(Model):
         
         return converted
         
+    def _convert_content(self, msg: Message, images: Optional[Dict[str, bytes]] = None) -> List[Dict]:
+        """转换单条消息的文本和附件为Anthropic content block列表
+        
+        Args:
+            msg: 消息
+            images: 已经下载的URL图片，其他URL图片在转换时下载
+        """
+        content = []
+        
+        # 添加文本内容
+        if msg.text:
+            content.append({"type": "text", "text": msg.text})
+            
+        # 添加文件内容
+        if msg.files:
+            for file_path in msg.files:
+                file_type = self.get_file_type(file_path)
+                if not self.supports_file_type(file_type):
+                    raise ValueError(f"Unsupported file type: {file_type}")
+                
+                # 处理图片
+                if file_type.startswith('image/'):
+                    if self.is_url(file_path) and self.pass_image_urls:
+                        content.append({
+                            "type": "image",
+                            "source": {
+                                "type": "url",
+                                "url": file_path
+                            }
+                        })
+                    elif self.is_url(file_path):
+                        # 下载URL图片并转换为base64
+                        image_data = images.get(file_path) if images else None
+                        if image_data is None:
+                            image_data = self._download_image(file_path)
+                        base64_data = base64.b64encode(image_data).decode('utf-8')
+                        content.append({
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": file_type,
+                                "data": base64_data
+                            }
+                        })
+                    else:
+                        content.append({
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": file_type,
+                                "data": get_attachment_cache().get_encoded(file_path)
+                            }
+                        })
+                # 处理文档
+                else:
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        content.append({
+                            "type": "text",
+                            "text": f.read()
+                        })
+        
+        return content
+        
     def _prepare_request_kwargs(self, **kwargs) -> Dict:
         """准备请求参数"""
         request_kwargs = {
@@ -188,10 +249,42 @@ class AnthropicModel(Model):
         """发送请求到Anthropic API"""
         return self.client.messages.create(**kwargs)
         
+    async def _asend_llm(self, **kwargs) -> Any:
+        """异步发送请求到Anthropic API"""
+        return await self.async_client.messages.create(**kwargs)
+        
+    def _chunk_text(self, chunk) -> Optional[str]:
+        """提取流式事件中的文本，非文本增量事件返回None"""
+        delta = getattr(chunk, "delta", None)
+        return getattr(delta, "text", None)
+        
+    def _usage(self, usage) -> Optional[Usage]:
+        """转换响应中的 usage，input_tokens 不含缓存读取和写入的token，换算为包含的口径"""
+        if usage is None:
+            return None
+        cache_read = tokens(getattr(usage, "cache_read_input_tokens", None))
+        cache_write = tokens(getattr(usage, "cache_creation_input_tokens", None))
+        return Usage(
+            input_tokens=tokens(getattr(usage, "input_tokens", None)) + cache_read + cache_write,
+            output_tokens=tokens(getattr(usage, "output_tokens", None)),
+            cache_read_tokens=cache_read,
+            cache_write_tokens=cache_write,
+        )
+        
+    def _chunk_usage(self, chunk) -> Optional[Usage]:
+        """message_start 事件带有输入用量，message_delta 事件带有累计的输出用量"""
+        event_type = getattr(chunk, "type", None)
+        if event_type == "message_start":
+            return self._usage(getattr(getattr(chunk, "message", None), "usage", None))
+        if event_type == "message_delta":
+            return self._usage(getattr(chunk, "usage", None))
+        return None
+        
     def _handle_stream(self, response) -> Generator[str, None, None]:
         for chunk in response:
-            if chunk.delta.text:
-                yield chunk.delta.text
+            text = self._chunk_text(chunk)
+            if text:
+                yield text
                 
     def _handle_response(self, response) -> Message:
         """处理响应"""
@@ -218,7 +311,8 @@ class AnthropicModel(Model):
                     "id": tool.id,
                     "name": tool.name,
                     "input": tool.input
-                }]
+                }],
+                usage=self._usage(getattr(response, "usage", None))
             )
         
         # 处理普通响应
@@ -229,7 +323,8 @@ class AnthropicModel(Model):
         
         return Message(
             role="assistant",
-            text="".join(text_content)
+            text="".join(text_content),
+            usage=self._usage(getattr(response, "usage", None))
         )
         
     def supports_files(self) -> bool:
@@ -7,9 +7,19 @@ MAX_CACHED_MESSAGES = 4
 class CacheConfig:
     type: str = "ephemeral"
 
+def _copy_message(message: Dict) -> Dict:
+    """Copy a message together with its content blocks."""
+    msg_copy = message.copy()
+    if isinstance(msg_copy.get("content"), list):
+        msg_copy["content"] = [dict(content) for content in msg_copy["content"]]
+    return msg_copy
+
 def add_cache_to_messages(messages: List[Dict]) -> List[Dict]:
     """Add cache control to messages following specific rules.
     
+    The input messages and their content blocks are not modified, so
+    memoized conversion results can be passed in directly.
+    
     Args:
         messages: List of messages in Anthropic format
         
@@ -22,7 +32,7 @@ def add_cache_to_messages(messages: List[Dict]) -> List[Dict]:
     
     # Process system message first if exists
     if messages and messages[0]["role"] == "system":
-        system_msg = messages[0].copy()
+        system_msg = _copy_message(messages[0])
         for content in system_msg["content"]:
             content["cache_control"] = {"type": "ephemeral"}
         messages_with_cache.append(system_msg)
@@ -31,7 +41,7 @@ def add_cache_to_messages(messages: List[Dict]) -> List[Dict]:
     
     # First pass: add cache to messages with files/images
     for msg in messages:
-        msg_copy = msg.copy()
+        msg_copy = _copy_message(msg)
         has_non_text = False
         
         for content in msg_copy["content"]:
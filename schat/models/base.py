@@ -1,21 +1,103 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Generator, Union, Any
+from typing import List, Dict, Generator, AsyncGenerator, Union, Any, Optional, Tuple
+import asyncio
 import mimetypes
+import time
+from contextvars import ContextVar
 from ..core.message import Message
+from ..core.streaming import StreamingResponse, AsyncStreamingResponse
 from ..core.key_manager import APIKeyManager
+from ..core.client_pool import get_client_pool
+from ..core.hedging import HedgePolicy, hedged_send, ahedged_send
+from ..core.response_cache import ResponseCache, request_key
+from ..core.single_flight import SingleFlight
+from ..core import tracing
+from ..core.tracing import RequestHook, RequestTrace, traced_stream, atraced_stream
+from ..core.usage import Usage, get_usage_tracker, meter_stream
+
+def error_status(error: BaseException) -> Tuple[Optional[int], Optional[str]]:
+    """从SDK异常中提取HTTP状态码和 Retry-After 头
+
+    兼容 openai/anthropic 的 status_code + response.headers，以及 google 的 code
+    """
+    status = getattr(error, "status_code", None)
+    if not isinstance(status, int):
+        code = getattr(error, "code", None)
+        status = code if isinstance(code, int) else None
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    retry_after = None
+    if headers:
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+    return status, retry_after
+
+
+async def _aiter_text(text: Optional[str]):
+    """把缓存的回复作为单个chunk的异步流返回"""
+    if text:
+        yield text
+
 
 class Model(ABC):
-    """模型的抽象基类，同时也是Provider"""
+    """模型的抽象基类，同时也是Provider
+    
+    没有显式设置 api_key 时，每次请求都从密钥管理器选择一个健康的key，
+    并使用该key对应的客户端；请求结果会反馈给密钥管理器用于健康检查。
+    """
+    
+    # provider在流式响应的chunk中返回token用量时为True，需要同时实现 _chunk_usage
+    reports_usage = False
+    # 消息转换需要使用客户端时为True，此时在查找响应缓存之前就选择密钥
+    converts_with_client = False
     
     def __init__(self, provider: str = None, **kwargs):
         self.provider = provider  # 当前provider名称
-        self.api_key: str = None
+        self.api_key: str = None  # 显式设置的密钥，设置后不再轮换
         self.base_url: str = None
         self._supported_models: List[str] = []  # 空列表表示不限制模型
         self._supported_file_types: List[str] = []
         self.default_kwargs = kwargs.copy()
-        self.client = None
+        self._client = None
+        self._async_client = None
+        self.hedge_policy: Optional[HedgePolicy] = None  # 设置后所有请求默认使用对冲
+        self.response_cache: Optional[ResponseCache] = None  # 设置后所有请求默认使用缓存
+        self.single_flight: Optional[SingleFlight] = None  # 设置后所有请求默认合并相同请求
+        self.hooks: List[RequestHook] = []  # 只对本模型生效的请求钩子，全局钩子见 tracing.add_hook
+        # 当前请求使用的 (key, client, async_client)，按线程/协程上下文隔离，
+        # 多个线程共享同一个模型实例时互不影响
+        self._request_state: ContextVar[Optional[Tuple[str, Any, Any]]] = ContextVar(
+            f"schat_request_state_{id(self)}", default=None
+        )
         self._key_manager = APIKeyManager()
+    
+    @property
+    def client(self) -> Any:
+        """当前请求使用的同步客户端"""
+        state = self._request_state.get()
+        if state is None:
+            return self._client
+        return state[1] if state[1] is not None else self._get_client(state[0])
+    
+    @client.setter
+    def client(self, value: Any):
+        self._client = value
+    
+    @property
+    def async_client(self) -> Any:
+        """当前请求使用的异步客户端"""
+        state = self._request_state.get()
+        if state is None:
+            return self._async_client
+        return state[2] if state[2] is not None else self._get_async_client(state[0])
+    
+    @async_client.setter
+    def async_client(self, value: Any):
+        self._async_client = value
+    
+    @property
+    def current_key(self) -> Optional[str]:
+        """当前上下文中最近一次请求使用的密钥"""
+        state = self._request_state.get()
+        return state[0] if state is not None else self.api_key
         
     def set_api_key(self, api_key: str):
         """设置API密钥"""
@@ -25,24 +107,401 @@ class Model(ABC):
         """设置API基础URL"""
         self.base_url = base_url
         
-    def send(self, messages: List[Message], **kwargs) -> Union[Message, Generator[str, None, None]]:
-        """发送消息到模型并获取响应 (模板方法)"""
-        self._ensure_client()
+    def enable_hedging(self, policy: Optional[HedgePolicy] = None) -> HedgePolicy:
+        """为之后的所有请求开启对冲，返回使用的策略（可用于查看统计）"""
+        self.hedge_policy = policy or HedgePolicy()
+        return self.hedge_policy
+    
+    def _resolve_hedge(self, hedge: Union[bool, HedgePolicy, None]) -> Optional[HedgePolicy]:
+        """hedge=True 使用模型的策略（没有时创建），False 关闭，None 按模型设置"""
+        if isinstance(hedge, HedgePolicy):
+            return hedge
+        if hedge is True and self.hedge_policy is None:
+            return self.enable_hedging()
+        if hedge is False:
+            return None
+        return self.hedge_policy
+    
+    def enable_response_cache(self, cache: Optional[ResponseCache] = None) -> ResponseCache:
+        """为之后的所有请求开启响应缓存，返回使用的缓存（可用于查看统计）"""
+        self.response_cache = cache or ResponseCache()
+        return self.response_cache
+    
+    def _resolve_cache(self, cache: Union[bool, ResponseCache, None]) -> Optional[ResponseCache]:
+        """cache=True 使用模型的缓存（没有时创建），False 关闭，None 按模型设置"""
+        if isinstance(cache, ResponseCache):
+            return cache
+        if cache is True and self.response_cache is None:
+            return self.enable_response_cache()
+        if cache is False:
+            return None
+        return self.response_cache
+    
+    def _cache_payload(self, messages: List[Message], request_kwargs: Dict) -> Dict:
+        """用于计算缓存key的请求内容，请求中包含无法稳定序列化的对象时子类需要重写"""
+        request = {k: v for k, v in request_kwargs.items() if k not in ("stream", "stream_options")}
+        return {"class": self.__class__.__name__, "base_url": self.base_url, "request": request}
+    
+    def enable_coalescing(self, flight: Optional[SingleFlight] = None) -> SingleFlight:
+        """为之后的所有请求开启相同请求合并，返回使用的 SingleFlight（可用于查看统计）"""
+        self.single_flight = flight or SingleFlight()
+        return self.single_flight
+    
+    def _resolve_coalesce(self, coalesce: Union[bool, SingleFlight, None]) -> Optional[SingleFlight]:
+        """coalesce=True 使用模型的 SingleFlight（没有时创建），False 关闭，None 按模型设置"""
+        if isinstance(coalesce, SingleFlight):
+            return coalesce
+        if coalesce is True and self.single_flight is None:
+            return self.enable_coalescing()
+        if coalesce is False:
+            return None
+        return self.single_flight
+    
+    def _prepare_reuse(self, messages: List[Message], request_kwargs: Dict, cache: Optional[ResponseCache],
+                       flight: Optional[SingleFlight]) -> Tuple[Optional[str], Optional[Message], Optional[str]]:
+        """计算请求哈希并查找缓存
         
-        # 准备请求参数，确保传入消息
-        request_kwargs = self._prepare_request_kwargs(messages=messages, **kwargs)
+        Returns:
+            Tuple: (缓存key, 命中的缓存消息, 合并请求的key)，不使用时为None
+        """
+        cacheable = cache is not None and cache.cacheable(request_kwargs)
+        if not cacheable and flight is None:
+            return None, None, None
+        request_hash = request_key(self._cache_payload(messages, request_kwargs))
+        cache_key = request_hash if cacheable else None
+        cached = cache.get(cache_key) if cacheable else None
+        flight_key = None
+        if flight is not None:
+            # 流式和非流式请求分别合并
+            flight_key = f"{request_hash}:{'stream' if request_kwargs.get('stream') else 'message'}"
+        return cache_key, cached, flight_key
+    
+    def add_hook(self, hook: RequestHook):
+        """注册请求钩子，有钩子时记录各阶段耗时并附加到返回结果的 timings 属性"""
+        self.hooks.append(hook)
+    
+    def _start_trace(self, kwargs: Dict) -> Optional[RequestTrace]:
+        """没有注册钩子时返回None，请求不做任何计时"""
+        global_hooks = tracing.get_hooks()
+        if not self.hooks and not global_hooks:
+            return None
+        model = kwargs.get("model", self.default_kwargs.get("model"))
+        return RequestTrace(self.hooks + global_hooks, self.provider, model)
+    
+    def _finish_trace(self, trace: RequestTrace, result):
+        """把计时附加到结果上，流式响应在流结束时结束计时"""
+        result.timings = trace.timings
+        if isinstance(result, Message):
+            trace.finish()
+        return result
+    
+    def send(self, messages: List[Message], **kwargs) -> Union[Message, StreamingResponse]:
+        """发送消息到模型并获取响应
         
-        # 在发送前处理消息和参数
-        request_kwargs = self.before_send(messages, request_kwargs)
+        Args:
+            messages: 消息列表
+            hedge: 可选，True/HedgePolicy 开启对冲请求，False 关闭
+            cache: 可选，True/ResponseCache 开启响应缓存，False 关闭
+            coalesce: 可选，True/SingleFlight 合并进行中的相同请求，False 关闭
+            **kwargs: 模型参数
+        """
+        policy = self._resolve_hedge(kwargs.pop("hedge", None))
+        if policy is not None:
+            return hedged_send(self, messages, kwargs, policy)
+        return self._send(messages, **kwargs)
+    
+    def _send(self, messages: List[Message], **kwargs) -> Union[Message, StreamingResponse]:
+        """发送单个请求"""
+        trace = self._start_trace(kwargs)
+        if trace is None:
+            return self._send_request(messages, None, **kwargs)
+        try:
+            result = self._send_request(messages, trace, **kwargs)
+        except BaseException as e:
+            trace.finish(e)
+            raise
+        return self._finish_trace(trace, result)
+    
+    def _send_request(self, messages: List[Message], trace: Optional[RequestTrace],
+                      **kwargs) -> Union[Message, StreamingResponse]:
+        """发送单个请求 (模板方法)，trace 为None时不计时"""
+        started_at = time.perf_counter()
+        cache = self._resolve_cache(kwargs.pop("cache", None))
+        flight = self._resolve_coalesce(kwargs.pop("coalesce", None))
+        if self.converts_with_client:
+            self._init_client(trace)
+        if trace:
+            trace.begin("convert")
+        
+        request_kwargs = self._build_request(messages, **kwargs)
+        stream = request_kwargs.get("stream", False)
+        cache_key, cached, flight_key = self._prepare_reuse(messages, request_kwargs, cache, flight)
+        if trace:
+            trace.end("convert")
+            trace.stream = bool(stream)
+            trace.attributes["schat.cache_hit"] = cached is not None
+        if cached is not None:
+            if stream:
+                chunks = iter([cached.text] if cached.text else [])
+                return StreamingResponse(traced_stream(chunks, trace) if trace else chunks, started_at=started_at)
+            return cached
+        if not self.converts_with_client:
+            # 缓存未命中时才选择密钥，命中缓存的请求不计入密钥的使用次数
+            self._init_client(trace)
         
-        # 发送请求并获取响应
-        response = self._send_llm(**request_kwargs)
+        usage = self._stream_usage(stream)
+        if flight_key is not None:
+            result = flight.do(flight_key, lambda: self._execute(request_kwargs, stream, trace, usage), usage)
+        else:
+            result = self._execute(request_kwargs, stream, trace, usage)
+        if stream:
+            result = StreamingResponse(traced_stream(result, trace) if trace else result, started_at=started_at)
+            result.usage = usage
+        return self._cache_store(cache, cache_key, result)
+    
+    def _execute(self, request_kwargs: Dict, stream: bool, trace: Optional[RequestTrace] = None,
+                 usage: Optional[Usage] = None) -> Union[Message, Generator[str, None, None]]:
+        """发送请求并处理响应，流式请求返回文本chunk的生成器，流中的用量合并到 usage"""
+        if trace:
+            trace.begin("upstream")
+        try:
+            response = self._send_llm(**request_kwargs)
+        except Exception as e:
+            self._report_error(e)
+            raise
+        if trace:
+            trace.end("upstream")
         
         # 处理响应
-        if request_kwargs.get("stream", False):
-            return self._handle_stream(response)
+        if stream:
+            # 流式响应在读取过程中仍可能出错，结束时才反馈密钥健康状态
+            response = self._watch_stream(response)
+            return self._handle_stream(self._meter_stream(response, request_kwargs, usage))
+        self._report_success()
+        if not trace:
+            return self._record_message_usage(self._handle_response(response), request_kwargs)
+        trace.begin("parse")
+        message = self._handle_response(response)
+        trace.end("parse")
+        return self._record_message_usage(message, request_kwargs)
+    
+    async def asend(self, messages: List[Message], **kwargs) -> Union[Message, AsyncStreamingResponse]:
+        """异步发送消息到模型并获取响应，参数同 send"""
+        policy = self._resolve_hedge(kwargs.pop("hedge", None))
+        if policy is not None:
+            return await ahedged_send(self, messages, kwargs, policy)
+        return await self._asend(messages, **kwargs)
+    
+    async def _asend(self, messages: List[Message], **kwargs) -> Union[Message, AsyncStreamingResponse]:
+        """异步发送单个请求"""
+        trace = self._start_trace(kwargs)
+        if trace is None:
+            return await self._asend_request(messages, None, **kwargs)
+        try:
+            result = await self._asend_request(messages, trace, **kwargs)
+        except BaseException as e:
+            trace.finish(e)
+            raise
+        return self._finish_trace(trace, result)
+    
+    async def _asend_request(self, messages: List[Message], trace: Optional[RequestTrace],
+                             **kwargs) -> Union[Message, AsyncStreamingResponse]:
+        """异步发送单个请求 (模板方法)
+        
+        与 send 共用消息转换和参数准备，只有发送和流式读取是异步的
+        """
+        started_at = time.perf_counter()
+        cache = self._resolve_cache(kwargs.pop("cache", None))
+        flight = self._resolve_coalesce(kwargs.pop("coalesce", None))
+        if self.converts_with_client:
+            self._ainit_client(trace)
+        if trace:
+            trace.begin("convert")
+        
+        # 带附件时转换可能读文件或下载，放到线程中避免阻塞事件循环
+        if any(msg.files for msg in messages):
+            request_kwargs = await asyncio.to_thread(self._build_request, messages, **kwargs)
+        else:
+            request_kwargs = self._build_request(messages, **kwargs)
+        stream = request_kwargs.get("stream", False)
+        cache_key, cached, flight_key = self._prepare_reuse(messages, request_kwargs, cache, flight)
+        if trace:
+            trace.end("convert")
+            trace.stream = bool(stream)
+            trace.attributes["schat.cache_hit"] = cached is not None
+        if cached is not None:
+            if stream:
+                chunks = _aiter_text(cached.text)
+                return AsyncStreamingResponse(atraced_stream(chunks, trace) if trace else chunks,
+                                              started_at=started_at)
+            return cached
+        if not self.converts_with_client:
+            self._ainit_client(trace)
+        
+        usage = self._stream_usage(stream)
+        if flight_key is not None:
+            result = await flight.ado(flight_key, lambda: self._aexecute(request_kwargs, stream, trace, usage),
+                                      usage)
+        else:
+            result = await self._aexecute(request_kwargs, stream, trace, usage)
+        if stream:
+            result = AsyncStreamingResponse(atraced_stream(result, trace) if trace else result,
+                                            started_at=started_at)
+            result.usage = usage
+        return self._cache_store(cache, cache_key, result)
+    
+    async def _aexecute(self, request_kwargs: Dict, stream: bool, trace: Optional[RequestTrace] = None,
+                        usage: Optional[Usage] = None) -> Union[Message, AsyncGenerator[str, None]]:
+        """异步发送请求并处理响应，流式请求返回文本chunk的异步生成器"""
+        if trace:
+            trace.begin("upstream")
+        try:
+            response = await self._asend_llm(**request_kwargs)
+        except Exception as e:
+            self._report_error(e)
+            raise
+        if trace:
+            trace.end("upstream")
+        
+        if stream:
+            response = self._watch_stream(response)
+            return self._ahandle_stream(self._meter_stream(response, request_kwargs, usage))
+        self._report_success()
+        if not trace:
+            return self._record_message_usage(self._handle_response(response), request_kwargs)
+        trace.begin("parse")
+        message = self._handle_response(response)
+        trace.end("parse")
+        return self._record_message_usage(message, request_kwargs)
+    
+    def _stream_usage(self, stream: bool) -> Optional[Usage]:
+        """流式响应的用量，合并请求的跟随者在流结束时得到领导者的用量"""
+        if stream and self.reports_usage:
+            return Usage()
+        return None
+    
+    def _usage_model(self, request_kwargs: Dict) -> Optional[str]:
+        """用量统计中的模型名"""
+        return request_kwargs.get("model") or self.default_kwargs.get("model")
+    
+    def _record_usage(self, usage: Usage, request_kwargs: Dict, api_key: Optional[str]):
+        """标记用量的来源并记录到进程共享的用量统计"""
+        usage.provider = self.provider
+        usage.model = self._usage_model(request_kwargs)
+        get_usage_tracker().record(usage, usage.provider, usage.model, api_key)
+    
+    def _record_message_usage(self, message: Message, request_kwargs: Dict) -> Message:
+        if message.usage is not None:
+            self._record_usage(message.usage, request_kwargs, self.current_key)
+        return message
+    
+    def _meter_stream(self, response: Any, request_kwargs: Dict, usage: Optional[Usage]) -> Any:
+        """包装原始流式响应以提取用量，流结束时记录到用量统计"""
+        if not self.reports_usage:
+            return response
+        key = self.current_key  # 流可能在其他线程中读取，提前取得本次请求的密钥
+        
+        def done(total: Usage):
+            if total:
+                self._record_usage(total, request_kwargs, key)
+        
+        return meter_stream(response, usage if usage is not None else Usage(), self._chunk_usage, done)
+    
+    def _cache_store(self, cache: Optional[ResponseCache], key: Optional[str], result):
+        """保存响应到缓存，流式响应在结束时保存"""
+        if key is None:
+            return result
+        if isinstance(result, Message):
+            cache.put(key, result)
         else:
-            return self._handle_response(response)
+            result.add_done_callback(lambda message: cache.put(key, message))
+        return result
+    
+    def _build_request(self, messages: List[Message], **kwargs) -> Dict:
+        """准备请求参数并执行 before_send，同步和异步路径共用"""
+        # 准备请求参数，确保传入消息
+        request_kwargs = self._prepare_request_kwargs(messages=messages, **kwargs)
+        
+        # 在发送前处理消息和参数
+        return self.before_send(messages, request_kwargs)
+    
+    def _select_key(self) -> str:
+        """为本次请求选择API密钥，显式设置的密钥优先，否则从密钥管理器选择健康的key
+        
+        Raises:
+            ValueError: 没有可用的密钥
+        """
+        # 使用provider名称获取key
+        key = self.api_key or self._key_manager.get_key(self.provider)
+        if not key:
+            raise ValueError(f"API key not set and no key available from manager for provider {self.provider}")
+        return key
+    
+    def _client_pool_key(self, key: str) -> Tuple:
+        """客户端池的缓存key，客户端依赖其他实例配置时子类需要重写"""
+        return (self.__class__, self.base_url, key)
+    
+    def _get_client(self, key: str) -> Any:
+        """从进程共享的客户端池获取使用指定密钥的同步客户端"""
+        return get_client_pool().get_client(
+            self._client_pool_key(key), lambda: self._create_client(key)
+        )
+    
+    def _get_async_client(self, key: str) -> Any:
+        """从进程共享的客户端池获取使用指定密钥的异步客户端"""
+        return get_client_pool().get_client(
+            self._client_pool_key(key), lambda: self._create_async_client(key), is_async=True
+        )
+    
+    def _create_client(self, api_key: str) -> Any:
+        """创建使用指定密钥的同步客户端，子类实现"""
+        raise NotImplementedError(f"{self.__class__.__name__} does not implement _create_client")
+    
+    def _create_async_client(self, api_key: str) -> Any:
+        """创建使用指定密钥的异步客户端，默认复用同步客户端"""
+        return self._get_client(api_key)
+    
+    def _report_success(self, key: Optional[str] = None):
+        """把请求成功反馈给密钥管理器，key 默认为本次请求的密钥"""
+        key = key or self.current_key
+        if key:
+            self._key_manager.report_success(self.provider, key)
+    
+    def _report_error(self, error: BaseException, key: Optional[str] = None):
+        """把请求失败反馈给密钥管理器，429 冷却、401/403 隔离"""
+        key = key or self.current_key
+        if key:
+            status, retry_after = error_status(error)
+            self._key_manager.report_error(self.provider, key, status, retry_after)
+    
+    def _watch_stream(self, response: Any) -> Any:
+        """包装原始流式响应，读完时反馈成功，读取中出错时反馈错误；提前关闭的流不反馈"""
+        key = self.current_key  # 流可能在其他线程中读取，提前取得本次请求的密钥
+        if hasattr(response, "__aiter__"):
+            return self._awatch_stream(response, key)
+        return self._watch_sync_stream(response, key)
+    
+    def _watch_sync_stream(self, response: Any, key: Optional[str]) -> Generator:
+        try:
+            for chunk in response:
+                yield chunk
+        except Exception as e:
+            self._report_error(e, key)
+            raise
+        self._report_success(key)
+    
+    async def _awatch_stream(self, response: Any, key: Optional[str]) -> AsyncGenerator:
+        try:
+            async for chunk in response:
+                yield chunk
+        except Exception as e:
+            self._report_error(e, key)
+            raise
+        self._report_success(key)
+    
+    def _conversion_key(self) -> str:
+        """消息转换结果的缓存key，转换结果依赖实例配置时子类需要重写"""
+        return self.__class__.__name__
     
     def before_send(self, messages: List[Message], request_kwargs: Dict) -> Dict:
         """在发送前处理消息和参数，子类可以重写此方法"""
@@ -58,11 +517,6 @@ class Model(ABC):
         """准备请求参数"""
         pass
     
-    @abstractmethod
-    def _ensure_client(self):
-        """确保客户端已初始化"""
-        pass
-    
     @abstractmethod
     def _handle_stream(self, response) -> Generator[str, None, None]:
         """处理流式响应"""
@@ -73,6 +527,63 @@ class Model(ABC):
         """处理普通响应"""
         pass
     
+    def _ensure_client(self):
+        """为本次请求选择密钥，client/async_client 在首次访问时按该密钥获取"""
+        self._request_state.set((self._select_key(), None, None))
+    
+    def _ensure_async_client(self):
+        """确保异步客户端可用，默认与同步路径相同"""
+        self._ensure_client()
+    
+    def _init_client(self, trace: Optional[RequestTrace]):
+        """选择密钥并获取客户端，trace 不为None时计入 client_init 阶段"""
+        if not trace:
+            self._ensure_client()
+            return
+        trace.begin("client_init")
+        self._ensure_client()
+        self.client  # 客户端在首次访问时创建
+        trace.end("client_init")
+    
+    def _ainit_client(self, trace: Optional[RequestTrace]):
+        """异步路径的 _init_client"""
+        if not trace:
+            self._ensure_async_client()
+            return
+        trace.begin("client_init")
+        self._ensure_async_client()
+        self.async_client
+        trace.end("client_init")
+    
+    async def _asend_llm(self, **kwargs) -> Any:
+        """异步发送请求到LLM，默认在线程中执行 _send_llm"""
+        return await asyncio.to_thread(self._send_llm, **kwargs)
+    
+    def _chunk_text(self, chunk) -> Optional[str]:
+        """从流式响应的单个chunk中提取文本，子类可以重写此方法"""
+        raise NotImplementedError(f"{self.__class__.__name__} does not support async streaming")
+    
+    def _chunk_usage(self, chunk) -> Optional[Usage]:
+        """从流式响应的单个chunk中提取用量（累计值），没有时返回None，reports_usage 为True的子类需要实现"""
+        return None
+    
+    async def _ahandle_stream(self, response) -> AsyncGenerator[str, None]:
+        """处理异步流式响应"""
+        if hasattr(response, "__aiter__"):
+            async for chunk in response:
+                text = self._chunk_text(chunk)
+                if text:
+                    yield text
+        else:
+            # 同步的流式响应，逐块在线程中读取
+            stream = self._handle_stream(response)
+            done = object()
+            while True:
+                text = await asyncio.to_thread(next, stream, done)
+                if text is done:
+                    break
+                yield text
+    
     def supports_model(self, model: str) -> bool:
         """检查是否支持指定的模型"""
         return not self._supported_models or model in self._supported_models
@@ -1,6 +1,7 @@
-from typing import Dict, Type, Union, Optional
+from typing import Dict, List, Type, Union, Optional
 from .base import Model
 from .provider import ProviderManager
+from .router import RouterModel
 
 class ModelFactory:
     """模型工厂类"""
@@ -8,6 +9,7 @@ class ModelFactory:
     _instances: Dict[str, Model] = {}
     _provider_manager = ProviderManager()
     _models: Dict[str, Type[Model]] = {}
+    _routes: Dict[str, RouterModel] = {}
     
     @classmethod
     def register_provider(cls, 
@@ -15,21 +17,54 @@ class ModelFactory:
                          model_class: Optional[Type[Model]] = None, 
                          base_url: Optional[str] = None,
                          openai_compatible: bool = False,
-                         default_params: Optional[Dict] = None):
-        """注册provider"""
+                         default_params: Optional[Dict] = None,
+                         stream_usage: Optional[bool] = None):
+        """注册provider
+
+        Args:
+            stream_usage: OpenAI兼容接口是否支持 stream_options.include_usage，None 表示只对官方接口开启
+        """
         config = {
             "class": model_class if model_class else "OpenAIModel",
             "base_url": base_url,
             "openai_compatible": openai_compatible,
             "default_params": default_params or {}
         }
+        if stream_usage is not None:
+            config["stream_usage"] = stream_usage
         cls._provider_manager.register_provider(provider, config)
         if model_class:
             cls._models[provider] = model_class
             
+    @classmethod
+    def register_route(cls,
+                       name: str,
+                       members: List[Union[str, Model]],
+                       costs: Optional[Dict[str, float]] = None,
+                       **options) -> RouterModel:
+        """注册路由组，之后可以像模型字符串一样使用 name
+        
+        Args:
+            name: 路由组名称，不能包含 ':'
+            members: 成员模型，'provider:model' 字符串或模型实例
+            costs: 成员的相对成本，key 为成员字符串
+            **options: RouterModel 的其他参数，如 cost_weight、failure_threshold
+        """
+        if ":" in name:
+            raise ValueError(f"Route name cannot contain ':': {name}")
+        route = RouterModel(name, members, costs=costs, **options)
+        cls._routes[name] = route
+        return route
+        
     @classmethod
     def get_model(cls, model_string: str, **kwargs) -> Model:
-        """获取模型实例"""
+        """获取模型实例，model_string 可以是 'provider:model' 或已注册的路由组名称"""
+        route = cls._routes.get(model_string)
+        if route is not None:
+            if kwargs:
+                route.set_model_config(kwargs)
+            return route
+        
         if ":" in model_string:
             provider, model_name = model_string.split(":", 1)
         else:
@@ -49,6 +84,8 @@ class ModelFactory:
             # 设置base_url(如果有)
             if provider_config.get("base_url"):
                 instance.set_base_url(provider_config["base_url"])
+            if provider_config.get("stream_usage") is not None:
+                instance.stream_usage = provider_config["stream_usage"]
             
             # 合并配置参数
             config = provider_config.get("default_params", {}).copy()
@@ -1,13 +1,21 @@
-from typing import List, Dict, Generator, Union, Any
+from typing import List, Dict, Generator, Any, Optional, Tuple
 import time
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from .base import Model
+from ..config import GOOGLE_FILES
 from ..core.message import Message
+from ..core.upload_registry import file_digest, get_upload_registry, upload_scope
+from ..core.usage import Usage, tokens
 import json
 
 class GoogleModel(Model):
     """Google Gemini模型实现"""
     
+    reports_usage = True
+    # 转换时需要按密钥上传文件，请求参数中包含客户端创建的chat对象
+    converts_with_client = True
     
     def __init__(self, provider: str = "google", **kwargs):
         super().__init__(provider, **kwargs)
@@ -44,18 +52,23 @@ class GoogleModel(Model):
             'text/x-markdown' #MD
         ]
         self._file_cache: Dict[str, object] = {}
+        self._configured_key: Optional[str] = None
     
         
+    def _select_key(self) -> str:
+        """genai.configure 是进程全局的，当前key健康时继续使用，只有不可用时才切换"""
+        if (not self.api_key and self._configured_key
+                and self._key_manager.is_key_available(self.provider, self._configured_key)):
+            return self._configured_key
+        return super()._select_key()
+        
     def _ensure_client(self):
-        """确保Google API客户端已初始化"""
-        if not self.client:
-            if not self.api_key:
-                self.api_key = self._key_manager.get_key(self.provider)
-            if not self.api_key:
-                raise ValueError(f"API key not set and no key available from manager for provider {self.provider}")
-                
+        """确保Google API客户端已初始化，密钥变化时重新配置"""
+        key = self._select_key()
+        if not self._client or key != self._configured_key:
             # 配置Google API
-            genai.configure(api_key=self.api_key)
+            genai.configure(api_key=key)
+            self._configured_key = key
             
             # 创建生成配置
             generation_config = {
@@ -66,65 +79,144 @@ class GoogleModel(Model):
             }
             
             # 创建模型实例
-            self.client = genai.GenerativeModel(
+            self._client = genai.GenerativeModel(
                 model_name=self.default_kwargs["model"],
                 generation_config=generation_config
             )
+        self._request_state.set((key, self._client, self._client))
+            
+    def _ensure_async_client(self):
+        """异步请求使用同一个模型实例"""
+        self._ensure_client()
             
-    def _wait_for_file_active(self, file_obj):
-        """等待文件处理完��并变为可用状态
+    def _wait_for_file_active(self, file_obj, deadline: Optional[float] = None):
+        """等待文件处理完成并变为可用状态，轮询间隔按指数退避增加
         
         Args:
             file_obj: Google API上传的文件对象
+            deadline: time.monotonic() 的截止时间，None表示按 GOOGLE_FILES["timeout"] 计算
+            
+        Returns:
+            处理完成后的文件对象
             
         Raises:
-            Exception: 如果文件处理失败
+            TimeoutError: 超过截止时间仍在处理
+            ValueError: 文件处理失败
         """
-        print(f"等待文件 {file_obj.name} 处理中...")
-        while True:
-            file = genai.get_file(file_obj.name)
-            if file.state.name == "ACTIVE":
-                break
-            elif file.state.name == "PROCESSING":
-                print(".", end="", flush=True)
-                time.sleep(1)  # 每1秒检查一次
-            else:
-                raise Exception(f"文件 {file.name} 处理失败: {file.state.name}")
-        print(f"\n文件 {file_obj.name} 处理完成")
-        
-    def _wait_for_files_active(self, files):
-        """等待多个文件处理完成
+        if deadline is None:
+            deadline = time.monotonic() + GOOGLE_FILES["timeout"]
+        interval = GOOGLE_FILES["poll_interval"]
+        file = file_obj
+        while file.state.name == "PROCESSING":
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"File {file.name} is still processing after the upload timeout")
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, GOOGLE_FILES["max_poll_interval"])
+            file = genai.get_file(file.name)
+        if file.state.name != "ACTIVE":
+            raise ValueError(f"File {file.name} processing failed: {file.state.name}")
+        return file
+        
+    def _wait_for_files_active(self, files, deadline: Optional[float] = None) -> List:
+        """并发等待多个文件处理完成，所有文件共用同一个截止时间
         
         Args:
             files: 文件对象列表
+            deadline: time.monotonic() 的截止时间，None表示按 GOOGLE_FILES["timeout"] 计算
+            
+        Returns:
+            List: 处理完成后的文件对象
+        """
+        if deadline is None:
+            deadline = time.monotonic() + GOOGLE_FILES["timeout"]
+        return self._map_concurrent(lambda file: self._wait_for_file_active(file, deadline), files)
+            
+    def _map_concurrent(self, func, items: List) -> List:
+        """多个元素时使用线程池并发执行"""
+        if len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(len(items), GOOGLE_FILES["max_workers"])) as pool:
+            return list(pool.map(func, items))
+            
+    def _upload_files(self, files: List[Tuple[str, str]]):
+        """并发上传多个文件并等待处理完成，结果写入文件缓存
+        
+        Args:
+            files: (文件路径, MIME类型) 列表，所有文件共用 GOOGLE_FILES["timeout"] 的总时限
         """
-        for file in files:
-            self._wait_for_file_active(file)
+        pending = [item for item in dict.fromkeys(files) if self._file_cache_key(*item) not in self._file_cache]
+        deadline = time.monotonic() + GOOGLE_FILES["timeout"]
+        self._map_concurrent(lambda item: self._upload_file(item[0], item[1], deadline), pending)
+        
+    def _prefetch_files(self, messages: List[Message], key: str):
+        """并发上传尚未转换的消息中的所有附件，不支持的类型留给 _convert_parts 报错"""
+        files = []
+        for msg in messages:
+            if msg.files and not msg.has_converted(key):
+                for file_path in msg.files:
+                    file_type = self.get_file_type(file_path)
+                    if self.supports_file_type(file_type):
+                        files.append((file_path, file_type))
+        self._upload_files(files)
+        
+    def _registered_file(self, scope: str, digest: str, mime_type: str) -> Optional[object]:
+        """从上传登记表中查找可复用的文件，provider端已不可用时删除记录"""
+        registry = get_upload_registry()
+        entry = registry.get(scope, digest, mime_type)
+        if entry is None:
+            return None
+        try:
+            file = genai.get_file(entry["name"])
+        except (google_exceptions.NotFound, google_exceptions.PermissionDenied):
+            file = None
+        if file is None or file.state.name != "ACTIVE":
+            registry.remove(scope, digest, mime_type)
+            return None
+        return file
             
-    def _upload_file(self, file_path: str, mime_type: str) -> object:
-        """上传文件到Google API，带缓存功能
+    def _upload_scope(self) -> str:
+        """当前密钥的上传作用域，上传的文件只对上传时使用的API密钥可见"""
+        return upload_scope(self.provider, self._configured_key)
+        
+    def _file_cache_key(self, file_path: str, mime_type: str) -> str:
+        """进程内文件缓存的key，按密钥区分，切换密钥后不会复用其他密钥上传的文件"""
+        return f"{file_path}:{mime_type}:{self._upload_scope()}"
+        
+    def _conversion_key(self) -> str:
+        """转换结果引用了按密钥上传的文件，按密钥分开缓存"""
+        return f"GoogleModel:{self._upload_scope()}"
+        
+    def _upload_file(self, file_path: str, mime_type: str, deadline: Optional[float] = None) -> object:
+        """上传文件到Google API并等待处理完成
+        
+        进程内按路径缓存；相同内容的文件在上传登记表中记录未过期时直接复用，不重新上传
         
         Args:
             file_path: 文件路径
             mime_type: MIME类型
+            deadline: time.monotonic() 的截止时间，None表示按 GOOGLE_FILES["timeout"] 计算
             
         Returns:
             object: Google API的文件对象
         """
         # 生成缓存键
-        cache_key = f"{file_path}:{mime_type}"
+        cache_key = self._file_cache_key(file_path, mime_type)
         
         # 检查缓存
         if cache_key in self._file_cache:
             return self._file_cache[cache_key]
             
-        # 上传文件
-        print(f'正在上传文件: {file_path} ({mime_type})')
-        file = genai.upload_file(file_path, mime_type=mime_type)
-        print(f"文件已上传: {file.display_name} -> {file.uri}")
-        
-        # 等待文件处理完成
-        self._wait_for_file_active(file)
+        # 上传的文件只对上传时使用的API密钥可见
+        scope = self._upload_scope()
+        digest = file_digest(file_path)
+        file = self._registered_file(scope, digest, mime_type)
+        if file is None:
+            file = genai.upload_file(file_path, mime_type=mime_type)
+            file = self._wait_for_file_active(file, deadline)
+            expiration = file.expiration_time
+            get_upload_registry().put(scope, digest, mime_type, file.name, file.uri,
+                                      expiration.timestamp() if expiration else None)
         
         # 缓存结果
         self._file_cache[cache_key] = file
@@ -173,41 +265,41 @@ class GoogleModel(Model):
         return declarations
         
     def _convert_messages(self, messages: List[Message]) -> List[Dict]:
-        """转换消息格式为Google API格式"""
-        converted = []
-        uploaded_files = []
+        """转换消息格式为Google API格式，每条消息的parts会被缓存"""
+        key = self._conversion_key()
+        self._prefetch_files(messages, key)
+        return [
+            {
+                "role": "user" if msg.role == "user" else "model",
+                "parts": msg.get_converted(key, self._convert_parts)
+            }
+            for msg in messages
+        ]
         
-        for msg in messages:
-            parts = []
+    def _convert_parts(self, msg: Message) -> List:
+        """转换单条消息为Google API的parts列表"""
+        # 处理工具调用结果
+        if msg.role == "tool" and msg.tool_call_id:
+            return [f"Function response for {msg.tool_call_id}: {msg.text}"]
             
-            # 添加文本内容
-            if msg.text:
-                parts.append(msg.text)
+        parts = []
                 
-            # 添加文件内容
-            if msg.files:
-                for file_path in msg.files:
-                    # 检查文件类型
-                    file_type = self.get_file_type(file_path)
-                    if not self.supports_file_type(file_type):
-                        raise ValueError(f"Unsupported file type: {file_type}")
+        # 添加文本内容
+        if msg.text:
+            parts.append(msg.text)
                         
-                    # 上传文件到Google API（使用缓存）
-                    file = self._upload_file(file_path, file_type)
-                    parts.append(file)
-                    uploaded_files.append(file)
+        # 添加文件内容
+        if msg.files:
+            for file_path in msg.files:
+                # 检查文件类型
+                file_type = self.get_file_type(file_path)
+                if not self.supports_file_type(file_type):
+                    raise ValueError(f"Unsupported file type: {file_type}")
                     
-            # 处理工具调用结果
-            if msg.role == "tool" and msg.tool_call_id:
-                parts = [f"Function response for {msg.tool_call_id}: {msg.text}"]
+                # 上传文件到Google API（使用缓存）
+                parts.append(self._upload_file(file_path, file_type))
                 
-            message = {
-                "role": "user" if msg.role == "user" else "model",
-                "parts": parts
-            }
-            converted.append(message)
-            
-        return converted
+        return parts
         
     def clear_file_cache(self):
         """清除文件缓存"""
@@ -226,47 +318,31 @@ class GoogleModel(Model):
         for key in keys_to_remove:
             del self._file_cache[key]
             
-    def send(self, messages: List[Message], **kwargs) -> Union[Message, Generator[str, None, None]]:
-        """发送消息到模型并获取响应"""
-        self._ensure_client()
-        
-        # 合并参数
-        request_kwargs = self.default_kwargs.copy()
-        request_kwargs.update(kwargs)
+    def _chunk_text(self, chunk) -> Optional[str]:
+        """提取流式chunk中的文本"""
+        return chunk.text
         
-        # 转换消息格式
-        google_messages = self._convert_messages(messages)
-        
-        # 创建或获取聊天会话
-        chat = self.client.start_chat(history=google_messages[:-1])
-        
-        # 处理工具调用
-        tools = kwargs.get("tools", [])
-        if tools:
-            function_declarations = self._convert_tool_to_function_declarations(tools)
-            response = chat.send_message(
-                google_messages[-1]["parts"],
-                tools=[{
-                    "function_declarations": function_declarations
-                }],
-                stream=request_kwargs.get("stream", False)
-            )
-        else:
-            response = chat.send_message(
-                google_messages[-1]["parts"],
-                stream=request_kwargs.get("stream", False)
-            )
+    def _usage(self, metadata) -> Optional[Usage]:
+        """转换 usage_metadata，思考token按输出计费"""
+        if metadata is None:
+            return None
+        return Usage(
+            input_tokens=tokens(getattr(metadata, "prompt_token_count", None)),
+            output_tokens=(tokens(getattr(metadata, "candidates_token_count", None))
+                           + tokens(getattr(metadata, "thoughts_token_count", None))),
+            cache_read_tokens=tokens(getattr(metadata, "cached_content_token_count", None)),
+        )
         
-        if request_kwargs.get("stream"):
-            return self._handle_stream(response)
-        else:
-            return self._handle_response(response)
+    def _chunk_usage(self, chunk) -> Optional[Usage]:
+        """每个chunk都带有截至当前的累计用量"""
+        return self._usage(getattr(chunk, "usage_metadata", None))
             
     def _handle_stream(self, response) -> Generator[str, None, None]:
         """处理流式响应"""
         for chunk in response:
-            if chunk.text:
-                yield chunk.text
+            text = self._chunk_text(chunk)
+            if text:
+                yield text
                 
     def _handle_response(self, response) -> Message:
         """处理普通响应"""
@@ -303,13 +379,15 @@ class GoogleModel(Model):
                     return Message(
                         role="assistant",
                         text=f"Calling function: {function_call.name}",
-                        tool_calls=tool_calls
+                        tool_calls=tool_calls,
+                        usage=self._usage(getattr(response, "usage_metadata", None))
                     )
         
         # 如果没有函数调用或处理失败，返回普通响应
         return Message(
             role="assistant",
-            text=response.text if hasattr(response, 'text') else str(response)
+            text=response.text if hasattr(response, 'text') else str(response),
+            usage=self._usage(getattr(response, "usage_metadata", None))
         )
         
     def supports_files(self) -> bool:
@@ -333,35 +411,56 @@ class GoogleModel(Model):
         """设置模型配置"""
         self.default_kwargs.update(config)
         # 如果客户端已存在,更新配置
-        if self.client:
-            self.client.generation_config.update({
+        if self._client:
+            self._client.generation_config.update({
                 "temperature": config.get("temperature", self.default_kwargs["temperature"]),
                 "max_output_tokens": config.get("max_tokens", self.default_kwargs["max_tokens"])
             }) 
 
     def _prepare_request_kwargs(self, **kwargs) -> Dict:
         """准备请求参数"""
-        request_kwargs = self.default_kwargs.copy()
-        request_kwargs.update(kwargs)
+        # 合并参数
+        merged = self.default_kwargs.copy()
+        merged.update(kwargs)
         
         # 转换消息格式
         messages = self._convert_messages(kwargs.get("messages", []))
         
-        # 创建聊天会话
-        chat = self.client.start_chat(history=messages[:-1])
-        request_kwargs["chat"] = chat
-        request_kwargs["message"] = messages[-1]["parts"]
+        # 创建聊天会话，最后一条消息作为本次发送的内容
+        request_kwargs = {
+            "chat": self.client.start_chat(history=messages[:-1]),
+            "message": messages[-1]["parts"],
+            "stream": merged.get("stream", False),
+        }
         
         # 处理工具调用
-        if "tools" in kwargs:
+        tools = kwargs.get("tools")
+        if tools:
             request_kwargs["tools"] = [{
-                "function_declarations": self._convert_tool_to_function_declarations(kwargs["tools"])
+                "function_declarations": self._convert_tool_to_function_declarations(tools)
             }]
         
         return request_kwargs
 
+    def _cache_payload(self, messages: List[Message], request_kwargs: Dict) -> Dict:
+        """请求中的chat对象无法稳定序列化，改用转换后的消息和生成参数计算缓存key"""
+        return {
+            "class": self.__class__.__name__,
+            "model": self.default_kwargs.get("model"),
+            "temperature": self.default_kwargs.get("temperature"),
+            "max_tokens": self.default_kwargs.get("max_tokens"),
+            "messages": self._convert_messages(messages),
+            "tools": request_kwargs.get("tools"),
+        }
+
     def _send_llm(self, **kwargs) -> Any:
         """发送请求到Google API"""
         chat = kwargs.pop("chat")
         message = kwargs.pop("message")
-        return chat.send_message(message, **kwargs)
\ No newline at end of file
+        return chat.send_message(message, **kwargs)
+        
+    async def _asend_llm(self, **kwargs) -> Any:
+        """异步发送请求到Google API"""
+        chat = kwargs.pop("chat")
+        message = kwargs.pop("message")
+        return await chat.send_message_async(message, **kwargs)
\ No newline at end of file
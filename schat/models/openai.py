@@ -1,14 +1,22 @@
-import base64
 import mimetypes
-from typing import List, Dict, Generator, Union, Any
+from urllib.parse import urlparse
+from typing import List, Dict, Generator, Any, Optional
 import openai
 from .base import Model
 from ..core.message import Message
+from ..core.file_cache import get_attachment_cache
+from ..core.client_pool import get_client_pool
+from ..core.usage import Usage, tokens
+
+# 官方OpenAI接口的主机名，只有官方接口默认在流式响应中返回用量
+OPENAI_HOST = "api.openai.com"
 
 class OpenAIModel(Model):
     """OpenAI模型"""
     
-    def __init__(self, provider: str = "openai", **kwargs):
+    reports_usage = True
+    
+    def __init__(self, provider: str = "openai", stream_usage: Optional[bool] = None, **kwargs):
         super().__init__(provider, **kwargs)
         self._supported_file_types = [
             'image/jpeg', 'image/png', 'image/webp'
@@ -21,97 +29,93 @@ class OpenAIModel(Model):
             "model": "gpt-3.5-turbo"
         }
         self.default_kwargs.update(kwargs)
-        
-    def _ensure_client(self):
-        """确保OpenAI客户端已初始化"""
-        if not self.client:
-            if not self.api_key:
-                # 使用provider名称获取key
-                self.api_key = self._key_manager.get_key(self.provider)
-            if not self.api_key:
-                raise ValueError(f"API key not set and no key available from manager for provider {self.provider}")
+        # 流式请求时是否要求在最后一个chunk中返回用量（stream_options.include_usage），
+        # None 表示只对官方OpenAI接口开启，兼容接口不一定支持该参数
+        self.stream_usage = stream_usage
+        
+    def _client_kwargs(self, api_key: str, http_client: Any) -> Dict:
+        """构造客户端初始化参数，同步和异步客户端共用"""
+        client_kwargs = {
+            "api_key": api_key,
+            "http_client": http_client,
+        }
+        if self.base_url:
+            client_kwargs["base_url"] = self.base_url
+        return client_kwargs
                 
-            client_kwargs = {
-                "api_key": self.api_key,
-                #**self.default_kwargs  # 添加默认参数
-            }
+    def _create_client(self, api_key: str) -> openai.OpenAI:
+        """创建使用指定密钥的OpenAI客户端"""
+        http_client = get_client_pool().http_client(openai.DefaultHttpxClient, self.base_url)
+        return openai.OpenAI(**self._client_kwargs(api_key, http_client))
             
-            if self.base_url:
-                client_kwargs["base_url"] = self.base_url
-                
-            self.client = openai.OpenAI(**client_kwargs)
-            
-    def send(self, messages: List[Message], **kwargs) -> Union[Message, Generator[str, None, None]]:
-        self._ensure_client()
-        
-        # 合并参数
-        request_kwargs = self.default_kwargs.copy()
-        request_kwargs.update(kwargs)
-        
-        # 转换消息格式
-        openai_messages = self._convert_messages(messages)
-        
-        # 准备请求参数
-        api_kwargs = {
-            "messages": openai_messages,
-            "model": request_kwargs.pop("model", self.default_kwargs["model"]),
-            "stream": request_kwargs.pop("stream", False),
-        }
-        
-        # 添加其他参数
-        if "tools" in request_kwargs:
-            api_kwargs["tools"] = request_kwargs.pop("tools")
-        
-        # 添加剩余的参数
-        api_kwargs.update(request_kwargs)
-        
-        # 发送请求
-        #print(api_kwargs)
-        response = self.client.chat.completions.create(**api_kwargs)
-        
-        if api_kwargs["stream"]:
-            return self._handle_stream(response)
-        else:
-            return self._handle_response(response)
+    def _create_async_client(self, api_key: str) -> openai.AsyncOpenAI:
+        """创建使用指定密钥的OpenAI异步客户端"""
+        http_client = get_client_pool().http_client(openai.DefaultAsyncHttpxClient, self.base_url)
+        return openai.AsyncOpenAI(**self._client_kwargs(api_key, http_client))
             
     def _convert_messages(self, messages: List[Message]) -> List[Dict]:
-        """转换息格式为OpenAI API格式"""
-        converted = []
-        for msg in messages:
-            message = {"role": msg.role}
+        """转换消息格式为OpenAI API格式，每条消息的转换结果会被缓存"""
+        key = self._conversion_key()
+        return [dict(msg.get_converted(key, self._convert_message)) for msg in messages]
             
-            # 处理内容
-            if msg.files:
-                content = [{"type": "text", "text": msg.text or ""}]
-                for file_path in msg.files:
-                    content.append({
-                        "type": "image_url",
-                        "image_url": self.process_file(file_path)
-                    })
-                message["content"] = content
-            else:
-                message["content"] = msg.text or ""
+    def _convert_message(self, msg: Message) -> Dict:
+        """转换单条消息为OpenAI API格式"""
+        message = {"role": msg.role}
                 
-            # 添加名称（如果有）
-            if msg.name:
-                message["name"] = msg.name
+        # 处理内容
+        if msg.files:
+            content = [{"type": "text", "text": msg.text or ""}]
+            for file_path in msg.files:
+                content.append({
+                    "type": "image_url",
+                    "image_url": self.process_file(file_path)
+                })
+            message["content"] = content
+        else:
+            message["content"] = msg.text or ""
                 
-            # 只有在assistant响应中才添加tool_calls
-            if msg.role == "assistant" and msg.tool_calls:
-                message["tool_calls"] = msg.tool_calls
+        # 添加名称（如果有）
+        if msg.name:
+            message["name"] = msg.name
                 
-            # 添加工具调用ID（如果有）
-            if msg.tool_call_id:
-                message["tool_call_id"] = msg.tool_call_id
+        # 只有在assistant响应中才添加tool_calls
+        if msg.role == "assistant" and msg.tool_calls:
+            message["tool_calls"] = msg.tool_calls
                 
-            converted.append(message)
-        return converted
+        # 添加工具调用ID（如果有）
+        if msg.tool_call_id:
+            message["tool_call_id"] = msg.tool_call_id
+            
+        return message
+        
+    def _chunk_text(self, chunk) -> Optional[str]:
+        """提取流式chunk中的文本"""
+        if not chunk.choices:
+            return None
+        return getattr(chunk.choices[0].delta, 'content', None)
+        
+    def _usage(self, usage) -> Optional[Usage]:
+        """转换响应中的 usage，DeepSeek 的缓存命中数在 prompt_cache_hit_tokens 中"""
+        if usage is None:
+            return None
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached = tokens(getattr(details, "cached_tokens", None)) or tokens(getattr(usage, "prompt_cache_hit_tokens", None))
+        return Usage(
+            input_tokens=tokens(getattr(usage, "prompt_tokens", None)),
+            output_tokens=tokens(getattr(usage, "completion_tokens", None)),
+            cache_read_tokens=cached,
+        )
+        
+    def _chunk_usage(self, chunk) -> Optional[Usage]:
+        """最后一个chunk的 choices 为空，带有整个请求的用量"""
+        return self._usage(getattr(chunk, "usage", None))
         
     def _handle_stream(self, response) -> Generator[str, None, None]:
         """处理流式响应"""
         for chunk in response:
-            if hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                yield chunk.choices[0].delta.content
+            text = self._chunk_text(chunk)
+            if text:
+                yield text
                 
     def _handle_response(self, response) -> Message:
         """处理普通响应"""
@@ -146,6 +150,7 @@ class OpenAIModel(Model):
             if not message_data["text"]:
                 message_data["text"] = "Calling function: " + tool_calls[0]["function"]["name"]
         
+        message_data["usage"] = self._usage(getattr(response, "usage", None))
         return Message(**message_data)
         
     def supports_files(self) -> bool:
@@ -179,8 +184,8 @@ class OpenAIModel(Model):
             return mimetypes.guess_type(file_path)[0] or 'application/octet-stream'
             
     def encode_file(self, file_path: str) -> str:
-        with open(file_path, "rb") as f:
-            return base64.b64encode(f.read()).decode('utf-8')
+        """读取并base64编码本地文件，结果在进程内共享缓存"""
+        return get_attachment_cache().get_encoded(file_path)
     
     def get_model_config(self) -> Dict:
         """获取模型配置"""
@@ -193,23 +198,33 @@ class OpenAIModel(Model):
         
     def _prepare_request_kwargs(self, **kwargs) -> Dict:
         """准备请求参数"""
+        # 合并默认参数，用户参数优先
+        merged = self.default_kwargs.copy()
+        merged.update(kwargs)
+        
         request_kwargs = {
-            "messages": self._convert_messages(kwargs.get("messages", [])),
-            "model": kwargs.get("model", self.default_kwargs["model"]),
-            "stream": kwargs.get("stream", False),
+            "messages": self._convert_messages(merged.pop("messages", [])),
+            "model": merged.pop("model", self.default_kwargs["model"]),
+            "stream": merged.pop("stream", False),
         }
         
-        # 添加工具支持
-        if "tools" in kwargs:
-            request_kwargs["tools"] = kwargs["tools"]
-        
-        # 添加其他参数
-        for key, value in kwargs.items():
-            if key not in ["messages", "tools"]:
-                request_kwargs[key] = value
+        # 添加其他参数（包括tools）
+        request_kwargs.update(merged)
+        if request_kwargs["stream"] and self._include_stream_usage():
+            request_kwargs.setdefault("stream_options", {"include_usage": True})
                 
         return request_kwargs
         
+    def _include_stream_usage(self) -> bool:
+        """流式请求是否发送 stream_options，未设置 stream_usage 时只对官方接口发送"""
+        if self.stream_usage is not None:
+            return self.stream_usage
+        return not self.base_url or urlparse(self.base_url).hostname == OPENAI_HOST
+        
     def _send_llm(self, **kwargs) -> Any:
         """发送请求到OpenAI API"""
-        return self.client.chat.completions.create(**kwargs)
\ No newline at end of file
+        return self.client.chat.completions.create(**kwargs)
+        
+    async def _asend_llm(self, **kwargs) -> Any:
+        """异步发送请求到OpenAI API"""
+        return await self.async_client.chat.completions.create(**kwargs)
\ No newline at end of file
@@ -1,5 +1,4 @@
 from typing import Dict, List
-import openai
 from .openai import OpenAIModel
 from .anthropic_helper import add_cache_to_messages
 from ..core.message import Message
@@ -15,6 +14,15 @@ class OpenRouterModel(OpenAIModel):
         """检查是否是Claude模型"""
         return "claude" in model.lower()
         
+    def _to_content_blocks(self, messages: List[Dict]) -> List[Dict]:
+        """把字符串content转换为content block列表，以便添加cache_control"""
+        result = []
+        for msg in messages:
+            if isinstance(msg.get("content"), str) and msg["content"]:
+                msg = dict(msg, content=[{"type": "text", "text": msg["content"]}])
+            result.append(msg)
+        return result
+        
     def before_send(self, messages: List[Message], request_kwargs: Dict) -> Dict:
         """在发送前处理消息和参数"""
         model = request_kwargs.get("model", self.default_kwargs.get("model", ""))
@@ -28,25 +36,8 @@ class OpenRouterModel(OpenAIModel):
             
             # 如果有消息，添加缓存控制
             if "messages" in request_kwargs:
-                request_kwargs["messages"] = add_cache_to_messages(request_kwargs["messages"])
+                request_kwargs["messages"] = add_cache_to_messages(
+                    self._to_content_blocks(request_kwargs["messages"])
+                )
         
         return request_kwargs
-    
-    def _create_client(self, **kwargs) -> openai.OpenAI:
-        """创建OpenAI客户端"""
-        return openai.OpenAI(**kwargs)
-    
-    def _ensure_client(self):
-        """确保OpenRouter客户端已初始化"""
-        if not self.client:
-            if not self.api_key:
-                self.api_key = self._key_manager.get_key(self.provider)
-            if not self.api_key:
-                raise ValueError(f"API key not set and no key available from manager for provider {self.provider}")
-            
-            client_kwargs = {
-                "api_key": self.api_key,
-                "base_url": self.base_url
-            }
-            
-            self.client = self._create_client(**client_kwargs)
\ No newline at end of file
@@ -3,8 +3,40 @@ from .base import Model
 from ..config import DEFAULT_PROVIDERS
 import importlib
 
+# 模型类名 -> 所在模块，用于按需导入，避免 import schat 时加载所有SDK
+MODEL_MODULES = {
+    "OpenAIModel": "schat.models.openai",
+    "AnthropicModel": "schat.models.anthropic",
+    "GoogleModel": "schat.models.google",
+    "OpenRouterModel": "schat.models.openrouter",
+}
+
+
+def load_model_class(class_name: str) -> Type[Model]:
+    """按类名导入模型类
+
+    Args:
+        class_name: 模型类名，如 'OpenAIModel'
+
+    Returns:
+        Type[Model]: 模型类
+
+    Raises:
+        ImportError: 模型类依赖的SDK未安装
+        AttributeError: 模型类不存在
+    """
+    module_name = MODEL_MODULES.get(class_name)
+    if module_name is None:
+        raise AttributeError(f"Unknown model class {class_name}")
+    module = importlib.import_module(module_name)
+    return getattr(module, class_name)
+
+
 class ProviderManager:
-    """Provider管理类"""
+    """Provider管理类
+
+    provider的模型类在第一次获取配置时才解析，注册阶段不导入任何SDK
+    """
     
     _instance = None
     _providers: Dict[str, Dict] = {}  # 存储provider的完整配置
@@ -22,64 +54,62 @@ class ProviderManager:
             try:
                 self.register_provider(provider, config)
             except ValueError:
-                # 如果模型类不存在，跳过注册
+                # 如果配置无效，跳过注册
                 continue
     
     def register_provider(self, provider: str, config: Dict):
         """注册provider
+
+        字符串形式的class只做名称校验，真正的导入推迟到 get_provider_config
         
         Args:
             provider: provider名称
             config: provider配置，包含class、base_url等信息
             
         Raises:
-            ValueError: 配置无效或模型类加载失败
+            ValueError: 配置无效
         """
+        config = config.copy()
+        class_name = config.get("class")
+        if isinstance(class_name, str):
+            if class_name not in MODEL_MODULES:
+                raise ValueError(f"Failed to register provider {provider}: unknown model class {class_name}")
+        elif class_name is not None:
+            # 如果class不是字符串，假设是直接的类引用
+            if not (isinstance(class_name, type) and issubclass(class_name, Model)):
+                raise ValueError(f"Failed to register provider {provider}: {class_name} is not a subclass of Model")
+            config["model_class"] = class_name
+        self._providers[provider] = config
+
+    def _resolve_model_class(self, provider: str, config: Dict) -> Optional[Type[Model]]:
+        """解析并缓存provider的模型类"""
+        if "model_class" in config:
+            return config["model_class"]
+        class_name = config.get("class")
+        if class_name is None:
+            return None
         try:
-            self._providers[provider] = config.copy()
+            ModelClass = load_model_class(class_name)
+        except ImportError as e:
+            if "google" in class_name.lower():
+                raise ImportError(
+                    "Google Generative AI package not installed. "
+                    "Please install it with: pip install google-generativeai"
+                ) from e
+            raise ValueError(f"Failed to load model class {class_name}: {e}")
+        except AttributeError as e:
+            raise ValueError(f"Failed to load model class {class_name}: {e}")
             
-            # 如果配置中包含模型类，尝试加载
-            if "class" in config:
-                class_name = config["class"]
-                if isinstance(class_name, str):
-                    # 动态导入模型类
-                    try:
-                        # 从 schat.models 包中导入
-                        module = importlib.import_module("..models", package="schat.models")
-                        ModelClass = getattr(module, class_name)
-                        
-                        # 验证是否是 Model 的子类
-                        if not issubclass(ModelClass, Model):
-                            raise ValueError(f"Class {class_name} is not a subclass of Model")
-                            
-                        self._providers[provider]["model_class"] = ModelClass
-                        
-                    except (ImportError, AttributeError) as e:
-                        # 如果导入失败，尝试检查是否需要额外的依赖
-                        if "google" in class_name.lower():
-                            try:
-                                import google.generativeai
-                                from .google import GoogleModel as ModelClass
-                                self._providers[provider]["model_class"] = ModelClass
-                            except ImportError:
-                                raise ImportError(
-                                    "Google Generative AI package not installed. "
-                                    "Please install it with: pip install google-generativeai"
-                                )
-                        else:
-                            raise ValueError(f"Failed to load model class {class_name}: {e}")
-                else:
-                    # 如果class不是字符串，假设是直接的类引用
-                    self._providers[provider]["model_class"] = class_name
-                    
-        except Exception as e:
-            # 如果发生任何错误，移除配置
-            if provider in self._providers:
-                del self._providers[provider]
-            raise ValueError(f"Failed to register provider {provider}: {e}")
+        # 验证是否是 Model 的子类
+        if not issubclass(ModelClass, Model):
+            raise ValueError(f"Class {class_name} is not a subclass of Model")
+        config["model_class"] = ModelClass
+        return ModelClass
     
     def get_provider_config(self, provider: str) -> Dict:
         """获取provider的完整配置"""
         if provider not in self._providers:
             raise ValueError(f"Unknown provider: {provider}")
-        return self._providers[provider]
\ No newline at end of file
+        config = self._providers[provider]
+        self._resolve_model_class(provider, config)
+        return config
\ No newline at end of file
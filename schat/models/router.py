@@ -0,0 +1,283 @@
+import time
+import weakref
+from contextvars import ContextVar
+from threading import Lock
+from typing import Any, Dict, Generator, List, Optional, Union
+from .base import Model
+from ..config import ROUTING
+from ..core.circuit_breaker import CircuitBreaker
+from ..core.message import Message
+from ..core.streaming import StreamingResponse, AsyncStreamingResponse
+
+
+class RouteMember:
+    """路由组中的一个成员及其统计"""
+
+    def __init__(self, model: Union[str, Model], cost: float = 0.0, breaker: Optional[CircuitBreaker] = None):
+        self.model = model  # 'provider:model' 字符串或模型实例
+        self.cost = cost  # 相对成本，按 cost_weight 计入得分
+        self.breaker = breaker or CircuitBreaker()
+        self.latency: Optional[float] = None  # 成功请求延迟的EWMA（秒）
+        self.error_rate = 0.0  # 错误率的EWMA
+        self.in_flight = 0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def name(self) -> str:
+        if isinstance(self.model, str):
+            return self.model
+        return f"{self.model.provider}:{self.model.default_kwargs.get('model', '')}"
+
+    def resolve(self) -> Model:
+        """获取成员的模型实例"""
+        if isinstance(self.model, Model):
+            return self.model
+        from .factory import ModelFactory
+        return ModelFactory.get_model(self.model)
+
+
+class RouterModel(Model):
+    """路由组：像普通模型一样使用，每个请求按得分选择一个成员模型
+
+    得分 = EWMA延迟 * (1 + error_weight * EWMA错误率) + cost_weight * 成本，越低越好；
+    还没有尝试过的成员得分为0，会被优先尝试；尝试过但从未成功的成员按已知最高延迟估算。
+    连续失败的成员会被熔断，恢复时间后放行一个探测请求。
+    请求失败时按得分依次尝试其他成员，最多 max_attempts 个。
+    """
+
+    def __init__(self,
+                 name: str,
+                 members: List[Union[str, Model, RouteMember]],
+                 costs: Optional[Dict[str, float]] = None,
+                 ewma_alpha: Optional[float] = None,
+                 error_weight: Optional[float] = None,
+                 cost_weight: Optional[float] = None,
+                 max_attempts: Optional[int] = None,
+                 failure_threshold: Optional[int] = None,
+                 recovery_seconds: Optional[float] = None):
+        super().__init__(provider=name)
+        if not members:
+            raise ValueError(f"Route {name} has no members")
+        self.name = name
+        self.ewma_alpha = ROUTING["ewma_alpha"] if ewma_alpha is None else ewma_alpha
+        self.error_weight = ROUTING["error_weight"] if error_weight is None else error_weight
+        self.cost_weight = ROUTING["cost_weight"] if cost_weight is None else cost_weight
+        self.max_attempts = max_attempts or ROUTING["max_attempts"]
+        threshold = failure_threshold or ROUTING["failure_threshold"]
+        recovery = ROUTING["recovery_seconds"] if recovery_seconds is None else recovery_seconds
+        costs = costs or {}
+        self.members: List[RouteMember] = []
+        for member in members:
+            if not isinstance(member, RouteMember):
+                member = RouteMember(member, breaker=CircuitBreaker(threshold, recovery))
+                member.cost = costs.get(member.name, 0.0)
+            self.members.append(member)
+        # 最近一次请求使用的成员，保存在上下文变量中，多个线程共享路由组时互不影响
+        self._current_member: ContextVar[Optional[str]] = ContextVar(
+            f"schat_current_member_{id(self)}", default=None
+        )
+        self._lock = Lock()
+
+    @property
+    def current_member(self) -> Optional[str]:
+        """当前上下文中最近一次请求使用的成员"""
+        return self._current_member.get()
+
+    def _score(self, member: RouteMember, default_latency: float = 0.0) -> float:
+        """成员得分，调用方需持有锁"""
+        if member.latency is not None:
+            latency = member.latency
+        elif member.requests == 0:
+            latency = 0.0  # 还没有尝试过，优先探索
+        else:
+            latency = default_latency
+        return latency * (1 + self.error_weight * member.error_rate) + self.cost_weight * member.cost
+
+    def _default_latency(self) -> float:
+        """尝试过但从未成功的成员按已知最高延迟估算，调用方需持有锁"""
+        known = [m.latency for m in self.members if m.latency is not None]
+        return max(known) if known else 0.0
+
+    def _candidates(self) -> List[RouteMember]:
+        """按得分排序的可用成员，全部熔断时强制探测最早恢复的成员"""
+        with self._lock:
+            default = self._default_latency()
+            ranked = sorted(self.members, key=lambda m: (self._score(m, default), m.in_flight))
+        allowed = []
+        for member in ranked:
+            if len(allowed) >= self.max_attempts:
+                break
+            if member.breaker.allow():
+                allowed.append(member)
+        if not allowed:
+            member = min(self.members, key=lambda m: m.breaker.open_until)
+            member.breaker.force_probe()
+            allowed = [member]
+        return allowed
+
+    def _begin(self, member: RouteMember) -> float:
+        with self._lock:
+            member.in_flight += 1
+            member.requests += 1
+        return time.perf_counter()
+
+    def _record(self, member: RouteMember, started: float, error: Optional[BaseException] = None):
+        """更新成员的EWMA统计和熔断器"""
+        alpha = self.ewma_alpha
+        with self._lock:
+            member.in_flight -= 1
+            member.error_rate = (1 - alpha) * member.error_rate + alpha * (1.0 if error else 0.0)
+            if error is None:
+                latency = time.perf_counter() - started
+                member.latency = latency if member.latency is None else (1 - alpha) * member.latency + alpha * latency
+            else:
+                member.errors += 1
+        if error is None:
+            member.breaker.record_success()
+        else:
+            member.breaker.record_failure()
+
+    def _abandon(self, member: RouteMember):
+        """流式响应被提前关闭或没有读取就被回收，只释放占用，不计入统计"""
+        with self._lock:
+            member.in_flight -= 1
+        member.breaker.release()
+
+    def _watch_stream(self, member: RouteMember, started: float, response: Any) -> Any:
+        """包装成员的流式响应，读完时计入延迟，读取中出错时计入失败"""
+        settled = []
+
+        def settle(error: Optional[BaseException] = None, abandoned: bool = False):
+            if settled:
+                return
+            settled.append(True)
+            if abandoned:
+                self._abandon(member)
+            else:
+                self._record(member, started, error)
+
+        if isinstance(response, AsyncStreamingResponse):
+            async def chunks():
+                try:
+                    async for chunk in response:
+                        yield chunk
+                except Exception as e:
+                    settle(e)
+                    raise
+                else:
+                    settle()
+                finally:
+                    settle(abandoned=True)
+                    await response.aclose()
+            wrapper = AsyncStreamingResponse(chunks(), started_at=response.started_at)
+        else:
+            def chunks():
+                try:
+                    yield from response
+                except Exception as e:
+                    settle(e)
+                    raise
+                else:
+                    settle()
+                finally:
+                    settle(abandoned=True)
+                    response.close()
+            wrapper = StreamingResponse(chunks(), started_at=response.started_at)
+        # 没有读取就被回收的流不会执行生成器，回收时释放占用
+        weakref.finalize(wrapper, settle, None, True)
+        # 成员的用量和计时在读取过程中原地更新
+        wrapper.usage = response.usage
+        wrapper.timings = response.timings
+        return wrapper
+
+    def _release(self, members: List[RouteMember]):
+        """没有实际发送请求的成员，释放 allow() 占用的探测名额"""
+        for member in members:
+            member.breaker.release()
+
+    def send(self, messages: List[Message], **kwargs) -> Union[Message, StreamingResponse]:
+        """选择成员并发送请求，失败时尝试下一个成员"""
+        candidates = self._candidates()
+        error = None
+        for i, member in enumerate(candidates):
+            started = self._begin(member)
+            try:
+                response = member.resolve().send(messages, **kwargs)
+            except Exception as e:
+                self._record(member, started, e)
+                error = e
+                continue
+            self._release(candidates[i + 1:])
+            self._current_member.set(member.name)
+            if isinstance(response, (StreamingResponse, AsyncStreamingResponse)):
+                # 流式响应在流结束时才计入延迟和成败
+                return self._watch_stream(member, started, response)
+            self._record(member, started)
+            return response
+        raise error
+
+    async def asend(self, messages: List[Message], **kwargs) -> Union[Message, AsyncStreamingResponse]:
+        """异步选择成员并发送请求，失败时尝试下一个成员"""
+        candidates = self._candidates()
+        error = None
+        for i, member in enumerate(candidates):
+            started = self._begin(member)
+            try:
+                response = await member.resolve().asend(messages, **kwargs)
+            except Exception as e:
+                self._record(member, started, e)
+                error = e
+                continue
+            self._release(candidates[i + 1:])
+            self._current_member.set(member.name)
+            if isinstance(response, (StreamingResponse, AsyncStreamingResponse)):
+                return self._watch_stream(member, started, response)
+            self._record(member, started)
+            return response
+        raise error
+
+    def stats(self) -> Dict[str, Dict]:
+        """各成员的延迟、错误率和熔断状态"""
+        with self._lock:
+            default = self._default_latency()
+            result = {}
+            for member in self.members:
+                result[member.name] = {
+                    "latency": member.latency,
+                    "error_rate": member.error_rate,
+                    "cost": member.cost,
+                    "score": self._score(member, default),
+                    "in_flight": member.in_flight,
+                    "requests": member.requests,
+                    "errors": member.errors,
+                }
+        for member in self.members:
+            result[member.name]["circuit"] = member.breaker.stats()["state"]
+        return result
+
+    def _send_llm(self, **kwargs) -> Any:
+        raise NotImplementedError("RouterModel delegates requests to its members")
+
+    def _prepare_request_kwargs(self, **kwargs) -> Dict:
+        raise NotImplementedError("RouterModel delegates requests to its members")
+
+    def _handle_stream(self, response) -> Generator[str, None, None]:
+        raise NotImplementedError("RouterModel delegates requests to its members")
+
+    def _handle_response(self, response) -> Message:
+        raise NotImplementedError("RouterModel delegates requests to its members")
+
+    def supports_files(self) -> bool:
+        return all(m.resolve().supports_files() for m in self.members)
+
+    def supports_tools(self) -> bool:
+        return all(m.resolve().supports_tools() for m in self.members)
+
+    def get_model_config(self) -> Dict:
+        return self.members[0].resolve().get_model_config()
+
+    def set_model_config(self, config: Dict):
+        """配置会应用到所有成员，不应包含 model 字段"""
+        for member in self.members:
+            member.resolve().set_model_config(config)
@@ -1,8 +1,16 @@
+import asyncio
+import re
+import threading
+import time
 import pytest
 from schat import ChatSession, Message
 from schat.models.base import Model
 from schat.models.factory import ModelFactory
-from typing import List, Generator, Union, Dict, Any
+from schat.core.client_pool import get_client_pool
+from schat.core.key_manager import APIKeyManager
+from schat.core.usage import Usage
+from schat.config import UPLOAD_REGISTRY
+from typing import Callable, List, Generator, Optional, Union, Dict, Any
 
 class MockModel(Model):
     """用于测试的模拟Model"""
@@ -74,6 +82,151 @@ class MockModel(Model):
     def set_model_config(self, config: Dict):
         self.default_kwargs.update(config)
 
+class FakeModel(Model):
+    """走完整请求流程（选择密钥、转换、发送、流式读取）的可配置模拟模型
+
+    Args:
+        provider: provider名称，api_key 为None时从密钥管理器选择该provider的密钥
+        api_key: 显式设置的密钥
+        reply: 回复文本，或函数 (最后一条消息的文本, 密钥) -> 回复文本
+        delay: 上游延迟（秒），或 {密钥: 秒}
+        fail: 为True，或函数 (最后一条消息的文本, 密钥) 返回True时上游请求失败
+        chunk_delay: 流式响应中读取每个chunk前的延迟，回复按单词分成chunk
+        convert_delay: 准备请求参数的耗时
+        stream_error: 流式响应读出第一个chunk后抛出的异常
+        usage: 每次请求上报的token用量，设置后模型按 reports_usage 处理用量
+
+    calls 记录每次上游请求使用的密钥，max_in_flight 记录每个密钥的最大并发数
+    """
+    def __init__(self, provider: str = "fake", api_key: Optional[str] = "test-key",
+                 reply: Union[str, Callable[[str, str], str]] = lambda text, key: f"echo: {text}",
+                 delay: Union[float, Dict[str, float]] = 0.0,
+                 fail: Union[bool, Callable[[str, str], bool]] = False,
+                 chunk_delay: float = 0.0, convert_delay: float = 0.0, model: str = "fake-model",
+                 stream_error: Optional[BaseException] = None, usage: Optional[Usage] = None):
+        super().__init__(provider, model=model)
+        self.api_key = api_key
+        self.reply = reply
+        self.delay = delay
+        self.fail = fail
+        self.chunk_delay = chunk_delay
+        self.convert_delay = convert_delay
+        self.stream_error = stream_error
+        self.usage = usage
+        self.reports_usage = usage is not None
+        self.calls: List[str] = []
+        self.in_flight: Dict[str, int] = {}
+        self.max_in_flight: Dict[str, int] = {}
+        self._calls_lock = threading.Lock()
+
+    def _create_client(self, api_key: str) -> Any:
+        return api_key
+
+    def _prepare_request_kwargs(self, **kwargs) -> Dict:
+        time.sleep(self.convert_delay)
+        request = {
+            "model": kwargs.get("model", self.default_kwargs["model"]),
+            "messages": [m.text for m in kwargs["messages"]],
+            "stream": kwargs.get("stream", False),
+        }
+        if "temperature" in kwargs:
+            request["temperature"] = kwargs["temperature"]
+        return request
+
+    def _begin(self, kwargs: Dict):
+        key = self.current_key
+        with self._calls_lock:
+            self.calls.append(key)
+            self.in_flight[key] = self.in_flight.get(key, 0) + 1
+            self.max_in_flight[key] = max(self.max_in_flight.get(key, 0), self.in_flight[key])
+        delay = self.delay.get(key, 0.0) if isinstance(self.delay, dict) else self.delay
+        return key, kwargs["messages"][-1], delay
+
+    def _end(self, key: str, text: str) -> str:
+        with self._calls_lock:
+            self.in_flight[key] -= 1
+        fail = self.fail(text, key) if callable(self.fail) else self.fail
+        if fail:
+            raise RuntimeError("upstream error")
+        return self.reply(text, key) if callable(self.reply) else self.reply
+
+    def _send_llm(self, **kwargs) -> Any:
+        key, text, delay = self._begin(kwargs)
+        time.sleep(delay)
+        reply = self._end(key, text)
+        return self._stream(reply) if kwargs["stream"] else reply
+
+    async def _asend_llm(self, **kwargs) -> Any:
+        key, text, delay = self._begin(kwargs)
+        await asyncio.sleep(delay)
+        reply = self._end(key, text)
+        return self._astream(reply) if kwargs["stream"] else reply
+
+    def _chunks(self, reply: str) -> List[str]:
+        return re.findall(r"\S+\s*|\s+", reply)
+
+    def _stream(self, reply: str):
+        for chunk in self._chunks(reply):
+            time.sleep(self.chunk_delay)
+            yield chunk
+            if self.stream_error is not None:
+                raise self.stream_error
+
+    async def _astream(self, reply: str):
+        for chunk in self._chunks(reply):
+            await asyncio.sleep(self.chunk_delay)
+            yield chunk
+            if self.stream_error is not None:
+                raise self.stream_error
+
+    def _chunk_text(self, chunk) -> Optional[str]:
+        return chunk
+
+    def _chunk_usage(self, chunk) -> Optional[Usage]:
+        return self.usage
+
+    def _handle_stream(self, response) -> Generator[str, None, None]:
+        for chunk in response:
+            yield chunk
+
+    def _handle_response(self, response) -> Message:
+        message = Message(role="assistant", text=response)
+        message.usage = self.usage.copy() if self.usage is not None else None
+        return message
+
+@pytest.fixture
+def key_pool():
+    """设置provider的密钥，测试结束后删除这些provider的密钥、计数和健康状态
+
+    Returns:
+        add(provider, *keys) -> APIKeyManager，会先清除provider已有的状态
+    """
+    manager = APIKeyManager()
+    providers = set()
+
+    def add(provider: str, *keys: str) -> APIKeyManager:
+        manager.remove_keys(provider)
+        providers.add(provider)
+        for key in keys:
+            manager.add_key(provider, key)
+        return manager
+
+    yield add
+    for provider in providers:
+        manager.remove_keys(provider)
+
+@pytest.fixture(autouse=True)
+def memory_upload_registry(monkeypatch):
+    """测试默认不把上传登记表写入用户缓存目录"""
+    monkeypatch.setitem(UPLOAD_REGISTRY, "path", None)
+
+@pytest.fixture(autouse=True)
+def clear_client_pool():
+    """测试会替换SDK客户端，每个测试使用干净的客户端池"""
+    get_client_pool().clear()
+    yield
+    get_client_pool().clear()
+
 @pytest.fixture
 def mock_model():
     model = MockModel()
@@ -0,0 +1,76 @@
+import asyncio
+import pytest
+from schat import AsyncChatSession, Message
+from tests.conftest import MockModel
+
+@pytest.fixture
+def async_session(mock_model):
+    return AsyncChatSession(default_model=mock_model)
+
+def test_async_send(async_session, mock_model):
+    mock_model.set_responses(["Hello async"])
+    response = asyncio.run(async_session.send("Hi"))
+    assert isinstance(response, Message)
+    assert response.text == "Hello async"
+    assert len(async_session.history) == 2
+    assert async_session.history[0].role == "user"
+
+def test_async_stream(async_session, mock_model):
+    mock_model.set_responses(["Streamed"])
+    
+    async def collect():
+        return [chunk async for chunk in async_session.astream("Hi")]
+    
+    chunks = asyncio.run(collect())
+    assert "".join(chunks) == "Streamed"
+    assert len(async_session.history) == 2
+    assert async_session.history[-1].text == "Streamed"
+
+def test_async_send_with_system_prompt(async_session, mock_model):
+    async_session.set_system_prompt("System")
+    seen = []
+    original = mock_model._prepare_request_kwargs
+    
+    def capture(**kwargs):
+        seen.append(kwargs["messages"])
+        return original(**kwargs)
+    
+    mock_model._prepare_request_kwargs = capture
+    asyncio.run(async_session.send("Hi"))
+    assert [m.role for m in seen[0]] == ["system", "user"]
+
+def test_async_concurrent_sessions(mock_model):
+    mock_model.set_responses(["a", "b", "c"])
+    sessions = [AsyncChatSession(default_model=mock_model) for _ in range(3)]
+    
+    async def run_all():
+        return await asyncio.gather(*(s.send(f"q{i}") for i, s in enumerate(sessions)))
+    
+    responses = asyncio.run(run_all())
+    assert sorted(r.text for r in responses) == ["a", "b", "c"]
+    assert all(len(s.history) == 2 for s in sessions)
+
+def test_async_stream_break(async_session, mock_model):
+    mock_model.set_responses(["Streamed"])
+    
+    async def first_chunk():
+        stream = async_session.astream("Hi")
+        async for chunk in stream:
+            await stream.aclose()
+            return chunk
+    
+    assert asyncio.run(first_chunk()) == "S"
+    assert async_session.history[-1].text == "S"
+
+def test_async_unread_stream_closed(async_session, mock_model):
+    mock_model.set_responses(["Streamed"])
+    
+    async def close_unread():
+        stream = await async_session.send("Hi", stream=True)
+        await stream.aclose()
+        return stream
+    
+    stream = asyncio.run(close_unread())
+    assert stream.done
+    assert stream.message is None
+    assert len(async_session.history) == 1
@@ -0,0 +1,126 @@
+import asyncio
+import gc
+import threading
+import time
+import pytest
+from schat import AsyncChatSession, Message
+from schat.core.batch import BatchExecutor
+from tests.conftest import FakeModel
+
+def slow_model():
+    """从密钥池选择密钥、记录每个密钥并发数的模拟模型"""
+    return FakeModel("slow", api_key=None, delay=0.01, reply=lambda text, key: f"echo {text}",
+                     fail=lambda text, key: text == "fail")
+
+@pytest.fixture
+def keys(key_pool):
+    return key_pool("slow", "k1", "k2", "k3")
+
+def test_send_many_order_and_errors(chat_session, keys):
+    model = slow_model()
+    results = chat_session.send_many(["a", "fail", "c"], model=model, executor=BatchExecutor())
+    assert [r.index for r in results] == [0, 1, 2]
+    assert results[0].message.text == "echo a"
+    assert not results[1].ok
+    assert isinstance(results[1].error, RuntimeError)
+    assert results[2].message.text == "echo c"
+    # 批量请求不写入历史
+    assert chat_session.history == []
+
+def test_send_many_respects_limits(chat_session, keys):
+    model = slow_model()
+    executor = BatchExecutor(max_per_provider=6, max_per_key=2)
+    results = chat_session.send_many([f"q{i}" for i in range(30)], model=model, executor=executor)
+    assert all(r.ok for r in results)
+    clones = list(executor._key_models[model].values())
+    assert {c.api_key for c in clones} == {"k1", "k2", "k3"}
+    assert sum(keys.get_key_counts("slow").values()) == 30
+
+def test_explicit_key_is_not_rotated(chat_session, keys):
+    model = slow_model()
+    model.set_api_key("k2")
+    executor = BatchExecutor()
+    results = chat_session.send_many(["a", "b", "c"], model=model, executor=executor)
+    assert all(r.ok for r in results)
+    assert set(model.max_in_flight) == {"k2"}
+    assert sum(keys.get_key_counts("slow").values()) == 0
+
+def test_key_clones_released_with_model(chat_session, keys):
+    executor = BatchExecutor()
+    model = slow_model()
+    chat_session.send_many(["a", "b", "c"], model=model, executor=executor)
+    assert len(executor._key_models) == 1
+    del model
+    gc.collect()
+    assert len(executor._key_models) == 0
+
+def test_send_many_per_key_cap(chat_session, keys):
+    model = slow_model()
+    executor = BatchExecutor(max_per_provider=8, max_per_key=2)
+    # 副本是浅拷贝，共享同一个计数字典
+    executor.run(model, [[Message(role="user", text=str(i))] for i in range(20)])
+    assert set(model.max_in_flight) == {"k1", "k2", "k3"}
+    assert all(n <= 2 for n in model.max_in_flight.values())
+
+def test_send_many_message_lists(chat_session, keys):
+    chat_session.set_system_prompt("System")
+    model = slow_model()
+    captured = []
+    model.send = lambda messages, **kwargs: captured.append([m.role for m in messages]) or Message(role="assistant", text="ok")
+    chat_session.send_many([[Message(role="user", text="hi")]], model=model, executor=BatchExecutor())
+    assert captured == [["system", "user"]]
+
+def test_async_send_many(mock_model):
+    session = AsyncChatSession(default_model=mock_model)
+    results = asyncio.run(session.send_many(["a", "b"], executor=BatchExecutor()))
+    assert [r.message.text for r in results] == ["Mock response", "Mock response"]
+
+def test_busy_key_is_skipped(key_pool):
+    manager = key_pool("slow", "k1", "k2")
+    manager.record_use("slow", "k2")
+    executor = BatchExecutor(max_per_key=1)
+    # k1 使用次数最少但槽位已满，请求改用空闲的 k2
+    busy = executor._slot(executor._key_slots, ("slow", "k1"), 1)
+    busy.acquire()
+    model = slow_model()
+    try:
+        results = executor.run(model, [[Message(role="user", text="a")]])
+    finally:
+        busy.release()
+    assert results[0].ok
+    assert model.calls == ["k2"]
+    assert manager.get_key_counts("slow") == {"k1": 0, "k2": 2}
+
+def test_key_cooled_while_waiting_is_not_used(key_pool):
+    manager = key_pool("slow", "k1", "k2")
+    manager.record_use("slow", "k2")
+    executor = BatchExecutor(max_per_key=1)
+    slots = [executor._slot(executor._key_slots, ("slow", key), 1) for key in ("k1", "k2")]
+    for slot in slots:
+        slot.acquire()
+    model = slow_model()
+    done = threading.Event()
+    results = []
+    worker = threading.Thread(target=lambda: results.extend(
+        executor.run(model, [[Message(role="user", text="a")]])) or done.set())
+    worker.start()
+    # 请求在等待 k1 的槽位，期间 k1 收到429
+    time.sleep(0.05)
+    manager.report_error("slow", "k1", status_code=429, retry_after=60)
+    slots[0].release()
+    time.sleep(0.05)
+    assert not done.is_set()
+    slots[1].release()
+    worker.join(timeout=5)
+    assert results[0].ok
+    assert model.calls == ["k2"]
+
+def test_async_busy_key_is_skipped(key_pool):
+    manager = key_pool("slow", "k1", "k2")
+    manager.record_use("slow", "k2")
+    executor = BatchExecutor(max_per_key=1)
+    model = slow_model()
+    results = asyncio.run(executor.arun(model, [[Message(role="user", text=t)] for t in "ab"]))
+    assert all(r.ok for r in results)
+    # 第一条请求占用 k1 后，第二条请求不再等待 k1
+    assert sorted(model.calls) == ["k1", "k2"]
@@ -0,0 +1,24 @@
+from benchmarks import bench_suite
+
+def result(**medians):
+    return {"commit": None, "results": {
+        name.replace("_", "/"): {"median": value, "min": value} for name, value in medians.items()}}
+
+def test_compare_flags_regressions():
+    base = result(a=1.0, b=1.0, c=1.0, gone=1.0)
+    new = result(a=1.05, b=1.2, c=0.5, fresh=1.0)
+    rows = {row["name"]: row for row in bench_suite.compare(base, new, threshold=0.1)}
+    assert rows["a"]["status"] == "same"
+    assert rows["b"]["status"] == "regression" and rows["b"]["ratio"] == 1.2
+    assert rows["c"]["status"] == "improved"
+    assert rows["gone"]["status"] == "removed"
+    assert rows["fresh"]["status"] == "added" and rows["fresh"]["ratio"] is None
+
+def test_run_selected_cases():
+    names = bench_suite.select(r"^(get_key/1|tools/anthropic/1|convert/openai/10/files/cold)$")
+    assert len(names) == 3
+    data = bench_suite.run(names, repeat=2, min_time=0.001)
+    for name in names:
+        timing = data["results"][name]
+        assert 0 < timing["min"] <= timing["median"] <= timing["max"]
+        assert timing["repeat"] == 2
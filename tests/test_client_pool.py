@@ -0,0 +1,67 @@
+import asyncio
+import anthropic
+import openai
+from schat.core.client_pool import ClientPool, get_client_pool
+from schat.models.openai import OpenAIModel
+from schat.models.anthropic import AnthropicModel
+
+def test_client_cached_per_key():
+    pool = ClientPool()
+    created = []
+    def create():
+        created.append(object())
+        return created[-1]
+    a = pool.get_client(("cls", None, "k1"), create)
+    assert pool.get_client(("cls", None, "k1"), create) is a
+    assert pool.get_client(("cls", None, "k2"), create) is not a
+    assert len(created) == 2
+    assert pool.stats()["reused"] == 1
+
+def test_http_client_shared_per_host():
+    pool = ClientPool(max_connections=5)
+    a = pool.http_client(openai.DefaultHttpxClient, "https://api.example.com/v1")
+    b = pool.http_client(openai.DefaultHttpxClient, "https://api.example.com/v2")
+    c = pool.http_client(openai.DefaultHttpxClient, "https://other.example.com/v1")
+    assert a is b
+    assert a is not c
+    assert pool.http_client(anthropic.DefaultHttpxClient) is not pool.http_client(openai.DefaultHttpxClient)
+    pool.clear()
+
+def test_models_share_clients_and_transport():
+    first = OpenAIModel()
+    second = OpenAIModel()
+    client1 = first._get_client("key1")
+    # 不同的模型实例使用同一个key时复用客户端
+    assert second._get_client("key1") is client1
+    # 不同的key使用不同的客户端，但共享同一个连接池
+    client2 = first._get_client("key2")
+    assert client2 is not client1
+    assert client2.api_key == "key2"
+    assert client2._client is client1._client
+    
+    other = OpenAIModel()
+    other.set_base_url("https://dashscope.example.com/compatible-mode/v1")
+    client3 = other._get_client("key1")
+    assert client3 is not client1
+    assert client3._client is not client1._client
+
+def test_anthropic_clients_share_transport():
+    model = AnthropicModel()
+    a = model._get_client("key1")
+    b = model._get_client("key2")
+    assert a is not b
+    assert a._client is b._client
+    assert get_client_pool().stats()["http_clients"] == 1
+
+def test_async_clients_per_event_loop():
+    model = OpenAIModel()
+    
+    async def get_twice():
+        return model._get_async_client("key1"), model._get_async_client("key1")
+    
+    a, b = asyncio.run(get_twice())
+    assert a is b
+    assert isinstance(a, openai.AsyncOpenAI)
+    c, _ = asyncio.run(get_twice())
+    # 异步客户端与事件循环绑定，新的事件循环使用新的客户端
+    assert c is not a
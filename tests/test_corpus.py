@@ -0,0 +1,75 @@
+import os
+import pytest
+from schat import ChatSession, Message
+from schat.core.usage import Usage
+from schat.core.corpus import export_json_dir, export_sessions, iter_json_sessions, iter_sessions
+
+def make_sessions(mock_model, n):
+    sessions = []
+    for i in range(n):
+        session = ChatSession(default_model=mock_model)
+        session.set_system_prompt(f"prompt {i}")
+        for j in range(i):
+            session.add_user_message(f"q{i}-{j}", files=["a.png"] if j == 0 else None)
+            session.add_assistant_message(f"a{i}-{j}", tool_calls=[{"id": f"call_{j}", "type": "function"}])
+            session.history[-1].usage = Usage(10 + j, 2, cache_read_tokens=j, provider="openai", model="gpt-4o")
+        session.add_message(Message(role="user", content=[{"type": "text", "text": "hi"}]))
+        session.add_tool_message("result", "call_0")
+        sessions.append((f"s{i}", session))
+    sessions.append(("empty", ChatSession()))
+    return sessions
+
+def assert_same(restored, original):
+    assert [sid for sid, _ in restored] == [sid for sid, _ in original]
+    for (_, r), (_, o) in zip(restored, original):
+        assert r.system_prompt == o.system_prompt
+        assert [m.to_dict() for m in r.history] == [m.to_dict() for m in o.history]
+
+@pytest.mark.parametrize("suffix", [".parquet", ".arrow"])
+def test_export_and_iter_sessions(tmp_path, mock_model, suffix):
+    pytest.importorskip("pyarrow")
+    sessions = make_sessions(mock_model, 6)
+    path = str(tmp_path / f"corpus{suffix}")
+    rows = export_sessions(sessions, path, batch_rows=7)
+    assert rows == sum(len(s.history) for _, s in sessions) + 1
+
+    batches = list(iter_sessions(path, batch_size=3))
+    assert [len(b) for b in batches] == [3, 3, 1]
+    assert_same([item for batch in batches for item in batch], sessions)
+
+def test_export_columns(tmp_path, mock_model):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = str(tmp_path / "corpus.parquet")
+    export_sessions(make_sessions(mock_model, 2), path)
+    table = pq.read_table(path, columns=["session_id", "role", "text", "tool_call_id"])
+    assert table.column("session_id").to_pylist()[:3] == ["s0", "s0", "s1"]
+    assert table.column("role").to_pylist()[:2] == ["user", "tool"]
+
+def test_iter_json_sessions(tmp_path, mock_model):
+    sessions = make_sessions(mock_model, 5)
+    for sid, session in sessions:
+        session.save(str(tmp_path / f"{sid}.json"))
+    (tmp_path / "notes.txt").write_text("ignored")
+
+    for processes in (1, 2):
+        batches = list(iter_json_sessions(str(tmp_path), batch_size=2, processes=processes))
+        assert [len(b) for b in batches] == [2, 2, 2]
+        restored = dict(item for batch in batches for item in batch)
+        assert_same([(sid, restored[sid]) for sid, _ in sessions], sessions)
+
+def test_export_json_dir(tmp_path, mock_model):
+    pytest.importorskip("pyarrow")
+    sessions = make_sessions(mock_model, 4)
+    source = tmp_path / "sessions"
+    source.mkdir()
+    for sid, session in sessions:
+        session.save(str(source / f"{sid}.json"))
+    path = str(tmp_path / "corpus.arrow")
+    export_json_dir(str(source), path, processes=2)
+    restored = dict(item for batch in iter_sessions(path) for item in batch)
+    assert_same([(sid, restored[sid]) for sid, _ in sessions], sessions)
+
+def test_missing_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setitem(__import__("sys").modules, "pyarrow", None)
+    with pytest.raises(ImportError, match="pip install pyarrow"):
+        export_sessions([], str(tmp_path / "corpus.parquet"))
@@ -0,0 +1,95 @@
+import base64
+import os
+import pytest
+from schat.core.file_cache import AttachmentCache, get_attachment_cache, configure_attachment_cache
+
+def write(path, data: bytes):
+    path.write_bytes(data)
+    return str(path)
+
+def test_hit_and_miss(tmp_path):
+    cache = AttachmentCache()
+    path = write(tmp_path / "a.png", b"image-a")
+    assert cache.get_encoded(path) == base64.b64encode(b"image-a").decode()
+    assert cache.get_encoded(path) == base64.b64encode(b"image-a").decode()
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+def test_file_change_detected(tmp_path):
+    cache = AttachmentCache()
+    path = write(tmp_path / "a.png", b"v1")
+    cache.get_encoded(path)
+    write(tmp_path / "a.png", b"version2")
+    assert cache.get_encoded(path) == base64.b64encode(b"version2").decode()
+    assert cache.stats()["misses"] == 2
+
+def test_identical_content_stored_once(tmp_path):
+    cache = AttachmentCache()
+    a = write(tmp_path / "a.png", b"logo")
+    b = write(tmp_path / "b.png", b"logo")
+    cache.get_encoded(a)
+    cache.get_encoded(b)
+    assert cache.stats()["entries"] == 1
+
+def test_byte_budget_eviction(tmp_path):
+    cache = AttachmentCache(max_bytes=20)
+    a = write(tmp_path / "a.png", b"a" * 9)  # 编码后12字节
+    b = write(tmp_path / "b.png", b"b" * 9)
+    cache.get_encoded(a)
+    cache.get_encoded(b)
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= 20
+    # a 已被淘汰，再次读取是miss
+    cache.get_encoded(a)
+    assert cache.stats()["misses"] == 3
+
+def test_spill_dir(tmp_path):
+    spill = tmp_path / "spill"
+    cache = AttachmentCache(max_bytes=20, spill_dir=str(spill))
+    a = write(tmp_path / "a.png", b"a" * 9)
+    b = write(tmp_path / "b.png", b"b" * 9)
+    cache.get_encoded(a)
+    cache.get_encoded(b)
+    assert len(os.listdir(spill)) == 1
+    assert cache.get_encoded(a) == base64.b64encode(b"a" * 9).decode()
+    assert cache.stats()["spill_hits"] == 1
+
+def test_configure_shared_cache(tmp_path):
+    try:
+        cache = configure_attachment_cache(max_bytes=1024)
+        assert get_attachment_cache() is cache
+        assert cache.max_bytes == 1024
+    finally:
+        configure_attachment_cache()
+
+def test_path_index_is_bounded(tmp_path):
+    spill = tmp_path / "spill"
+    cache = AttachmentCache(max_bytes=20, spill_dir=str(spill), max_paths=3)
+    path = write(tmp_path / "a.png", b"v1")
+    cache.get_encoded(path)
+    # 同一路径的文件变化后旧记录被替换
+    write(tmp_path / "a.png", b"version2")
+    cache.get_encoded(path)
+    assert cache.stats()["paths"] == 1
+    for i in range(10):
+        cache.get_encoded(write(tmp_path / f"{i}.png", bytes([i]) * 9))
+    assert cache.stats()["paths"] == 3
+    assert len(cache._digest_paths) <= 3
+
+def test_spill_written_outside_lock(tmp_path, monkeypatch):
+    cache = AttachmentCache(max_bytes=20, spill_dir=str(tmp_path / "spill"))
+    writes = []
+    original = cache._write_spills
+
+    def write_spills(spills):
+        # 写入spill文件时不持有锁，其他线程可以继续读取缓存
+        writes.append(cache._lock.locked())
+        original(spills)
+
+    monkeypatch.setattr(cache, "_write_spills", write_spills)
+    cache.get_encoded(write(tmp_path / "a.png", b"a" * 9))
+    cache.get_encoded(write(tmp_path / "b.png", b"b" * 9))
+    assert writes and not any(writes)
+    assert len(os.listdir(tmp_path / "spill")) == 1
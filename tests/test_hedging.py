@@ -0,0 +1,157 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from schat import ChatSession, Message
+from schat.config import HEDGING
+from schat.core import hedging
+from schat.core.hedging import HedgePolicy
+from schat.core.key_manager import APIKeyManager
+from schat.core.streaming import StreamingResponse
+from schat.core.tracing import RequestHook
+from schat.core.usage import Usage
+from tests.conftest import FakeModel
+
+def delay_model(delays, provider="hedge-test"):
+    """按key设置响应延迟的模拟模型，key为 bad 时上游请求失败"""
+    return FakeModel(provider, api_key=None, delay=delays, reply=lambda text, key: f"from {key}",
+                     fail=lambda text, key: key == "bad")
+
+@pytest.fixture
+def keys(key_pool):
+    def setup(*names):
+        manager = key_pool("hedge-test")
+        # 让 slow 先被选中作为主请求的key：fast 先使用一次
+        if "fast" in names:
+            manager.add_key("hedge-test", "fast")
+            manager.get_key("hedge-test")
+        for name in names:
+            manager.add_key("hedge-test", name)
+    return setup
+
+def test_hedge_wins_over_slow_primary(keys):
+    keys("slow", "fast")
+    model = delay_model({"slow": 0.5, "fast": 0.01})
+    policy = HedgePolicy(initial_delay=0.05)
+    started = time.perf_counter()
+    response = model.send([Message(role="user", text="hi")], hedge=policy)
+    assert time.perf_counter() - started < 0.3
+    assert response.text == "from fast"
+    assert model.current_key == "fast"
+    assert policy.stats()["hedges_fired"] == 1
+    assert policy.stats()["hedges_won"] == 1
+
+def test_no_hedge_when_primary_is_fast(keys):
+    keys("fast", "other")
+    model = delay_model({"fast": 0.0, "other": 0.0})
+    policy = model.enable_hedging(HedgePolicy(initial_delay=0.2))
+    for _ in range(3):
+        model.send([Message(role="user", text="hi")])
+    assert policy.stats()["requests"] == 3
+    assert policy.stats()["hedges_fired"] == 0
+    assert len(model.calls) == 3
+
+def test_hedge_budget(keys):
+    keys("slow", "fast")
+    model = delay_model({"slow": 0.1, "fast": 0.1})
+    policy = HedgePolicy(initial_delay=0.01, min_delay=0.01, budget=0.0, burst=1)
+    for _ in range(3):
+        model.send([Message(role="user", text="hi")], hedge=policy)
+    stats = policy.stats()
+    assert stats["hedges_fired"] == 1
+    assert stats["budget_denied"] == 2
+
+def test_fallback_model_when_no_other_key(keys):
+    keys("slow")
+    model = delay_model({"slow": 0.5})
+    fallback = delay_model({"fb": 0.0}, provider="hedge-fallback")
+    fallback.set_api_key("fb")
+    policy = HedgePolicy(initial_delay=0.05, fallback=fallback)
+    response = model.send([Message(role="user", text="hi")], hedge=policy)
+    assert response.text == "from fb"
+    assert policy.stats()["hedges_won"] == 1
+
+def test_primary_error_without_hedge(keys):
+    keys("bad")
+    model = delay_model({"bad": 0.0})
+    with pytest.raises(RuntimeError):
+        model.send([Message(role="user", text="hi")], hedge=HedgePolicy(initial_delay=0.2))
+
+def test_delay_uses_percentile():
+    policy = HedgePolicy(min_samples=10, min_delay=0.0)
+    assert policy.delay() == policy.initial_delay
+    for i in range(100):
+        policy.record_latency(i / 100)
+    assert policy.delay() == pytest.approx(0.95)
+    # 流式请求单独统计
+    assert policy.delay(stream=True) == policy.initial_delay
+
+def test_hedged_stream_through_session(keys):
+    keys("slow", "fast")
+    model = delay_model({"slow": 0.5, "fast": 0.01})
+    session = ChatSession(default_model=model)
+    response = session.send("hi", stream=True, hedge=HedgePolicy(initial_delay=0.05))
+    assert isinstance(response, StreamingResponse)
+    assert "".join(response) == "from fast"
+    assert session.history[-1].text == "from fast"
+    assert model.hedge_policy is None
+
+def test_async_hedge_cancels_loser(keys):
+    keys("slow", "fast")
+    model = delay_model({"slow": 0.5, "fast": 0.01})
+    policy = HedgePolicy(initial_delay=0.05)
+    
+    async def run():
+        started = time.perf_counter()
+        response = await model.asend([Message(role="user", text="hi")], hedge=policy)
+        return response, time.perf_counter() - started
+    
+    response, elapsed = asyncio.run(run())
+    assert response.text == "from fast"
+    assert elapsed < 0.3
+    assert policy.stats()["hedges_won"] == 1
+
+def test_hedged_stream_keeps_usage_and_timings(keys):
+    keys("slow", "fast")
+    model = FakeModel("hedge-test", api_key=None, delay={"slow": 0.5, "fast": 0.01}, usage=Usage(10, 5))
+    model.add_hook(RequestHook())
+    session = ChatSession(default_model=model)
+    response = session.send("hi", stream=True, hedge=HedgePolicy(initial_delay=0.05))
+    assert "".join(response) == "echo: hi"
+    assert response.usage == Usage(10, 5, provider="hedge-test", model="fake-model")
+    assert "ttft" in response.timings and "total" in response.timings
+    assert session.history[-1].usage == response.usage
+    assert session.get_usage().total()["output_tokens"] == 5
+
+def test_async_hedged_stream_keeps_usage(keys):
+    keys("slow", "fast")
+    model = FakeModel("hedge-test", api_key=None, delay={"slow": 0.5, "fast": 0.01}, usage=Usage(10, 5))
+    async def run():
+        response = await model.asend([Message(role="user", text="hi")], stream=True,
+                                     hedge=HedgePolicy(initial_delay=0.05))
+        "".join([chunk async for chunk in response])
+        return response
+    assert asyncio.run(run()).usage.output_tokens == 5
+
+def test_hedge_does_not_skew_key_counts(keys):
+    keys("slow", "fast", "other")
+    manager = APIKeyManager()
+    before = manager.get_key_counts("hedge-test")
+    model = delay_model({"slow": 0.3, "fast": 0.01, "other": 0.3})
+    model.send([Message(role="user", text="hi")], hedge=HedgePolicy(initial_delay=0.05))
+    after = manager.get_key_counts("hedge-test")
+    # 主请求和对冲请求各选择一次key
+    assert sum(after.values()) - sum(before.values()) == 2
+    assert all(after[key] - before[key] <= 1 for key in after)
+
+def test_primary_does_not_use_hedge_pool(keys, monkeypatch):
+    keys("slow", "fast")
+    monkeypatch.setitem(HEDGING, "max_workers", 1)
+    monkeypatch.setattr(hedging, "_executor", None)
+    model = delay_model({"slow": 0.0, "fast": 0.0})
+    policy = HedgePolicy(initial_delay=0.2)
+    # 主请求各自使用单独的线程，并发数不受对冲线程池大小限制
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: model.send([Message(role="user", text="hi")], hedge=policy), range(8)))
+    assert policy.stats()["hedges_fired"] == 0
+    assert hedging._executor is None
@@ -0,0 +1,89 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from schat.core.http_fetch import RemoteFileFetcher
+from schat.core.message import Message
+from schat.models.anthropic import AnthropicModel
+
+class ImageHandler(BaseHTTPRequestHandler):
+    requests_seen = []
+    
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.path == "/missing.png":
+            self.send_response(404)
+            self.end_headers()
+            return
+        etag = f'"{self.path}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = f"data for {self.path}".encode()
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def server():
+    ImageHandler.requests_seen = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    thread = threading.Thread(target=httpd.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+def test_fetch_cached(server):
+    fetcher = RemoteFileFetcher()
+    assert fetcher.fetch(f"{server}/a.png") == b"data for /a.png"
+    assert fetcher.fetch(f"{server}/a.png") == b"data for /a.png"
+    assert len(ImageHandler.requests_seen) == 1
+    assert fetcher.stats()["hits"] == 1
+
+def test_fetch_revalidates_with_etag(server):
+    fetcher = RemoteFileFetcher(fresh_seconds=0)
+    fetcher.fetch(f"{server}/a.png")
+    assert fetcher.fetch(f"{server}/a.png") == b"data for /a.png"
+    assert ImageHandler.requests_seen[-1] == ("/a.png", '"/a.png"')
+    assert fetcher.stats()["revalidated"] == 1
+
+def test_fetch_error(server):
+    fetcher = RemoteFileFetcher()
+    with pytest.raises(ValueError, match="Failed to download image"):
+        fetcher.fetch(f"{server}/missing.png")
+
+def test_fetch_many_and_size_cap(server):
+    fetcher = RemoteFileFetcher(max_bytes=40)
+    urls = [f"{server}/{i}.png" for i in range(4)]
+    result = fetcher.fetch_many(urls + urls[:1])
+    assert set(result) == set(urls)
+    assert len(ImageHandler.requests_seen) == 4
+    stats = fetcher.stats()
+    assert stats["bytes"] <= 40
+    assert stats["evictions"] > 0
+
+def test_anthropic_url_images(server):
+    model = AnthropicModel()
+    history = [Message(role="user", text="compare", files=[f"{server}/x.png", f"{server}/y.png"])]
+    content = model._convert_messages(history)[0]["content"]
+    assert [c["source"]["type"] for c in content[1:]] == ["base64", "base64"]
+    
+    model.pass_image_urls = True
+    content = model._convert_messages(history)[0]["content"]
+    assert content[1]["source"] == {"type": "url", "url": f"{server}/x.png"}
+
+def test_anthropic_prefetched_images_not_downloaded_twice(server, monkeypatch):
+    # 图片超过下载缓存的上限，只能使用预取的结果
+    fetcher = RemoteFileFetcher(max_bytes=1)
+    monkeypatch.setattr("schat.models.anthropic.get_remote_fetcher", lambda: fetcher)
+    model = AnthropicModel()
+    urls = [f"{server}/x.png", f"{server}/y.png"]
+    content = model._convert_messages([Message(role="user", text="compare", files=urls)])[0]["content"]
+    assert len(content) == 3
+    assert sorted(path for path, _ in ImageHandler.requests_seen) == ["/x.png", "/y.png"]
@@ -0,0 +1,122 @@
+import json
+import pytest
+from schat import ChatSession, Message
+from schat.core.journal import SessionJournal, read_journal
+
+def records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_messages_are_appended(tmp_path, chat_session):
+    path = str(tmp_path / "session.jsonl")
+    chat_session.open_journal(path, fsync="never")
+    chat_session.set_system_prompt("You are helpful")
+    chat_session.add_user_message("Hello")
+    chat_session.add_assistant_message("Hi")
+    kinds = [r["type"] for r in records(path)]
+    assert kinds == ["meta", "meta", "message", "message"]
+    chat_session.add_user_message("Again")
+    # 新消息只追加一行
+    assert len(records(path)) == 5
+
+def test_round_trip_keeps_all_fields(tmp_path, chat_session):
+    path = str(tmp_path / "session.jsonl")
+    chat_session.open_journal(path)
+    chat_session.add_message(Message(
+        role="user", text="see image",
+        content=[{"type": "text", "text": "see image"}], priority=2.0
+    ))
+    chat_session.add_assistant_message("", tool_calls=[{"id": "call_1", "type": "function",
+                                                          "function": {"name": "f", "arguments": "{}"}}])
+    chat_session.add_tool_message({"ok": True}, "call_1")
+    chat_session.close_journal()
+
+    restored = ChatSession()
+    restored.open_journal(path)
+    assert [m.to_dict() for m in restored.history] == [m.to_dict() for m in chat_session.history]
+    assert restored.history[0].content == [{"type": "text", "text": "see image"}]
+    assert restored.history[2].tool_call_id == "call_1"
+    assert restored.default_model.get_model_config() == chat_session.default_model.get_model_config()
+
+def test_save_keeps_content(tmp_path, chat_session):
+    path = str(tmp_path / "session.json")
+    chat_session.add_message(Message(role="user", content=[{"type": "text", "text": "hi"}]))
+    chat_session.save(path)
+    restored = ChatSession()
+    restored.load(path)
+    assert restored.history[0].content == [{"type": "text", "text": "hi"}]
+
+def test_load_reads_journal(tmp_path, chat_session):
+    path = str(tmp_path / "session.jsonl")
+    chat_session.open_journal(path)
+    chat_session.add_user_message("Hello")
+    restored = ChatSession()
+    restored.load(path)
+    assert [m.text for m in restored.history] == ["Hello"]
+
+def test_streaming_reply_is_flushed_as_it_arrives(tmp_path, chat_session, mock_model):
+    path = str(tmp_path / "session.jsonl")
+    chat_session.open_journal(path)
+    mock_model.set_responses(["abc"])
+    response = chat_session.send("Hi", stream=True)
+    next(response)
+    next(response)
+    # 流还没结束，已收到的chunk已经写入
+    meta, history, _, recovered = read_journal(path)
+    assert recovered
+    assert [m.text for m in history] == ["Hi", "ab"]
+    "".join(response)
+    _, history, _, recovered = read_journal(path)
+    assert not recovered
+    assert [m.text for m in history] == ["Hi", "abc"]
+
+def test_crash_recovery(tmp_path, chat_session, mock_model):
+    path = str(tmp_path / "session.jsonl")
+    chat_session.open_journal(path)
+    mock_model.set_responses(["partial"])
+    response = chat_session.send("Hi", stream=True)
+    for _ in range(4):
+        next(response)
+    # 模拟写入到一半时进程退出
+    with open(path, "ab") as f:
+        f.write(b'{"type": "message", "mess')
+
+    restored = ChatSession()
+    restored.open_journal(path)
+    assert [m.text for m in restored.history] == ["Hi", "part"]
+    restored.add_user_message("continue")
+    again = ChatSession()
+    again.load(path)
+    assert [m.text for m in again.history] == ["Hi", "part", "continue"]
+
+def test_truncate_and_priority(tmp_path, chat_session):
+    path = str(tmp_path / "session.jsonl")
+    journal = chat_session.open_journal(path)
+    for i in range(3):
+        chat_session.add_user_message(f"Hello {i}")
+        chat_session.add_assistant_message(f"Hi {i}")
+    chat_session.truncate_history(2)
+    assert journal.compactions == 1
+    chat_session.set_priority(0, 3.0)
+    chat_session.add_user_message("last")
+
+    restored = ChatSession()
+    restored.load(path)
+    assert [m.text for m in restored.history] == ["Hello 1", "Hi 1", "Hello 2", "Hi 2", "last"]
+    assert restored.history[0].priority == 3.0 and restored.history[1].priority == 3.0
+
+def test_compaction(tmp_path, chat_session, mock_model):
+    path = str(tmp_path / "session.jsonl")
+    journal = chat_session.open_journal(path, compact_min_records=10)
+    mock_model.set_responses(["x" * 20])
+    "".join(chat_session.send("Hi", stream=True))
+    assert journal.compactions == 1
+    # 压缩后只剩设置和消息
+    assert [r["type"] for r in records(path)] == ["meta", "message", "message"]
+    restored = ChatSession()
+    restored.load(path)
+    assert [m.text for m in restored.history] == ["Hi", "x" * 20]
+
+def test_invalid_fsync_policy(tmp_path):
+    with pytest.raises(ValueError, match="Unknown fsync policy"):
+        SessionJournal(str(tmp_path / "session.jsonl"), fsync="sometimes")
@@ -1,6 +1,11 @@
+import asyncio
 import pytest
 import os
-from schat.core.key_manager import APIKeyManager
+import time
+from email.utils import formatdate
+from schat import Message
+from schat.core.key_manager import APIKeyManager, parse_retry_after
+from tests.conftest import FakeModel
 
 @pytest.fixture
 def key_manager():
@@ -8,6 +13,8 @@ def key_manager():
     # 清理现有的keys和counts
     manager._provider_keys = {}
     manager._key_counts = {}
+    manager._key_heaps = {}
+    manager._key_health = {}
     manager._current_seed = None
     return manager
 
@@ -95,4 +102,162 @@ def test_get_key_counts(key_manager):
     assert counts['key1'] == 1
     
     # 测试获取不存在的provider的计数
-    assert key_manager.get_key_counts('nonexistent') == {} 
\ No newline at end of file
+    assert key_manager.get_key_counts('nonexistent') == {} 
+def test_get_key_with_explicit_seed(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.add_key('test', 'key2')
+    key_manager.add_key('test', 'key3')
+    
+    assert key_manager.get_key('test', seed='user-1') == key_manager.get_key('test', seed='user-1')
+    assert sum(key_manager.get_key_counts('test').values()) == 2
+
+def test_seed_is_per_thread(key_manager):
+    import threading
+    key_manager.add_key('test', 'key1')
+    key_manager.set_current_seed_once('seed1')
+    
+    # 其他线程看不到当前线程设置的seed
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(key_manager._current_seed))
+    thread.start()
+    thread.join()
+    assert seen == [None]
+    assert key_manager._current_seed == 'seed1'
+    key_manager.get_key('test')
+    assert key_manager._current_seed is None
+
+def test_get_key_thread_safe(key_manager):
+    from concurrent.futures import ThreadPoolExecutor
+    keys = [f'key{i}' for i in range(50)]
+    for key in keys:
+        key_manager.add_key('test', key)
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda _: key_manager.get_key('test'), range(5000)))
+    
+    counts = key_manager.get_key_counts('test')
+    assert sum(counts.values()) == 5000
+    assert set(results) == set(keys)
+    # 每个key恰好被使用100次
+    assert set(counts.values()) == {100}
+
+def test_load_balancing_after_seeded_calls(key_manager):
+    for key in ['key1', 'key2', 'key3']:
+        key_manager.add_key('test', key)
+    for i in range(30):
+        key_manager.get_key('test', seed=f'seed{i}')
+    key_manager.clear_counts('test')
+    for _ in range(9):
+        key_manager.get_key('test')
+    assert set(key_manager.get_key_counts('test').values()) == {3}
+
+
+def test_rate_limited_key_cools_down(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.add_key('test', 'key2')
+    key_manager.report_error('test', 'key1', 429, retry_after="60")
+    assert not key_manager.is_key_available('test', 'key1')
+    assert {key_manager.get_key('test') for _ in range(10)} == {'key2'}
+    health = key_manager.get_key_health('test')['key1']
+    assert health['cooldown_until'] > time.time() + 50
+    assert health['last_status'] == 429
+
+def test_cooldown_expires(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.add_key('test', 'key2')
+    key_manager.report_error('test', 'key1', 429, retry_after=0.05)
+    time.sleep(0.06)
+    assert key_manager.is_key_available('test', 'key1')
+    assert 'key1' in {key_manager.get_key('test') for _ in range(4)}
+
+def test_auth_failure_quarantines_key(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.add_key('test', 'key2')
+    key_manager.report_error('test', 'key2', 401)
+    assert {key_manager.get_key('test') for _ in range(10)} == {'key1'}
+    # seed对应的key不可用时退回负载均衡
+    for i in range(10):
+        assert key_manager.get_key('test', seed=f"user{i}") == 'key1'
+    key_manager.report_error('test', 'key1', 403)
+    assert key_manager.get_key('test') is None
+    key_manager.restore_key('test', 'key2')
+    assert key_manager.get_key('test') == 'key2'
+
+def test_all_keys_cooling_returns_soonest(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.add_key('test', 'key2')
+    key_manager.report_error('test', 'key1', 429, retry_after=30)
+    key_manager.report_error('test', 'key2', 429, retry_after=10)
+    assert key_manager.get_key('test') == 'key2'
+
+def test_cooldown_backoff_without_retry_after(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.report_error('test', 'key1', 429)
+    first = key_manager.get_key_health('test')['key1']['cooldown_until']
+    key_manager.report_error('test', 'key1', 429)
+    second = key_manager.get_key_health('test')['key1']['cooldown_until']
+    assert second - first > 20
+    key_manager.report_success('test', 'key1')
+    assert key_manager.get_key_health('test')['key1']['consecutive_failures'] == 0
+
+def test_other_errors_do_not_cool_down(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.report_error('test', 'key1', 500)
+    key_manager.report_error('test', 'key1', None)
+    assert key_manager.is_key_available('test', 'key1')
+    assert key_manager.get_key_health('test')['key1']['total_failures'] == 2
+
+def test_parse_retry_after():
+    assert parse_retry_after("5") == 5.0
+    assert parse_retry_after(2) == 2.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("soon") is None
+    assert 25 < parse_retry_after(formatdate(time.time() + 30, usegmt=True)) <= 30
+
+def test_remove_keys(key_manager):
+    key_manager.add_key('test', 'key1')
+    key_manager.add_key('other', 'key2')
+    key_manager.get_key('test')
+    key_manager.report_error('test', 'key1', 401)
+    key_manager.remove_keys('test')
+    assert key_manager.get_keys('test') == []
+    assert key_manager.get_key_health('test') == {}
+    # 重新添加的key是新的状态
+    key_manager.add_key('test', 'key1')
+    assert key_manager.is_key_available('test', 'key1')
+    assert key_manager.get_key_counts('test') == {'key1': 0}
+    key_manager.remove_keys()
+    assert key_manager.get_keys('other') == []
+
+class RateLimited(Exception):
+    status_code = 429
+
+def test_stream_reports_health_when_consumed(key_pool):
+    manager = key_pool('stream-health', 'key1')
+    manager.report_error('stream-health', 'key1', 500)
+    model = FakeModel('stream-health', api_key=None)
+    stream = model.send([Message(role="user", text="hello world")], stream=True)
+    # 流还没读完，不反馈成功
+    assert manager.get_key_health('stream-health')['key1']['consecutive_failures'] == 1
+    assert "".join(stream) == "echo: hello world"
+    assert manager.get_key_health('stream-health')['key1']['consecutive_failures'] == 0
+
+def test_stream_error_reports_key_health(key_pool):
+    manager = key_pool('stream-health', 'key1', 'key2')
+    model = FakeModel('stream-health', api_key=None, stream_error=RateLimited("slow down"))
+    stream = model.send([Message(role="user", text="hi")], stream=True)
+    key = model.current_key
+    with pytest.raises(RateLimited):
+        list(stream)
+    assert manager.get_key_health('stream-health')[key]['last_status'] == 429
+    assert not manager.is_key_available('stream-health', key)
+
+def test_async_stream_error_reports_key_health(key_pool):
+    manager = key_pool('stream-health', 'key1')
+    model = FakeModel('stream-health', api_key=None, stream_error=RateLimited("slow down"))
+    async def run():
+        stream = await model.asend([Message(role="user", text="hi")], stream=True)
+        return [chunk async for chunk in stream]
+    with pytest.raises(RateLimited):
+        asyncio.run(run())
+    assert not manager.is_key_available('stream-health', 'key1')
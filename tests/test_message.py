@@ -1,3 +1,4 @@
+import sys
 import pytest
 from schat.core.message import Message
 from datetime import datetime
@@ -77,4 +78,94 @@ def test_message_with_complex_tool_calls():
     msg = Message(role="assistant", text="Results", tool_calls=tool_calls)
     assert len(msg.tool_calls) == 2
     assert msg.tool_calls[0]["id"] == "call_1"
-    assert msg.tool_calls[1]["function"]["name"] == "time"
\ No newline at end of file
+    assert msg.tool_calls[1]["function"]["name"] == "time"
+def test_message_converted_cache():
+    msg = Message(role="user", text="Hello")
+    calls = []
+    convert = lambda m: calls.append(m) or {"content": m.text}
+    
+    assert msg.get_converted("fmt", convert) == {"content": "Hello"}
+    assert msg.get_converted("fmt", convert) == {"content": "Hello"}
+    assert len(calls) == 1
+    
+    # 不同格式分别缓存
+    msg.get_converted("other", convert)
+    assert len(calls) == 2
+
+def test_message_converted_cache_invalidation():
+    msg = Message(role="user", text="Hello")
+    convert = lambda m: {"content": m.text, "priority": m.priority}
+    msg.get_converted("fmt", convert)
+    
+    msg.text = "Changed"
+    assert msg.get_converted("fmt", convert)["content"] == "Changed"
+    
+    msg.priority = 3.0
+    assert msg.get_converted("fmt", convert)["priority"] == 3.0
+    
+    # 原地修改需要手动失效
+    msg.files.append("a.png")
+    msg.invalidate()
+    assert msg.get_converted("fmt", lambda m: len(m.files)) == 1
+
+def test_message_converted_cache_tracks_files(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("old")
+    msg = Message(role="user", text="Hello", files=[str(path)])
+    convert = lambda m: [open(f).read() for f in m.files]
+    assert msg.get_converted("fmt", convert) == ["old"]
+    assert msg.has_converted("fmt")
+    
+    # 磁盘上的附件变化后重新转换
+    path.write_text("new content")
+    assert not msg.has_converted("fmt")
+    assert msg.get_converted("fmt", convert) == ["new content"]
+    
+    other = tmp_path / "b.txt"
+    other.write_text("other")
+    msg.files.append(str(other))
+    assert msg.get_converted("fmt", convert) == ["new content", "other"]
+
+def test_message_is_slotted():
+    msg = Message(role="user", text="Hello")
+    assert not hasattr(msg, "__dict__")
+    with pytest.raises(AttributeError):
+        msg.unknown = 1
+
+def test_message_empty_lists_not_allocated():
+    msg = Message(role="user", text="Hello")
+    assert msg._files is None and msg._tool_calls is None
+    assert msg.files == [] and msg.tool_calls == []
+    # 只读访问不会分配列表
+    assert msg._files is None
+    # 原地修改仍然生效
+    msg.tool_calls.append({"id": "call_1"})
+    msg.tool_calls.append({"id": "call_2"})
+    assert msg.tool_calls == [{"id": "call_1"}, {"id": "call_2"}]
+    msg.files += ["a.png"]
+    assert msg.files == ["a.png"]
+
+def test_message_role_interned():
+    role = "".join(["assi", "stant"])
+    msg = Message(role=role, text="Hi")
+    assert msg.role is sys.intern("assistant")
+    msg.role = "".join(["us", "er"])
+    assert msg.role is sys.intern("user")
+
+def test_message_equality_and_copy():
+    import copy
+    import pickle
+    msg = Message(role="user", text="Hello", files=["a.png"], timestamp=1.0)
+    assert msg == Message(role="user", text="Hello", files=["a.png"], timestamp=1.0)
+    assert msg != Message(role="user", text="Bye", files=["a.png"], timestamp=1.0)
+    for clone in (copy.copy(msg), copy.deepcopy(msg), pickle.loads(pickle.dumps(msg))):
+        assert clone == msg
+    assert Message.from_dict(msg.to_dict()) == msg
+
+def test_message_empty_list_from_constructor_is_mutable():
+    msg = Message("user", "hi", files=[])
+    msg.files.append("a.png")
+    assert msg.files == ["a.png"]
+    reply = Message("assistant", "x")
+    reply.tool_calls.append({})
+    assert reply.tool_calls == [{}]
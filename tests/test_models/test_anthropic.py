@@ -0,0 +1,40 @@
+import pytest
+from schat.models.anthropic import AnthropicModel
+from schat.models.anthropic_helper import add_cache_to_messages
+from schat.core.message import Message
+
+@pytest.fixture
+def model():
+    model = AnthropicModel()
+    model.set_api_key("test-key")
+    return model
+
+def test_convert_messages_memoized(model, tmp_path, monkeypatch):
+    image_path = tmp_path / "test.png"
+    image_path.write_bytes(b"fake image data")
+    history = [Message(role="user", text="look", files=[str(image_path)])]
+    
+    calls = []
+    original = model._convert_content
+    monkeypatch.setattr(model, "_convert_content", lambda msg: calls.append(msg) or original(msg))
+    
+    model._convert_messages(history)
+    history.append(Message(role="assistant", text="ok"))
+    converted = model._convert_messages(history)
+    assert len(calls) == 2  # 每条消息只转换一次
+    assert converted[0]["content"][1]["type"] == "image"
+
+def test_add_cache_does_not_mutate_input(model):
+    history = [Message(role="user", text=f"msg {i}") for i in range(3)]
+    converted = model._convert_messages(history)
+    add_cache_to_messages(converted)
+    again = model._convert_messages(history)
+    assert all("cache_control" not in block for msg in again for block in msg["content"])
+
+def test_tool_result_requires_tool_use(model):
+    history = [
+        Message(role="user", text="hi"),
+        Message(role="tool", text="result", tool_call_id="call_1"),
+    ]
+    converted = model._convert_messages(history)
+    assert len(converted) == 1
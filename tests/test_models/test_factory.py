@@ -67,4 +67,23 @@ def test_openai_compatible_provider():
     
     model = ModelFactory.get_model("compatible")
     assert isinstance(model, OpenAIModel)
-    assert model.base_url == "https://api.compatible.com"
\ No newline at end of file
+    assert model.base_url == "https://api.compatible.com"
+
+def test_import_does_not_load_sdks():
+    """测试 import schat 不会导入provider SDK"""
+    import subprocess
+    import sys
+    code = (
+        "import sys, schat; "
+        "print(any(m in sys.modules for m in ('openai', 'anthropic', 'google.generativeai')))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == "False"
+
+
+def test_lazy_model_class_access():
+    """测试通过包属性按需获取模型类"""
+    from schat import models
+    assert models.OpenAIModel is OpenAIModel
+    with pytest.raises(AttributeError):
+        models.UnknownModel
@@ -6,6 +6,7 @@ from schat.models.openai import OpenAIModel
 from schat.core.message import Message
 from schat.core.session import ChatSession
 import json
+import asyncio
 
 class MockResponse:
     def __init__(self, content, tool_calls=None):
@@ -58,6 +59,34 @@ class MockOpenAI:
             return MockResponse("Calling weather function", tool_calls)
         return MockResponse(self.responses[0])
 
+class MockAsyncStream:
+    def __init__(self, content):
+        self._chunks = iter(MockResponse(content))
+        
+    def __aiter__(self):
+        return self
+        
+    async def __anext__(self):
+        try:
+            return next(self._chunks)
+        except StopIteration:
+            raise StopAsyncIteration
+
+class MockAsyncOpenAI(MockOpenAI):
+    def __init__(self, responses=None):
+        super().__init__(responses)
+        self.chat = type('Chat', (), {
+            'completions': type('Completions', (), {
+                'create': lambda **kwargs: self._acreate(**kwargs)
+            })
+        })
+        
+    async def _acreate(self, **kwargs):
+        if kwargs.get("stream"):
+            self.requests.append(kwargs)
+            return MockAsyncStream(self.responses[0])
+        return self._create(**kwargs)
+
 @pytest.fixture
 def model():
     model = OpenAIModel()
@@ -176,4 +205,95 @@ def test_tool_call_flow(model, mock_openai):
     last_request = mock_openai.requests[-1]
     assert "tools" in last_request
     assert last_request["tools"] == [weather_tool]
-    assert last_request["model"] == "gpt-4o"
\ No newline at end of file
+    assert last_request["model"] == "gpt-4o"
+
+@pytest.fixture
+def mock_async_openai(monkeypatch):
+    mock = MockAsyncOpenAI()
+    monkeypatch.setattr("openai.AsyncOpenAI", lambda **kwargs: mock)
+    return mock
+
+def test_async_basic_chat(model, mock_async_openai):
+    response = asyncio.run(model.asend([Message(role="user", text="Hello")]))
+    assert isinstance(response, Message)
+    assert response.text == "Mock response"
+    assert mock_async_openai.requests[-1]["messages"] == [{"role": "user", "content": "Hello"}]
+
+def test_async_streaming(model, mock_async_openai):
+    async def collect():
+        response = await model.asend([Message(role="user", text="Hello")], stream=True)
+        return "".join([chunk async for chunk in response])
+    
+    assert asyncio.run(collect()) == "Mock response"
+
+def test_sync_and_async_requests_match(model, mock_openai, mock_async_openai):
+    """同步和异步路径生成相同的请求参数"""
+    messages = [Message(role="system", text="sys"), Message(role="user", text="Hello")]
+    model.send(messages, temperature=0.1)
+    asyncio.run(model.asend(messages, temperature=0.1))
+    assert mock_openai.requests[-1] == mock_async_openai.requests[-1]
+
+def test_convert_messages_memoized(model, tmp_path, monkeypatch):
+    """历史消息的转换结果被缓存，附件只编码一次"""
+    image_path = tmp_path / "test.jpg"
+    image_path.write_bytes(b"fake image data")
+    history = [Message(role="user", text="look", files=[str(image_path)])]
+    
+    encoded = []
+    original = model.encode_file
+    monkeypatch.setattr(model, "encode_file", lambda path: encoded.append(path) or original(path))
+    
+    first = model._convert_messages(history)
+    history.append(Message(role="assistant", text="ok"))
+    second = model._convert_messages(history)
+    assert len(encoded) == 1
+    assert second[0] == first[0]
+    
+    # 修改消息后重新转换
+    history[0].text = "look again"
+    third = model._convert_messages(history)
+    assert third[0]["content"][0]["text"] == "look again"
+    assert len(encoded) == 2
+
+
+class MockRateLimitError(Exception):
+    status_code = 429
+    
+    def __init__(self):
+        super().__init__("rate limited")
+        self.response = type('Response', (), {'headers': {'retry-after': '60'}})
+
+def test_per_request_key_rotation(monkeypatch):
+    from schat.core.key_manager import APIKeyManager
+    manager = APIKeyManager()
+    for key in ["rot-key1", "rot-key2"]:
+        manager.add_key("rotation-test", key)
+    clients = {}
+    
+    def create_client(api_key, **kwargs):
+        client = MockOpenAI()
+        if api_key == "rot-key1":
+            def fail(**kwargs):
+                raise MockRateLimitError()
+            client.chat.completions.create = fail
+        clients[api_key] = client
+        return client
+    monkeypatch.setattr("openai.OpenAI", create_client)
+    
+    model = OpenAIModel(provider="rotation-test")
+    used = set()
+    for _ in range(4):
+        try:
+            model.send([Message(role="user", text="Hello")])
+        except MockRateLimitError:
+            pass
+        used.add(model.current_key)
+    # 两个key都被用过，每个key只创建一个客户端
+    assert used == {"rot-key1", "rot-key2"}
+    assert set(clients) == {"rot-key1", "rot-key2"}
+    assert not manager.is_key_available("rotation-test", "rot-key1")
+    # 限流的key进入冷却后只使用健康的key
+    for _ in range(3):
+        model.send([Message(role="user", text="Hello")])
+        assert model.current_key == "rot-key2"
+    assert model.api_key is None
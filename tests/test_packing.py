@@ -0,0 +1,54 @@
+from schat.core.message import Message
+from schat.core.session import ChatSession
+from schat.core.tokenizer import CallableTokenizer
+from schat.core.packing import group_turns, pack_history
+
+def ten_tokens():
+    # 每条消息 4 + 10 = 14 个token
+    return CallableTokenizer(lambda text: 10, "ten")
+
+def make_history(priorities):
+    messages = []
+    for i, priority in enumerate(priorities):
+        messages.append(Message(role="user", text=f"q{i}", priority=priority))
+        messages.append(Message(role="assistant", text=f"a{i}", priority=priority))
+    return messages
+
+def test_group_turns_keeps_tool_pairs():
+    messages = [
+        Message(role="user", text="weather?"),
+        Message(role="assistant", text="", tool_calls=[{"id": "c1"}]),
+        Message(role="tool", text="sunny", tool_call_id="c1"),
+        Message(role="assistant", text="It is sunny"),
+        Message(role="user", text="thanks"),
+    ]
+    assert group_turns(messages) == [(0, 4), (4, 5)]
+
+def test_pack_prefers_high_priority():
+    messages = make_history([1.0, 5.0, 1.0, 1.0])
+    messages.append(Message(role="user", text="latest"))
+    # 最新一轮14 token，剩余预算可放2轮（56 token）
+    packed = pack_history(messages, 14 + 56, ten_tokens())
+    texts = [m.text for m in packed]
+    assert texts == ["q1", "a1", "q3", "a3", "latest"]
+
+def test_pack_always_keeps_latest_turn():
+    messages = make_history([9.0])
+    messages.append(Message(role="user", text="latest"))
+    packed = pack_history(messages, 1, ten_tokens())
+    assert [m.text for m in packed] == ["latest"]
+
+def test_pack_skips_zero_priority():
+    messages = make_history([0.0, 1.0])
+    messages.append(Message(role="user", text="latest"))
+    packed = pack_history(messages, 10_000, ten_tokens())
+    assert [m.text for m in packed] == ["q1", "a1", "latest"]
+
+def test_session_priority_strategy(mock_model):
+    session = ChatSession(default_model=mock_model, max_history_token=14 * 5,
+                          tokenizer=ten_tokens(), history_strategy="priority")
+    session.history = make_history([1.0, 1.0, 1.0, 1.0])
+    session.set_priority(0, 3.0)
+    session.add_user_message("latest")
+    texts = [m.text for m in session._get_history()]
+    assert texts == ["q0", "a0", "q3", "a3", "latest"]
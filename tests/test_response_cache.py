@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+import pytest
+from schat import ChatSession, Message
+from schat.core.response_cache import ResponseCache, request_key
+from schat.models.openai import OpenAIModel
+from tests.conftest import FakeModel
+from tests.test_models.test_openai import MockOpenAI, MockAsyncOpenAI
+
+@pytest.fixture
+def model(monkeypatch):
+    mock = MockOpenAI()
+    monkeypatch.setattr("openai.OpenAI", lambda **kwargs: mock)
+    model = OpenAIModel()
+    model.set_api_key("test-key")
+    model.set_model_config({"model": "gpt-4o-mini", "temperature": 0})
+    model.mock = mock
+    return model
+
+def test_request_key_is_stable():
+    assert request_key({"a": 1, "b": [1, 2]}) == request_key({"b": [1, 2], "a": 1})
+    assert request_key({"a": 1}) != request_key({"a": 2})
+
+def test_cache_hit_skips_request(model):
+    cache = model.enable_response_cache()
+    first = model.send([Message(role="user", text="Hello")])
+    second = model.send([Message(role="user", text="Hello")])
+    assert len(model.mock.requests) == 1
+    assert second.text == first.text
+    assert second is not first
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_ratio"] == 0.5
+    assert stats["bytes_saved"] > 0
+    # 参数不同时不命中
+    model.send([Message(role="user", text="Hello")], max_tokens=10)
+    assert len(model.mock.requests) == 2
+
+def test_cache_keeps_tool_calls(model):
+    tool = {"type": "function", "function": {"name": "get_weather", "parameters": {}}}
+    first = model.send([Message(role="user", text="weather?")], tools=[tool], cache=True)
+    cached = model.send([Message(role="user", text="weather?")], tools=[tool], cache=True)
+    assert len(model.mock.requests) == 1
+    assert cached.tool_calls == first.tool_calls
+    assert cached.tool_calls[0]["function"]["name"] == "get_weather"
+
+def test_cache_disabled_per_call(model):
+    model.enable_response_cache()
+    model.send([Message(role="user", text="Hello")])
+    model.send([Message(role="user", text="Hello")], cache=False)
+    assert len(model.mock.requests) == 2
+
+def test_deterministic_only(model):
+    # 默认只缓存 temperature 为0的请求
+    cache = ResponseCache()
+    model.send([Message(role="user", text="Hello")], temperature=0.7, cache=cache)
+    model.send([Message(role="user", text="Hello")], temperature=0.7, cache=cache)
+    assert len(model.mock.requests) == 2
+    model.send([Message(role="user", text="Hello")], cache=cache)
+    model.send([Message(role="user", text="Hello")], cache=cache)
+    assert len(model.mock.requests) == 3
+
+def test_cache_sampled_requests(model):
+    cache = ResponseCache(deterministic_only=False)
+    model.send([Message(role="user", text="Hello")], temperature=0.7, cache=cache)
+    model.send([Message(role="user", text="Hello")], temperature=0.7, cache=cache)
+    assert len(model.mock.requests) == 1
+
+def test_streaming_cache(model):
+    cache = ResponseCache()
+    session = ChatSession(default_model=model)
+    response = session.send("Hello", stream=True, cache=cache)
+    text = "".join(response)
+    session.history = []
+    replay = session.send("Hello", stream=True, cache=cache)
+    assert "".join(replay) == text
+    assert len(model.mock.requests) == 1
+    assert session.history[-1].text == text
+
+def test_sqlite_ttl(tmp_path):
+    path = str(tmp_path / "responses.db")
+    cache = ResponseCache(path=path, ttl=0.2)
+    cache.put("k", Message(role="assistant", text="cached", tool_calls=[{"id": "1"}]))
+    cache.close()
+    
+    # 新的缓存实例从SQLite读取
+    reopened = ResponseCache(path=path, ttl=0.2)
+    message = reopened.get("k")
+    assert message.text == "cached"
+    assert message.tool_calls == [{"id": "1"}]
+    time.sleep(0.25)
+    assert reopened.get("k") is None
+    assert reopened.purge_expired() == 1
+    reopened.close()
+
+def test_lru_eviction():
+    cache = ResponseCache(max_entries=2)
+    for key in ["a", "b", "c"]:
+        cache.put(key, Message(role="assistant", text=key))
+    assert cache.get("a") is None
+    assert cache.get("c").text == "c"
+
+def test_async_cache(monkeypatch):
+    mock = MockAsyncOpenAI()
+    monkeypatch.setattr("openai.AsyncOpenAI", lambda **kwargs: mock)
+    model = OpenAIModel()
+    model.set_api_key("test-key")
+    cache = model.enable_response_cache()
+    
+    async def run():
+        first = await model.asend([Message(role="user", text="Hello")], temperature=0)
+        second = await model.asend([Message(role="user", text="Hello")], temperature=0)
+        return first, second
+    
+    first, second = asyncio.run(run())
+    assert first.text == second.text
+    assert len(mock.requests) == 1
+
+def test_cache_hit_does_not_select_key(key_pool):
+    manager = key_pool("cache-keys", "k1", "k2")
+    model = FakeModel("cache-keys", api_key=None)
+    model.enable_response_cache()
+    messages = [Message(role="user", text="Hello")]
+    model.send(messages, temperature=0)
+    for _ in range(3):
+        model.send(messages, temperature=0)
+        model.send(messages, temperature=0, stream=True)
+    async def run():
+        return await model.asend(messages, temperature=0)
+    assert asyncio.run(run()).text == "echo: Hello"
+    # 命中缓存的请求不选择密钥，也不计入使用次数
+    assert len(model.calls) == 1
+    assert sum(manager.get_key_counts("cache-keys").values()) == 1
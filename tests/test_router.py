@@ -0,0 +1,166 @@
+import asyncio
+import gc
+import threading
+import time
+from typing import Dict
+import pytest
+from schat import ChatSession, Message
+from schat.core.circuit_breaker import CircuitBreaker
+from schat.models.factory import ModelFactory
+from schat.models.router import RouterModel
+from tests.conftest import FakeModel
+
+def timed_model(name: str, delay: float = 0.0):
+    """固定延迟、回复自身名称的模拟模型，设置 fail 后请求失败"""
+    return FakeModel(name, delay=delay, reply=name)
+
+def ask(router: RouterModel) -> str:
+    return router.send([Message(role="user", text="hi")]).text
+
+def test_prefers_faster_member():
+    slow, fast = timed_model("slow", 0.02), timed_model("fast", 0.0)
+    router = RouterModel("test", [slow, fast])
+    answers = [ask(router) for _ in range(10)]
+    assert answers.count("fast") >= 8
+    assert router.stats()["slow:fake-model"]["latency"] > router.stats()["fast:fake-model"]["latency"]
+
+def test_cost_weight():
+    cheap, expensive = timed_model("cheap"), timed_model("expensive")
+    router = RouterModel("test", [expensive, cheap], costs={"expensive:fake-model": 10.0, "cheap:fake-model": 1.0}, cost_weight=1.0)
+    assert ask(router) == "cheap"
+
+def test_failover_and_circuit_breaker():
+    primary, backup = timed_model("primary"), timed_model("backup", 0.01)
+    router = RouterModel("test", [primary, backup], failure_threshold=2, recovery_seconds=0.1)
+    assert ask(router) == "primary"
+    primary.fail = True
+    # 失败时切换到下一个成员，请求本身成功
+    for _ in range(3):
+        assert ask(router) == "backup"
+    assert router.members[0].breaker.state == CircuitBreaker.OPEN
+    calls = len(primary.calls)
+    for _ in range(5):
+        assert ask(router) == "backup"
+    # 熔断期间不再请求失败的成员
+    assert len(primary.calls) == calls
+    
+    # 恢复时间后放行一个探测请求，成功后重新闭合
+    primary.fail = False
+    time.sleep(0.12)
+    assert router.members[0].breaker.state == CircuitBreaker.HALF_OPEN
+    ask(router)
+    assert len(primary.calls) == calls + 1
+    assert router.members[0].breaker.state == CircuitBreaker.CLOSED
+
+def test_all_members_failing_raises():
+    a, b = timed_model("a"), timed_model("b")
+    a.fail = b.fail = True
+    router = RouterModel("test", [a, b], failure_threshold=1, recovery_seconds=60)
+    with pytest.raises(RuntimeError):
+        ask(router)
+    # 全部熔断时仍然探测最早恢复的成员
+    with pytest.raises(RuntimeError):
+        ask(router)
+    assert len(a.calls) + len(b.calls) == 3
+
+def test_circuit_breaker_half_open_single_probe():
+    breaker = CircuitBreaker(failure_threshold=1, recovery_seconds=0.05)
+    breaker.record_failure()
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    # 探测失败后恢复时间加倍
+    assert breaker.open_until - time.time() > 0.08
+
+def test_route_in_session():
+    fast = timed_model("route-fast")
+    route = ModelFactory.register_route("fast-chat", [fast])
+    session = ChatSession(default_model="fast-chat")
+    assert session.send("hi").text == "route-fast"
+    assert route.current_member == "route-fast:fake-model"
+    with pytest.raises(ValueError):
+        ModelFactory.register_route("bad:name", [fast])
+
+def test_async_route():
+    a, b = timed_model("a"), timed_model("b")
+    a.fail = True
+    router = RouterModel("test", [a, b])
+    response = asyncio.run(router.asend([Message(role="user", text="hi")]))
+    assert response.text == "b"
+
+def test_stream_recorded_when_finished():
+    slow = FakeModel("stream-slow", reply="a b c d", chunk_delay=0.02)
+    router = RouterModel("test", [slow])
+    response = router.send([Message(role="user", text="hi")], stream=True)
+    stats = router.stats()["stream-slow:fake-model"]
+    # 流结束前仍在途，不计入延迟
+    assert stats["in_flight"] == 1
+    assert stats["latency"] is None
+    assert "".join(response) == "a b c d"
+    stats = router.stats()["stream-slow:fake-model"]
+    assert stats["in_flight"] == 0
+    assert stats["latency"] >= 0.06
+
+def test_stream_error_trips_breaker():
+    broken = FakeModel("stream-broken", reply="a b", stream_error=RuntimeError("reset"))
+    router = RouterModel("test", [broken], failure_threshold=1, recovery_seconds=60)
+    response = router.send([Message(role="user", text="hi")], stream=True)
+    with pytest.raises(RuntimeError):
+        list(response)
+    stats = router.stats()["stream-broken:fake-model"]
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0
+    assert stats["circuit"] == CircuitBreaker.OPEN
+
+def test_closed_stream_is_not_recorded():
+    model = timed_model("stream-closed")
+    router = RouterModel("test", [model])
+    response = router.send([Message(role="user", text="hi")], stream=True)
+    next(response)
+    response.close()
+    unread = router.send([Message(role="user", text="hi")], stream=True)
+    # 没有读取就被回收的流也释放占用
+    del unread
+    gc.collect()
+    stats = router.stats()["stream-closed:fake-model"]
+    assert stats["in_flight"] == 0
+    assert stats["latency"] is None
+    assert stats["errors"] == 0
+
+def test_async_stream_recorded_when_finished():
+    model = FakeModel("astream", reply="a b", stream_error=RuntimeError("reset"))
+    router = RouterModel("test", [model])
+
+    async def run():
+        response = await router.asend([Message(role="user", text="hi")], stream=True)
+        with pytest.raises(RuntimeError):
+            async for _ in response:
+                pass
+
+    asyncio.run(run())
+    stats = router.stats()["astream:fake-model"]
+    assert stats["errors"] == 1
+    assert stats["in_flight"] == 0
+
+def test_current_member_per_thread():
+    a = FakeModel("member-a", reply="a", fail=lambda text, key: text == "b only")
+    b = timed_model("member-b")
+    router = RouterModel("test", [a, b])
+    barrier = threading.Barrier(2)
+    seen = {}
+
+    def run(text):
+        router.send([Message(role="user", text=text)])
+        # 两个线程都完成请求后再读取，各自看到自己请求使用的成员
+        barrier.wait()
+        seen[text] = router.current_member
+
+    threads = [threading.Thread(target=run, args=(text,)) for text in ("hi", "b only")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert seen == {"hi": "member-a:fake-model", "b only": "member-b:fake-model"}
+    assert router.current_member is None
@@ -46,7 +46,11 @@ def test_send_message_with_stream(chat_session, mock_model):
     assert isinstance(response, Generator)
     text = "".join(list(response))
     assert text == "Hello!"
-    assert len(chat_session.history) == 1  # 流式响应不添加到历史
+    # 流结束后回复加入历史
+    assert len(chat_session.history) == 2
+    assert chat_session.history[-1].text == "Hello!"
+    assert response.time_to_first_token is not None
+    assert response.duration >= response.time_to_first_token
 
 def test_save_load_session(chat_session):
     chat_session.add_user_message("Hello")
@@ -246,4 +250,58 @@ def test_tool_message_handling(chat_session):
     tool_msg = chat_session.add_tool_message(result, "call_456")
     assert tool_msg.role == "tool"
     assert tool_msg.text == '{"key": "value"}'
-    assert tool_msg.tool_call_id == "call_456"
\ No newline at end of file
+    assert tool_msg.tool_call_id == "call_456"
+def test_max_history_token(mock_model):
+    session = ChatSession(default_model=mock_model, max_history_token=40)
+    session.set_system_prompt("You are helpful")
+    for i in range(10):
+        session.add_user_message(f"question number {i} " * 4)
+        session.add_assistant_message(f"answer number {i} " * 4)
+    session.add_user_message("latest")
+    
+    history = session._get_history()
+    assert history[0].role == "system"
+    assert history[-1].text == "latest"
+    assert len(history) < len(session.history)
+    assert sum(session.tokenizer.count_message(m) for m in history) <= 40
+    
+    # 不限制时发送全部历史
+    session.max_history_token = 0
+    assert len(session._get_history()) == len(session.history) + 1
+
+def test_count_tokens(chat_session):
+    chat_session.add_user_message("abcd")
+    assert chat_session.count_tokens() == 5
+
+
+def test_stream_closed_early(chat_session, mock_model):
+    mock_model.set_responses(["Hello world"])
+    response = chat_session.send("Hi", stream=True)
+    assert next(response) == "H"
+    assert next(response) == "e"
+    response.close()
+    assert response.done
+    assert chat_session.history[-1].text == "He"
+    assert response.metrics()["chunks"] == 2
+
+def test_stream_error_not_added(chat_session):
+    def broken():
+        yield "partial"
+        raise RuntimeError("connection reset")
+    
+    chat_session.default_model.send = lambda messages, **kwargs: broken()
+    response = chat_session.send("Hi", stream=True)
+    with pytest.raises(RuntimeError):
+        list(response)
+    assert response.text == "partial"
+    assert isinstance(response.error, RuntimeError)
+    assert len(chat_session.history) == 1
+
+def test_unread_stream_closed(chat_session, mock_model):
+    mock_model.set_responses(["Hello world"])
+    response = chat_session.send("Hi", stream=True)
+    response.close()
+    # 没有开始读取就关闭的流不加入空的回复
+    assert response.done
+    assert response.message is None
+    assert len(chat_session.history) == 1
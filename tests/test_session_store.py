@@ -0,0 +1,101 @@
+import time
+import pytest
+from schat import ChatSession, Message
+from schat.core.session_store import SessionStore
+
+@pytest.fixture
+def store(tmp_path):
+    store = SessionStore(str(tmp_path / "sessions.db"))
+    yield store
+    store.close()
+
+def fill(session, rounds):
+    for i in range(rounds):
+        session.add_user_message(f"question {i}")
+        session.add_assistant_message(f"answer {i}")
+
+def test_open_creates_and_persists(store, mock_model):
+    session = store.open("s1", ChatSession(default_model=mock_model))
+    session.set_system_prompt("You are helpful")
+    mock_model.set_responses(["Hello!"])
+    session.send("Hi")
+
+    restored = store.open("s1")
+    assert restored.system_prompt == "You are helpful"
+    assert [m.text for m in restored.history] == ["Hi", "Hello!"]
+    assert restored.default_model.get_model_config() == mock_model.get_model_config()
+
+def test_turn_is_saved_with_reply(store, mock_model):
+    session = store.open("s1", ChatSession(default_model=mock_model))
+    mock_model.set_responses(["abc"])
+    response = session.send("Hi", stream=True)
+    # 回复完成前用户消息还没有保存
+    assert store.read_messages("s1") == []
+    "".join(response)
+    assert [m.text for m in store.read_messages("s1")] == ["Hi", "abc"]
+
+def test_tail_window_and_paging(store):
+    session = store.open("s1")
+    fill(session, 10)
+
+    restored = store.open("s1", tail=4)
+    assert restored.history_offset == 16
+    assert [m.text for m in restored.history] == ["question 8", "answer 8", "question 9", "answer 9"]
+    assert restored.load_older(3) == 3
+    assert restored.history_offset == 13
+    assert restored.history[0].text == "answer 6"
+    assert restored.load_older(100) == 13
+    assert restored.load_older(1) == 0
+    assert len(restored.history) == 20
+
+def test_new_messages_after_window(store):
+    session = store.open("s1")
+    fill(session, 5)
+    restored = store.open("s1", tail=2)
+    restored.add_user_message("more")
+    restored.set_priority(0, 3.0)
+    messages = store.read_messages("s1")
+    assert len(messages) == 11
+    assert messages[-1].text == "more"
+    # set_priority 按窗口内的轮次修改
+    assert messages[8].priority == 3.0 and messages[9].priority == 3.0
+
+def test_token_budget_window(store):
+    session = store.open("s1")
+    fill(session, 10)
+    budget = sum(session.tokenizer.count_message(m) for m in session.history[-5:])
+    restored = store.open("s1", max_tokens=budget)
+    # 窗口从用户消息开始
+    assert restored.history[0].role == "user"
+    assert len(restored.history) == 4
+
+def test_truncate_rewrites_session(store):
+    session = store.open("s1")
+    fill(session, 3)
+    session.truncate_history(1)
+    assert [m.text for m in store.read_messages("s1")] == ["question 2", "answer 2"]
+    session.add_user_message("next")
+    assert [m.text for m in store.open("s1").history] == ["question 2", "answer 2", "next"]
+
+def test_round_trip_fields(store):
+    session = store.open("s1")
+    session.add_message(Message(role="user", content=[{"type": "text", "text": "hi"}]))
+    session.add_assistant_message("", tool_calls=[{"id": "call_1", "type": "function"}])
+    session.add_tool_message("done", "call_1")
+    restored = store.open("s1")
+    assert [m.to_dict() for m in restored.history] == [m.to_dict() for m in session.history]
+
+def test_list_and_delete(store):
+    for sid in ("a", "b", "c"):
+        fill(store.open(sid), 1)
+        time.sleep(0.01)
+    listed = store.list_sessions()
+    assert [s["session_id"] for s in listed] == ["c", "b", "a"]
+    assert listed[0]["message_count"] == 2
+    assert [s["session_id"] for s in store.list_sessions(limit=1, offset=1)] == ["b"]
+
+    assert store.delete("a", "missing") == 1
+    assert store.read_messages("a") == []
+    cutoff = store.list_sessions()[0]["updated_at"]
+    assert store.delete_inactive(cutoff) == 1
+    assert [s["session_id"] for s in store.list_sessions()] == ["c"]
@@ -0,0 +1,174 @@
+import asyncio
+import gc
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from schat import Message
+from schat.core import usage as usage_module
+from schat.core.single_flight import SingleFlight
+from schat.core.usage import Usage, configure_usage_tracker
+from tests.conftest import FakeModel
+
+def slow_model(delay: float = 0.2, fail: bool = False):
+    """响应较慢、记录上游调用的模拟模型"""
+    return FakeModel("flight-test", delay=delay, fail=fail, chunk_delay=0.01)
+
+def send_concurrently(model, texts, **kwargs):
+    with ThreadPoolExecutor(max_workers=len(texts)) as pool:
+        futures = [pool.submit(model.send, [Message(role="user", text=t)], **kwargs) for t in texts]
+        return [f.result() for f in futures]
+
+def test_identical_requests_are_coalesced():
+    model = slow_model()
+    flight = model.enable_coalescing()
+    responses = send_concurrently(model, ["hi"] * 5)
+    assert len(model.calls) == 1
+    assert [r.text for r in responses] == ["echo: hi"] * 5
+    # 每个调用方得到独立的消息对象
+    assert len({id(r) for r in responses}) == 5
+    stats = flight.stats()
+    assert stats["leaders"] == 1 and stats["coalesced"] == 4
+    assert stats["in_flight"] == 0
+
+def test_different_requests_are_not_coalesced():
+    model = slow_model(delay=0.05)
+    model.enable_coalescing()
+    responses = send_concurrently(model, ["a", "b", "c"])
+    assert len(model.calls) == 3
+    assert [r.text for r in responses] == ["echo: a", "echo: b", "echo: c"]
+
+def test_sequential_requests_are_not_coalesced():
+    model = slow_model(delay=0.0)
+    model.enable_coalescing()
+    model.send([Message(role="user", text="hi")])
+    model.send([Message(role="user", text="hi")])
+    assert len(model.calls) == 2
+
+def test_coalesce_per_call():
+    model = slow_model()
+    send_concurrently(model, ["hi"] * 3)
+    assert len(model.calls) == 3
+    send_concurrently(model, ["hi"] * 3, coalesce=True)
+    assert len(model.calls) == 4
+    assert model.single_flight.stats()["coalesced"] == 2
+
+def test_streaming_followers_get_full_stream():
+    model = slow_model()
+    model.enable_coalescing()
+    responses = send_concurrently(model, ["hi"] * 4, stream=True)
+    assert len(model.calls) == 1
+    assert ["".join(r) for r in responses] == ["echo: hi"] * 4
+
+def test_errors_propagate_to_followers():
+    model = slow_model(fail=True)
+    flight = model.enable_coalescing()
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        futures = [pool.submit(model.send, [Message(role="user", text="hi")]) for _ in range(3)]
+        for future in futures:
+            with pytest.raises(RuntimeError):
+                future.result()
+    assert len(model.calls) == 1
+    assert flight.stats()["in_flight"] == 0
+
+def test_abandoned_stream_closes_upstream():
+    closed = []
+    def upstream():
+        try:
+            yield "a"
+            yield "b"
+        finally:
+            closed.append(True)
+    flight = SingleFlight()
+    stream = flight.do("key", upstream)
+    assert next(stream) == "a"
+    stream.close()
+    assert closed == [True]
+    assert flight.stats()["in_flight"] == 0
+
+def test_async_coalescing():
+    model = slow_model()
+    flight = model.enable_coalescing()
+    async def run():
+        return await asyncio.gather(*[
+            model.asend([Message(role="user", text="hi")]) for _ in range(5)
+        ])
+    responses = asyncio.run(run())
+    assert len(model.calls) == 1
+    assert [r.text for r in responses] == ["echo: hi"] * 5
+    assert flight.stats()["coalesced"] == 4
+    assert flight.stats()["in_flight"] == 0
+
+def test_async_streaming_coalescing():
+    model = slow_model()
+    model.enable_coalescing()
+    async def collect():
+        response = await model.asend([Message(role="user", text="hi")], stream=True)
+        return "".join([chunk async for chunk in response])
+    async def run():
+        return await asyncio.gather(*[collect() for _ in range(3)])
+    assert asyncio.run(run()) == ["echo: hi"] * 3
+    assert len(model.calls) == 1
+
+def test_coalesced_streams_share_usage():
+    tracker = configure_usage_tracker()
+    try:
+        model = FakeModel("flight-test", delay=0.2, chunk_delay=0.01, usage=Usage(10, 3))
+        model.enable_coalescing()
+        responses = send_concurrently(model, ["hi"] * 4, stream=True)
+        assert ["".join(r) for r in responses] == ["echo: hi"] * 4
+        assert len(model.calls) == 1
+        # 领导者和跟随者都能看到用量，用量统计只记录一次
+        for response in responses:
+            assert response.usage == Usage(10, 3, provider="flight-test", model="fake-model")
+            assert response.message.usage == response.usage
+        assert tracker.total()["requests"] == 1
+        assert tracker.total()["output_tokens"] == 3
+    finally:
+        usage_module._tracker = None
+
+def test_async_coalesced_streams_share_usage():
+    model = FakeModel("flight-test", delay=0.2, chunk_delay=0.01, usage=Usage(10, 3))
+    model.enable_coalescing()
+    async def collect():
+        response = await model.asend([Message(role="user", text="hi")], stream=True)
+        "".join([chunk async for chunk in response])
+        return response.usage
+    async def run():
+        return await asyncio.gather(*[collect() for _ in range(3)])
+    assert asyncio.run(run()) == [Usage(10, 3, provider="flight-test", model="fake-model")] * 3
+    assert len(model.calls) == 1
+
+def test_unread_stream_stops_coalescing():
+    flight = SingleFlight()
+    stream = flight.do("key", lambda: iter(["a", "b"]))
+    assert flight.stats()["in_flight"] == 1
+    # 领导者的流没有读取就被回收，之后的相同请求重新发送
+    del stream
+    gc.collect()
+    assert flight.stats()["in_flight"] == 0
+    assert list(flight.do("key", lambda: iter(["c"]))) == ["c"]
+
+def test_async_unread_stream_stops_coalescing():
+    flight = SingleFlight()
+    async def upstream():
+        yield "a"
+    async def fetch():
+        return upstream()
+    async def run():
+        stream = await flight.ado("key", fetch)
+        assert flight.stats()["in_flight"] == 1
+        del stream
+        gc.collect()
+        assert flight.stats()["in_flight"] == 0
+        stream = await flight.ado("key", fetch)
+        return [chunk async for chunk in stream]
+    assert asyncio.run(run()) == ["a"]
+    assert flight.stats()["leaders"] == 2
+
+def test_async_calls_released_with_loop():
+    flight = SingleFlight()
+    async def fetch():
+        return Message(role="assistant", text="hi")
+    asyncio.run(flight.ado("key", fetch))
+    gc.collect()
+    # 按事件循环对象分组，事件循环被回收后不再保留
+    assert len(flight._async_calls) == 0
@@ -0,0 +1,111 @@
+import asyncio
+import inspect
+import anthropic
+import openai
+import pytest
+from benchmarks.stub_provider import StubProvider
+from schat import AsyncChatSession, ChatSession, Message
+from schat.core.key_manager import APIKeyManager
+from schat.core.usage import Usage
+from schat.models.anthropic import AnthropicModel
+from schat.models.openai import OpenAIModel
+
+@pytest.fixture
+def stub():
+    with StubProvider(output_tokens=6, seed=0) as stub:
+        yield stub
+
+@pytest.fixture
+def openai_model(stub):
+    model = OpenAIModel(model="gpt-4o-mini", stream_usage=True)
+    model.set_base_url(stub.openai_base_url)
+    model.set_api_key("sk-stub")
+    return model
+
+def test_openai_json_and_sse(stub, openai_model):
+    session = ChatSession(default_model=openai_model)
+    reply = session.send("hello")
+    assert reply.text == " tok0 tok1 tok2 tok3 tok4 tok5"
+    assert reply.usage.output_tokens == 6 and reply.usage.input_tokens > 0
+
+    stub.token_rate = 500
+    response = session.send("again", stream=True)
+    chunks = list(response)
+    assert len(chunks) == 6
+    assert response.usage.output_tokens == 6
+    assert response.time_to_first_token < response.duration
+    assert session.history[-1].text == reply.text
+    assert stub.stats()["requests"] == {"openai": 2}
+
+def test_openai_async_stream(stub, openai_model):
+    async def run():
+        session = AsyncChatSession(default_model=openai_model)
+        response = await session.send("hello", stream=True)
+        return "".join([chunk async for chunk in response]), response
+    text, response = asyncio.run(run())
+    assert text == " tok0 tok1 tok2 tok3 tok4 tok5"
+    assert response.message.usage.output_tokens == 6
+
+def test_max_tokens_limits_output(openai_model):
+    reply = openai_model.send([Message(role="user", text="hi")], max_tokens=2)
+    assert reply.text == " tok0 tok1"
+
+def test_rate_limit_injection(stub):
+    provider = "stub-rate-limit"
+    manager = APIKeyManager()
+    manager.add_key(provider, "sk-limited")
+    model = OpenAIModel(provider=provider)
+    model.set_base_url(stub.openai_base_url)
+    stub.rate_limit_rate = 1.0
+    stub.retry_after = 30
+    stub.sdk_retries = False
+    with pytest.raises(openai.RateLimitError):
+        model.send([Message(role="user", text="hi")])
+    # 429 和 Retry-After 反馈给密钥管理器
+    health = manager.get_key_health(provider)["sk-limited"]
+    assert health["last_status"] == 429
+    assert not manager.is_key_available(provider, "sk-limited")
+    assert stub.stats()["responses"] == {429: 1}
+
+def test_error_injection_with_sdk_retries(stub, openai_model):
+    stub.error_rate = 1.0
+    stub.sdk_retries = False
+    with pytest.raises(openai.InternalServerError):
+        openai_model.send([Message(role="user", text="hi")])
+    stub.error_rate = 0.0
+    assert openai_model.send([Message(role="user", text="hi")]).text
+
+def test_anthropic_wire_format(stub):
+    # 直接使用SDK，验证替身服务器的格式能被SDK解析，且模型能从中提取文本和用量
+    client = anthropic.Anthropic(base_url=stub.anthropic_base_url, api_key="sk-stub")
+    model = AnthropicModel()
+    messages = [{"role": "user", "content": [
+        {"type": "text", "text": "long context " * 100, "cache_control": {"type": "ephemeral"}}]}]
+    first = model._handle_response(client.messages.create(model="claude", max_tokens=64, messages=messages))
+    assert first.text == " tok0 tok1 tok2 tok3 tok4 tok5"
+    assert first.usage.cache_write_tokens > 0 and first.usage.cache_read_tokens == 0
+
+    usage = Usage()
+    chunks = []
+    for event in client.messages.create(model="claude", max_tokens=64, messages=messages, stream=True):
+        chunk_usage = model._chunk_usage(event)
+        if chunk_usage is not None:
+            usage.merge(chunk_usage)
+        text = model._chunk_text(event)
+        if text:
+            chunks.append(text)
+    assert "".join(chunks) == first.text
+    # 相同的前缀第二次请求时命中提示缓存
+    assert usage == Usage(first.usage.input_tokens, 6, cache_read_tokens=first.usage.cache_write_tokens)
+
+@pytest.mark.skipif("temperature" not in inspect.signature(anthropic.resources.messages.Messages.create).parameters,
+                    reason="installed anthropic SDK does not accept temperature")
+def test_anthropic_model_end_to_end(stub):
+    model = AnthropicModel()
+    model.set_base_url(stub.anthropic_base_url)
+    model.set_api_key("sk-stub")
+    session = ChatSession(default_model=model)
+    assert session.send("hello").text == " tok0 tok1 tok2 tok3 tok4 tok5"
+    response = session.send("again", stream=True)
+    assert "".join(response) == " tok0 tok1 tok2 tok3 tok4 tok5"
+    assert response.usage.output_tokens == 6
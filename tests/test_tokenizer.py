@@ -0,0 +1,49 @@
+import pytest
+from schat.core.message import Message
+from schat.core.tokenizer import (
+    HeuristicTokenizer, CallableTokenizer, get_tokenizer,
+    select_recent_within_budget, MESSAGE_OVERHEAD_TOKENS, IMAGE_TOKENS
+)
+
+def test_heuristic_count():
+    tokenizer = HeuristicTokenizer()
+    assert tokenizer.count_text("abcdefgh") == 2
+    assert tokenizer.count_text("你好") == 2
+    assert tokenizer.count_text("") == 0
+
+def test_count_message_with_image():
+    tokenizer = HeuristicTokenizer()
+    msg = Message(role="user", text="abcd", files=["a.png"])
+    assert tokenizer.count_message(msg) == MESSAGE_OVERHEAD_TOKENS + 1 + IMAGE_TOKENS
+
+def test_count_message_memoized():
+    calls = []
+    tokenizer = CallableTokenizer(lambda text: calls.append(text) or len(text), "len")
+    msg = Message(role="user", text="hello")
+    assert tokenizer.count_message(msg) == MESSAGE_OVERHEAD_TOKENS + 5
+    tokenizer.count_message(msg)
+    assert len(calls) == 1
+    
+    msg.text = "hello world"
+    assert tokenizer.count_message(msg) == MESSAGE_OVERHEAD_TOKENS + 11
+
+def test_get_tokenizer():
+    assert isinstance(get_tokenizer(), HeuristicTokenizer)
+    with pytest.raises(ValueError):
+        get_tokenizer("unknown")
+
+def test_select_recent_within_budget():
+    tokenizer = CallableTokenizer(lambda text: 10, "ten")
+    messages = []
+    for i in range(5):
+        messages.append(Message(role="user", text=f"q{i}"))
+        messages.append(Message(role="assistant", text=f"a{i}"))
+    messages.append(Message(role="user", text="latest"))
+    
+    # 每条消息14个token，预算可容纳3条，但窗口不能以assistant开头
+    selected = select_recent_within_budget(messages, 45, tokenizer)
+    assert [m.text for m in selected] == ["q4", "a4", "latest"]
+    
+    # 预算不足时仍保留最新的消息
+    selected = select_recent_within_budget(messages, 1, tokenizer)
+    assert [m.text for m in selected] == ["latest"]
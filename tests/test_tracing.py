@@ -0,0 +1,123 @@
+import asyncio
+import pytest
+from schat import ChatSession, Message
+from schat.core import tracing
+from schat.core.tracing import InMemorySpanExporter, RequestHook, SpanHook
+from tests.conftest import FakeModel
+
+def timed_model(fail: bool = False):
+    """各阶段有固定耗时的模拟模型：转换0.01秒，上游0.03秒，每个chunk前0.02秒"""
+    return FakeModel("trace-test", model="timed", fail=fail, delay=0.03, chunk_delay=0.02, convert_delay=0.01)
+
+class RecordingHook(RequestHook):
+    def __init__(self):
+        self.events = []
+
+    def on_request_start(self, trace):
+        self.events.append("start")
+
+    def on_phase_start(self, trace, phase):
+        self.events.append(f"+{phase}")
+
+    def on_phase_end(self, trace, phase, seconds):
+        self.events.append(f"-{phase}")
+
+    def on_request_end(self, trace):
+        self.events.append("error" if trace.error else "end")
+
+def test_no_hooks_no_timings():
+    response = timed_model().send([Message(role="user", text="hi")])
+    assert response.timings is None
+
+def test_phase_timings_and_hook_order():
+    model = timed_model()
+    hook = RecordingHook()
+    model.add_hook(hook)
+    response = model.send([Message(role="user", text="hi")])
+    assert hook.events == ["start", "+convert", "-convert", "+client_init", "-client_init",
+                           "+upstream", "-upstream", "+parse", "-parse", "end"]
+    timings = response.timings
+    assert timings["convert"] >= 0.01
+    assert timings["upstream"] >= 0.03
+    assert timings["total"] >= timings["convert"] + timings["upstream"]
+    assert "ttft" not in timings
+
+def test_streaming_timings():
+    model = timed_model()
+    hook = RecordingHook()
+    model.add_hook(hook)
+    session = ChatSession(default_model=model)
+    response = session.send("hi", stream=True)
+    assert "".join(response) == "echo: hi"
+    assert hook.events[-3:] == ["+stream", "-stream", "end"]
+    assert response.timings["ttft"] >= response.timings["upstream"] + 0.02
+    assert response.timings["stream"] >= 0.04
+    # 流结束后加入历史的消息同样带有计时
+    assert session.history[-1].timings is response.timings
+
+def test_error_finishes_trace():
+    exporter = InMemorySpanExporter()
+    model = timed_model(fail=True)
+    model.add_hook(SpanHook(exporter))
+    with pytest.raises(RuntimeError):
+        model.send([Message(role="user", text="hi")])
+    root = exporter.spans[0]
+    assert root["status"]["code"] == "ERROR"
+    assert "upstream error" in root["status"]["message"]
+
+def test_span_export():
+    exporter = InMemorySpanExporter()
+    model = timed_model()
+    model.add_hook(SpanHook(exporter))
+    model.send([Message(role="user", text="hi")])
+    root, *children = exporter.spans
+    assert root["name"] == "schat.request"
+    assert root["attributes"]["schat.provider"] == "trace-test"
+    assert root["attributes"]["schat.model"] == "timed"
+    assert [c["name"] for c in children] == ["schat.convert", "schat.client_init", "schat.upstream", "schat.parse"]
+    for child in children:
+        assert child["trace_id"] == root["trace_id"]
+        assert child["parent_span_id"] == root["span_id"]
+        assert root["start_time_unix_nano"] <= child["start_time_unix_nano"] <= child["end_time_unix_nano"]
+        assert child["end_time_unix_nano"] <= root["end_time_unix_nano"]
+
+def test_global_hook():
+    hook = RecordingHook()
+    tracing.add_hook(hook)
+    try:
+        timed_model().send([Message(role="user", text="hi")])
+    finally:
+        tracing.remove_hook(hook)
+    assert hook.events[0] == "start" and hook.events[-1] == "end"
+    assert timed_model().send([Message(role="user", text="hi")]).timings is None
+
+def test_async_timings():
+    model = timed_model()
+    model.add_hook(RequestHook())
+    async def run():
+        message = await model.asend([Message(role="user", text="hi")])
+        stream = await model.asend([Message(role="user", text="hi")], stream=True)
+        text = "".join([chunk async for chunk in stream])
+        return message, stream, text
+    message, stream, text = asyncio.run(run())
+    assert message.timings["upstream"] >= 0.03
+    assert text == "echo: hi"
+    assert "ttft" in stream.timings and "total" in stream.timings
+
+def test_opentelemetry_exporter():
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter as OTelMemory
+    from schat.core.tracing import OpenTelemetryExporter
+
+    memory = OTelMemory()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(memory))
+    model = timed_model()
+    model.add_hook(SpanHook(OpenTelemetryExporter(provider.get_tracer("test"))))
+    model.send([Message(role="user", text="hi")])
+    spans = {s.name: s for s in memory.get_finished_spans()}
+    assert set(spans) == {"schat.request", "schat.client_init", "schat.convert", "schat.upstream", "schat.parse"}
+    assert spans["schat.upstream"].parent.span_id == spans["schat.request"].context.span_id
+    assert spans["schat.request"].attributes["schat.provider"] == "trace-test"
@@ -0,0 +1,190 @@
+import runpy
+import threading
+import time
+from types import SimpleNamespace as NS
+import pytest
+from google.api_core import exceptions as google_exceptions
+from schat import Message
+from schat import config as config_module
+from schat.config import GOOGLE_FILES, UPLOAD_REGISTRY
+from schat.core import upload_registry as registry_module
+from schat.core.upload_registry import UploadRegistry, configure_upload_registry, file_digest, upload_scope
+from schat.models import google as google_module
+from schat.models.google import GoogleModel
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = configure_upload_registry(path=str(tmp_path / "uploads.db"))
+    yield registry
+    registry.close()
+    registry_module._upload_registry = None
+
+class FakeFiles:
+    """模拟 genai 的文件API：上传后处理 polls 次才变为ACTIVE"""
+
+    def __init__(self, polls=1, delay=0.0):
+        self.polls = polls
+        self.delay = delay
+        self.files = {}
+        self.uploads = []
+        self.gets = []
+        self.active_uploads = 0
+        self.max_concurrent = 0
+        self.lock = threading.Lock()
+
+    def _file(self, name):
+        # 剩余的轮询次数，或者失败的状态名
+        remaining = self.files[name]
+        if isinstance(remaining, str):
+            state = remaining
+        else:
+            state = "ACTIVE" if remaining <= 0 else "PROCESSING"
+        return NS(name=name, uri=f"https://files/{name}", state=NS(name=state), expiration_time=None)
+
+    def upload_file(self, path, mime_type=None):
+        with self.lock:
+            self.active_uploads += 1
+            self.max_concurrent = max(self.max_concurrent, self.active_uploads)
+            name = f"files/{len(self.uploads)}"
+            self.uploads.append((path, mime_type))
+            self.files[name] = self.polls
+        time.sleep(self.delay)
+        with self.lock:
+            self.active_uploads -= 1
+        return self._file(name)
+
+    def get_file(self, name):
+        self.gets.append(name)
+        if name not in self.files:
+            raise google_exceptions.NotFound("gone")
+        if isinstance(self.files[name], int):
+            self.files[name] -= 1
+        return self._file(name)
+
+@pytest.fixture
+def fake(monkeypatch):
+    fake = FakeFiles()
+    monkeypatch.setattr(google_module.genai, "upload_file", fake.upload_file)
+    monkeypatch.setattr(google_module.genai, "get_file", fake.get_file)
+    monkeypatch.setitem(GOOGLE_FILES, "poll_interval", 0.001)
+    return fake
+
+def google_model(key="key-a"):
+    model = GoogleModel()
+    model._configured_key = key
+    return model
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+def test_registry_persistence_and_expiry(tmp_path):
+    path = str(tmp_path / "uploads.db")
+    registry = UploadRegistry(path=path, ttl=3600, expiry_margin=60)
+    registry.put("google:a", "d1", "video/mp4", "files/1", "uri-1")
+    registry.put("google:a", "d2", "video/mp4", "files/2", expires_at=time.time() + 30)
+    registry.close()
+
+    reopened = UploadRegistry(path=path)
+    entry = reopened.get("google:a", "d1", "video/mp4")
+    assert entry["name"] == "files/1" and entry["uri"] == "uri-1"
+    assert entry["expires_at"] == pytest.approx(time.time() + 3600 - 60, abs=5)
+    # 剩余时间小于 expiry_margin 的文件视为已过期
+    assert reopened.get("google:a", "d2", "video/mp4") is None
+    assert reopened.get("google:b", "d1", "video/mp4") is None
+    assert reopened.purge_expired() == 1
+    reopened.remove("google:a", "d1", "video/mp4")
+    assert reopened.get("google:a", "d1", "video/mp4") is None
+    assert reopened.stats()["hits"] == 1
+
+def test_default_registry_on_disk(tmp_path, monkeypatch):
+    path = tmp_path / "cache" / "schat" / "uploads.db"
+    monkeypatch.setitem(UPLOAD_REGISTRY, "path", str(path))
+    monkeypatch.setattr(registry_module, "_upload_registry", None)
+    registry = registry_module.get_upload_registry()
+    try:
+        # 缓存目录不存在时自动创建
+        assert registry.path == str(path) and path.exists()
+    finally:
+        registry.close()
+    # 无法写入时退回只使用内存
+    monkeypatch.setitem(UPLOAD_REGISTRY, "path", str(path / "not-a-dir" / "uploads.db"))
+    monkeypatch.setattr(registry_module, "_upload_registry", None)
+    with pytest.warns(UserWarning):
+        assert registry_module.get_upload_registry().path is None
+
+def test_default_path_in_user_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    config = runpy.run_path(config_module.__file__)
+    assert config["UPLOAD_REGISTRY"]["path"] == str(tmp_path / "schat" / "uploads.db")
+
+def test_scope_hides_key(tmp_path):
+    scope = upload_scope("google", "secret-key")
+    assert scope.startswith("google:") and "secret" not in scope
+    assert scope != upload_scope("google", "other-key")
+    assert file_digest(write(tmp_path, "a.txt", b"abc")) == file_digest(write(tmp_path, "b.txt", b"abc"))
+
+def test_concurrent_uploads_with_polling(tmp_path, registry, fake):
+    fake.delay = 0.05
+    fake.polls = 3
+    paths = [write(tmp_path, f"doc{i}.pdf", bytes([i]) * 100) for i in range(4)]
+    model = google_model()
+    messages = [Message(role="user", text="read these", files=paths[:2]),
+                Message(role="user", text="and these", files=paths[2:])]
+    converted = model._convert_messages(messages)
+    assert fake.max_concurrent > 1
+    assert len(fake.uploads) == 4
+    assert [part.state.name for part in converted[0]["parts"][1:]] == ["ACTIVE", "ACTIVE"]
+    assert registry.stats()["entries"] == 4
+
+def test_reuse_across_processes(tmp_path, registry, fake):
+    path = write(tmp_path, "video.mp4", b"video")
+    google_model()._upload_file(path, "video/mp4")
+    # 新的模型实例（相当于重启后的进程）按内容哈希复用，不重新上传
+    copy = write(tmp_path, "copy.mp4", b"video")
+    assert google_model()._upload_file(copy, "video/mp4").name == "files/0"
+    assert len(fake.uploads) == 1
+    # 其他API密钥看不到这个文件
+    google_model("key-b")._upload_file(path, "video/mp4")
+    assert len(fake.uploads) == 2
+
+def test_key_rotation_does_not_reuse_files(tmp_path, registry, fake):
+    path = write(tmp_path, "video.mp4", b"video")
+    message = Message(role="user", text="watch", files=[path])
+    model = google_model("key-a")
+    first = model._convert_messages([message])[0]["parts"][1]
+    assert model._convert_messages([message])[0]["parts"][1] is first
+    # 切换密钥后，进程内缓存和消息的转换缓存都不会用到旧密钥上传的文件
+    model._configured_key = "key-b"
+    second = model._convert_messages([message])[0]["parts"][1]
+    assert second.name == "files/1" and first.name == "files/0"
+    assert len(fake.uploads) == 2
+    # 切换回原来的密钥时继续使用它上传的文件
+    model._configured_key = "key-a"
+    assert model._convert_messages([message])[0]["parts"][1] is first
+    assert len(fake.uploads) == 2
+    model.remove_file_from_cache(path)
+    assert model._file_cache == {}
+
+def test_deleted_file_is_uploaded_again(tmp_path, registry, fake):
+    path = write(tmp_path, "video.mp4", b"video")
+    google_model()._upload_file(path, "video/mp4")
+    del fake.files["files/0"]
+    assert google_model()._upload_file(path, "video/mp4").name == "files/1"
+    assert registry.get(upload_scope("google", "key-a"), file_digest(path), "video/mp4")["name"] == "files/1"
+
+def test_processing_timeout_and_failure(tmp_path, registry, fake):
+    fake.polls = 10 ** 6
+    path = write(tmp_path, "video.mp4", b"video")
+    with pytest.raises(TimeoutError):
+        google_model()._upload_file(path, "video/mp4", deadline=time.monotonic() + 0.05)
+    # 轮询间隔按指数退避增加，不会每次都请求
+    assert len(fake.gets) < 15
+
+    fake.polls = 1
+    model = google_model()
+    file = fake.upload_file(path, "video/mp4")
+    fake.files[file.name] = "FAILED"
+    with pytest.raises(ValueError):
+        model._wait_for_file_active(file)
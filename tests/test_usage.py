@@ -0,0 +1,189 @@
+import asyncio
+from types import SimpleNamespace as NS
+import pytest
+from schat import ChatSession, Message
+from schat.core import usage as usage_module
+from schat.core.response_cache import ResponseCache
+from schat.core.usage import PriceTable, Usage, configure_usage_tracker
+from schat.models.anthropic import AnthropicModel
+from schat.models.google import GoogleModel
+from schat.models.factory import ModelFactory
+from schat.models.openai import OpenAIModel
+
+PRICES = {
+    "gpt-4o-mini": {"input": 1.0, "output": 2.0, "cache_read": 0.5},
+    "claude-3-5-haiku": {"input": 1.0, "output": 4.0, "cache_read": 0.1, "cache_write": 1.25},
+}
+
+@pytest.fixture(autouse=True)
+def tracker():
+    tracker = configure_usage_tracker(PRICES)
+    yield tracker
+    usage_module._tracker = None
+
+def openai_response(text, prompt, completion, cached=0):
+    return NS(
+        choices=[NS(message=NS(content=text, tool_calls=None))],
+        usage=NS(prompt_tokens=prompt, completion_tokens=completion,
+                 prompt_tokens_details=NS(cached_tokens=cached)),
+    )
+
+def openai_chunks(text, prompt, completion):
+    chunks = [NS(choices=[NS(delta=NS(content=c))], usage=None) for c in text]
+    chunks.append(NS(choices=[], usage=NS(prompt_tokens=prompt, completion_tokens=completion,
+                                          prompt_tokens_details=None)))
+    return chunks
+
+@pytest.fixture
+def openai_model(monkeypatch):
+    model = OpenAIModel()
+    model.set_api_key("sk-test-abcd1234")
+    model.set_model_config({"model": "gpt-4o-mini"})
+    requests = []
+
+    def send_llm(**kwargs):
+        requests.append(kwargs)
+        if kwargs["stream"]:
+            return iter(openai_chunks("hi!", 12, 3))
+        return openai_response("hello", 100, 20, cached=40)
+
+    async def achunks(chunks):
+        for chunk in chunks:
+            yield chunk
+
+    async def asend_llm(**kwargs):
+        response = send_llm(**kwargs)
+        return achunks(response) if kwargs["stream"] else response
+
+    monkeypatch.setattr(model, "_send_llm", send_llm)
+    monkeypatch.setattr(model, "_asend_llm", asend_llm)
+    model.requests = requests
+    return model
+
+def test_price_table():
+    table = PriceTable({"gpt-4o": {"input": 2.0, "output": 8.0}, "gpt-4o-mini": {"input": 1.0, "output": 2.0},
+                        "openrouter:gpt-4o": {"input": 3.0, "output": 9.0}})
+    # 最长前缀匹配带日期后缀的模型名
+    assert table.lookup("openai", "gpt-4o-mini-2024-07-18")["input"] == 1.0
+    assert table.lookup("openrouter", "gpt-4o")["input"] == 3.0
+    assert table.lookup("openai", "unknown") is None
+    usage = Usage(input_tokens=1_000_000, output_tokens=500_000, cache_read_tokens=400_000)
+    # 缓存读取没有单独价格时按输入价格计算
+    assert table.cost("openai", "gpt-4o", usage) == pytest.approx(2.0 + 4.0)
+    table.set_price("gpt-4o", input=2.0, output=8.0, cache_read=1.0)
+    assert table.cost("openai", "gpt-4o", usage) == pytest.approx(0.6 * 2.0 + 0.4 * 1.0 + 4.0)
+
+def test_openai_response_usage(openai_model, tracker):
+    message = openai_model.send([Message(role="user", text="hi")])
+    assert message.usage == Usage(100, 20, cache_read_tokens=40, provider="openai", model="gpt-4o-mini")
+    total = tracker.total()
+    assert total["requests"] == 1
+    assert total["cost"] == pytest.approx((60 * 1.0 + 40 * 0.5 + 20 * 2.0) / 1e6)
+    assert tracker.by_key() == {("openai", "...1234"): total}
+    assert list(tracker.by_model()) == [("openai", "gpt-4o-mini")]
+
+def test_openai_stream_usage(openai_model, tracker):
+    session = ChatSession(default_model=openai_model)
+    response = session.send("hi", stream=True)
+    assert openai_model.requests[-1]["stream_options"] == {"include_usage": True}
+    assert "".join(response) == "hi!"
+    assert response.usage.input_tokens == 12 and response.usage.output_tokens == 3
+    assert session.history[-1].usage is response.usage
+    assert tracker.total()["output_tokens"] == 3
+
+def test_openai_async_stream_usage(openai_model, tracker):
+    async def run():
+        response = await openai_model.asend([Message(role="user", text="hi")], stream=True)
+        return response, "".join([chunk async for chunk in response])
+    response, text = asyncio.run(run())
+    assert text == "hi!"
+    assert response.message.usage.total_tokens == 15
+    assert tracker.total()["requests"] == 1
+
+def test_stream_usage_disabled(openai_model, tracker, monkeypatch):
+    openai_model.stream_usage = False
+    requests = []
+    monkeypatch.setattr(openai_model, "_send_llm",
+                        lambda **kwargs: requests.append(kwargs) or iter(openai_chunks("ok", 0, 0)[:-1]))
+    response = openai_model.send([Message(role="user", text="hi")], stream=True)
+    assert "".join(response) == "ok"
+    assert "stream_options" not in requests[0]
+    assert response.message.usage is None
+    assert tracker.total()["requests"] == 0
+
+def test_stream_usage_only_for_official_endpoint():
+    def stream_options(model):
+        request = model._prepare_request_kwargs(messages=[Message(role="user", text="hi")], stream=True)
+        return request.get("stream_options")
+    model = OpenAIModel()
+    assert stream_options(model) == {"include_usage": True}
+    model.set_base_url("https://api.openai.com/v1")
+    assert stream_options(model) == {"include_usage": True}
+    # 兼容接口默认不发送，可以按provider或实例开启
+    model.set_base_url("http://localhost:8000/v1")
+    assert stream_options(model) is None
+    assert stream_options(OpenAIModel(stream_usage=True)) == {"include_usage": True}
+    assert stream_options(OpenAIModel(stream_usage=False)) is None
+    ModelFactory.register_provider("usage-compatible", base_url="http://localhost:8000/v1", stream_usage=True)
+    assert stream_options(ModelFactory.get_model("usage-compatible:m")) == {"include_usage": True}
+    assert ModelFactory.get_model("deepseek").stream_usage is True
+    assert ModelFactory.get_model("glm").stream_usage is None
+
+def test_anthropic_usage(tracker):
+    model = AnthropicModel()
+    model.set_api_key("test-key")
+    raw = NS(input_tokens=10, output_tokens=5, cache_read_input_tokens=200, cache_creation_input_tokens=30)
+    message = model._handle_response(NS(stop_reason="end_turn", content=[NS(type="text", text="ok")], usage=raw))
+    # input_tokens 换算为包含缓存读取和写入的口径
+    assert message.usage == Usage(240, 5, cache_read_tokens=200, cache_write_tokens=30)
+
+    events = [
+        NS(type="message_start", message=NS(usage=NS(input_tokens=10, output_tokens=1,
+                                                     cache_read_input_tokens=200, cache_creation_input_tokens=0))),
+        NS(type="content_block_delta", delta=NS(text="o")),
+        NS(type="content_block_delta", delta=NS(text="k")),
+        NS(type="message_delta", usage=NS(output_tokens=7)),
+    ]
+    model._send_llm = lambda **kwargs: iter(events)
+    response = model.send([Message(role="user", text="hi")], model="claude-3-5-haiku-20241022", stream=True)
+    assert "".join(response) == "ok"
+    assert response.message.usage == Usage(210, 7, cache_read_tokens=200, provider="anthropic",
+                                           model="claude-3-5-haiku-20241022")
+    assert tracker.total()["cost"] == pytest.approx((10 * 1.0 + 200 * 0.1 + 7 * 4.0) / 1e6)
+
+def test_google_usage():
+    model = GoogleModel()
+    metadata = NS(prompt_token_count=50, candidates_token_count=8, thoughts_token_count=4,
+                  cached_content_token_count=32)
+    response = NS(candidates=[NS(content=NS(parts=[NS(function_call=None)]))], text="ok", usage_metadata=metadata)
+    assert model._handle_response(response).usage == Usage(50, 12, cache_read_tokens=32)
+    assert model._chunk_usage(NS(text="o", usage_metadata=None)) is None
+
+def test_session_usage_persisted(openai_model, tmp_path):
+    session = ChatSession(default_model=openai_model)
+    session.send("one")
+    session.send("two")
+    report = session.get_usage()
+    assert report.total()["requests"] == 2
+    assert report.total()["input_tokens"] == 200
+    assert report.by_model()[("openai", "gpt-4o-mini")]["output_tokens"] == 40
+
+    path = str(tmp_path / "session.json")
+    session.save(path)
+    restored = ChatSession()
+    restored.load(path)
+    assert restored.history[-1].usage == session.history[-1].usage
+    assert restored.get_usage(PriceTable({})).total()["unpriced"] == 2
+
+def test_cache_hit_has_no_usage(openai_model, tracker):
+    openai_model.enable_response_cache(ResponseCache())
+    first = openai_model.send([Message(role="user", text="hi")], temperature=0)
+    second = openai_model.send([Message(role="user", text="hi")], temperature=0)
+    assert first.usage is not None
+    assert second.usage is None
+    assert tracker.total()["requests"] == 1
+
+def test_message_without_usage_roundtrip():
+    message = Message(role="assistant", text="hi")
+    assert "usage" not in message.to_dict()
+    assert Message.from_dict(message.to_dict()).usage is None